@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# parse time and peak memory of reading the scan status out of large checks responses:
+# json.loads of the whole body versus the streaming extractor in scripts/json_stream.py
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Tuple,
+)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+from json_stream import extract_paths  # noqa: E402 pylint: disable=wrong-import-position
+from constants import (  # noqa: E402 pylint: disable=wrong-import-position
+    JSON_STREAM_CHUNK_SIZE,
+    SCAN_STATUS_PATH,
+)
+
+
+def _build_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="json_extract",
+        description="Compare full json parsing with the streaming extractor on large checks responses",
+    )
+
+    parser.add_argument(
+        "--sizes",
+        default="1,10,50",
+        help="Comma-separated payload sizes in MB. Defaults to 1,10,50",
+    )
+
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=3,
+        help="Number of runs per case, the fastest is reported. Defaults to 3",
+    )
+
+    parser.add_argument(
+        "--json",
+        help="Also write the results as json to this file, for tracking them over time",
+    )
+
+    return parser
+
+
+def _payload(
+    size_mb: int,
+    status_first: bool,
+) -> bytes:
+    # a checks response with a long list of issues; the summary before or after that list
+    check = {
+        "id": "SQ30104",
+        "category": "vulnerabilities",
+        "description": 'Detected a component with a known "critical" vulnerability, see the CVE list',
+        "cves": ["CVE-2024-0001", "CVE-2024-0002", "CVE-2024-0003"],
+        "count": 12,
+        "ignored": False,
+    }
+    one = len(json.dumps(check)) + 2
+    checks = [check] * max(1, size_mb * 1024 * 1024 // one)
+    info = {
+        "summary": {"scan_status": "pass"},
+        "portal": {"reference": "org/group/pkg/1.0"},
+    }
+    report: Dict[str, Any] = {"info": info, "checks": checks} if status_first else {"checks": checks, "info": info}
+    return json.dumps({"analysis": {"report": report}}).encode("utf-8")
+
+
+def _chunks(
+    payload: bytes,
+) -> Iterator[bytes]:
+    # like response.iter_content(), the stream yields chunks that are not kept
+    for i in range(0, len(payload), JSON_STREAM_CHUNK_SIZE):
+        yield payload[i : i + JSON_STREAM_CHUNK_SIZE]
+
+
+def _full_parse(
+    payload: bytes,
+) -> Any:
+    return json.loads(payload).get("analysis", {}).get("report", {}).get("info", {}).get("summary", {})["scan_status"]
+
+
+def _streaming(
+    payload: bytes,
+) -> Any:
+    return extract_paths(_chunks(payload), {"scan_status": SCAN_STATUS_PATH})["scan_status"]
+
+
+def _measure(
+    parse: Callable[[bytes], Any],
+    payload: bytes,
+    runs: int,
+) -> Tuple[float, float]:
+    # fastest run in ms, then the peak memory in MB on top of the payload itself in a traced run
+    timings: List[float] = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        assert parse(payload) == "pass"
+        timings.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    parse(payload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak / 1024 / 1024
+
+
+def main() -> int:
+    args = _build_argument_parser().parse_args()
+
+    results: List[Dict[str, Any]] = []
+    for size_mb in [int(size) for size in args.sizes.split(",")]:
+        for status_first in [True, False]:
+            payload = _payload(size_mb, status_first)
+            for name, parse in [("json.loads", _full_parse), ("streaming", _streaming)]:
+                ms, peak_mb = _measure(parse, payload, args.runs)
+                where = "before" if status_first else "after"
+                results.append(
+                    {
+                        "size_mb": size_mb,
+                        "status": where,
+                        "parser": name,
+                        "time_ms": round(ms, 1),
+                        "peak_mb": round(peak_mb, 1),
+                    }
+                )
+                print(
+                    f"{size_mb:4} MB, status {where:6} the checks: {name:10} " f"{ms:9.1f} ms  peak {peak_mb:8.1f} MB"
+                )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "python": sys.version.split()[0],
+                    "runs": args.runs,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
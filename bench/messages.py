@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# cost of the reporter: TeamCity escaping (the former per-character dict lookup versus str.translate)
+# and lines per second of each message format written to a file, flushed per line or buffered (jsonl)
+import argparse
+import json
+import os
+import sys
+import tempfile
+import timeit
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+from cimessages import (  # noqa: E402 pylint: disable=wrong-import-position
+    MessageFormat,
+    Messages,
+    teamcity_escape,
+)
+
+MESSAGES: Dict[str, str] = {
+    "short": "Attempting to fetch analysis status",
+    "report url": "https://my.secure.software/org/group/pkg:rl/project/package@1.0?build=repro [main]",
+    "long": "Info: 'upload' |progress| [50%]\n" * 40,
+}
+
+
+def _escape_per_char(
+    m: str,
+) -> str:
+    # the implementation before str.translate, kept for the comparison
+    escape_map: Dict[str, str] = {
+        "'": "|'",
+        "|": "||",
+        "\n": "|n",
+        "\r": "|r",
+        "[": "|[",
+        "]": "|]",
+    }
+    return "".join(escape_map.get(x, x) for x in m)
+
+
+def _build_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="messages",
+        description="Measure TeamCity escaping and the output rate of the message formats",
+    )
+
+    parser.add_argument(
+        "--lines",
+        type=int,
+        default=100000,
+        help="Number of messages written per format. Defaults to 100000",
+    )
+
+    parser.add_argument(
+        "--json",
+        help="Also write the results as json to this file, for tracking them over time",
+    )
+
+    return parser
+
+
+def _per_call_us(
+    func: Callable[[], Any],
+) -> float:
+    # best of 5, in microseconds per call
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(5, number)) / number * 1e6
+
+
+def _lines_per_sec(
+    msg_format: MessageFormat,
+    lines: int,
+) -> float:
+    messages = Messages.create(msg_format.value)
+    stdout = sys.stdout
+    # a real file, writing to os.devnull makes the flush per line look free
+    with tempfile.TemporaryFile("w", encoding="utf-8") as output:
+        sys.stdout = output
+        try:
+            elapsed = timeit.timeit(lambda: messages.info(MESSAGES["short"]), number=lines)
+        finally:
+            sys.stdout = stdout
+    return lines / elapsed
+
+
+def main() -> int:
+    args = _build_argument_parser().parse_args()
+    results: List[Dict[str, Any]] = []
+
+    for name, msg in MESSAGES.items():
+        assert _escape_per_char(msg) == teamcity_escape(msg)
+        before = _per_call_us(lambda: _escape_per_char(msg))  # pylint: disable=cell-var-from-loop
+        after = _per_call_us(lambda: teamcity_escape(msg))  # pylint: disable=cell-var-from-loop
+        results.append({"case": f"escape {name}", "per_char_us": round(before, 3), "translate_us": round(after, 3)})
+        print(f"escape {name:12} per char {before:8.2f} us  translate {after:8.2f} us  ({before / after:5.1f}x)")
+
+    for msg_format in MessageFormat:
+        rate = _lines_per_sec(msg_format, args.lines)
+        results.append({"case": f"write {msg_format.value}", "lines_per_sec": round(rate)})
+        print(f"write {msg_format.value:13} {rate:12,.0f} lines/s")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
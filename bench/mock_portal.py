@@ -0,0 +1,618 @@
+#!/usr/bin/env python3
+# a local stand-in for the Portal public api endpoints that PortalAPI uses, for offline benchmarks:
+# scan, url-import, status, checks, report, pack/safe (with a range capable download link) and list.
+# Latency, bandwidth, error injection, a rate limit and the analysis duration are configurable.
+import argparse
+import json
+import math
+import os
+import random
+import re
+import ssl
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from email.utils import formatdate
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+from urllib.parse import (
+    parse_qs,
+    urlsplit,
+)
+
+API_PREFIX = "/api/public/v1/"
+DOWNLOAD_PATH = "/download/"
+STATS_PATH = "/__stats"
+BLOCK_SIZE = 64 * 1024
+
+
+def _build_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="mock_portal",
+        description="Serve a local mock of the Portal public api over https",
+    )
+
+    parser.add_argument(
+        "--listen",
+        default="127.0.0.1:8443",
+        help="Address and port to listen on. Defaults to 127.0.0.1:8443",
+    )
+
+    parser.add_argument(
+        "--tls-dir",
+        default=os.path.join("tmp", "mock-portal"),
+        help="Directory with cert.pem and key.pem, a self-signed pair for 127.0.0.1 and localhost is created "
+        "when missing; point REQUESTS_CA_BUNDLE at the cert.pem. Defaults to tmp/mock-portal",
+    )
+
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        default=0.0,
+        help="Delay before every response, in milliseconds",
+    )
+
+    parser.add_argument(
+        "--bandwidth",
+        type=float,
+        default=0.0,
+        help="Limit every connection to this many MB/s in both directions. By default not limited",
+    )
+
+    parser.add_argument(
+        "--analysis-sec",
+        type=float,
+        default=5.0,
+        help="Time from the end of an upload (or url import) until the analysis is done. Defaults to 5",
+    )
+
+    parser.add_argument(
+        "--scan-status",
+        choices=["pass", "fail"],
+        default="pass",
+        help="Scan status of every analysis. Defaults to pass",
+    )
+
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of GET requests answered with one of the --error-codes",
+    )
+
+    parser.add_argument(
+        "--error-codes",
+        default="429,503",
+        help="Comma-separated status codes for injected errors. Defaults to 429,503",
+    )
+
+    parser.add_argument(
+        "--retry-after",
+        type=int,
+        default=1,
+        help="Retry-After seconds on injected 429/503 and on pending (202) status responses. Defaults to 1",
+    )
+
+    parser.add_argument(
+        "--rate-limit",
+        type=int,
+        default=0,
+        help="Api requests per second for the whole tenant, announced with X-RateLimit headers, "
+        + "further requests are answered with 429. By default there is no limit",
+    )
+
+    parser.add_argument(
+        "--upload-errors",
+        type=int,
+        default=0,
+        help="Answer this many uploads with 503 after the body was received",
+    )
+
+    parser.add_argument(
+        "--upload-errors-stored",
+        action="store_true",
+        help="Create the version before answering an --upload-errors upload with 503, like a gateway that times "
+        "out after the Portal took the upload",
+    )
+
+    parser.add_argument(
+        "--download-mode",
+        choices=["ranges", "no-range", "bad-etag"],
+        default="ranges",
+        help="How the rl-safe download link behaves: byte ranges, no range support (always the whole file) or "
+        "byte ranges with an md5 ETag that does not match the content. Defaults to ranges",
+    )
+
+    parser.add_argument(
+        "--download-errors",
+        type=int,
+        default=0,
+        help="Drop the connection halfway through this many byte range responses of the download link",
+    )
+
+    parser.add_argument(
+        "--report-size-mb",
+        type=float,
+        default=10.0,
+        help="Size of each exported report. Defaults to 10",
+    )
+
+    parser.add_argument(
+        "--checks-size-mb",
+        type=float,
+        default=1.0,
+        help="Size of the checks response. Defaults to 1",
+    )
+
+    parser.add_argument(
+        "--safe-size-mb",
+        type=float,
+        default=50.0,
+        help="Size of the rl-safe archive. Defaults to 50",
+    )
+
+    parser.add_argument(
+        "--page-size",
+        type=int,
+        default=100,
+        help="Versions per page of the version list, further pages are linked with a Link header",
+    )
+
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="Seed for the error injection, for reproducible runs",
+    )
+
+    return parser
+
+
+def ensure_certificate(
+    tls_dir: str,
+) -> Tuple[str, str]:
+    cert_path = os.path.join(tls_dir, "cert.pem")
+    key_path = os.path.join(tls_dir, "key.pem")
+    if not (os.path.exists(cert_path) and os.path.exists(key_path)):
+        os.makedirs(tls_dir, exist_ok=True)
+        subprocess.run(
+            [
+                "openssl",
+                "req",
+                "-x509",
+                "-newkey",
+                "rsa:2048",
+                "-nodes",
+                "-days",
+                "30",
+                "-subj",
+                "/CN=127.0.0.1",
+                "-addext",
+                "subjectAltName=IP:127.0.0.1,DNS:localhost",
+                "-keyout",
+                key_path,
+                "-out",
+                cert_path,
+            ],
+            check=True,
+            capture_output=True,
+        )
+    return cert_path, key_path
+
+
+class MockPortal:
+    # the state shared by all connections: versions with the time their analysis is done, and counters
+    def __init__(
+        self,
+        args: argparse.Namespace,
+    ) -> None:
+        self.args = args
+        self.lock = threading.Lock()
+        self.random = random.Random(args.seed)
+        self.error_codes: List[int] = [int(code) for code in args.error_codes.split(",")]
+        self.upload_errors: int = args.upload_errors
+        self.download_errors: int = args.download_errors
+        self.versions: Dict[str, float] = {}  # purl path -> analysis done at
+        self.window_started: float = 0.0
+        self.window_used: int = 0
+        self.stats: Counter[str] = Counter()
+        self.started: str = formatdate(time.time(), usegmt=True)  # Last-Modified of every report
+
+        checks_padding = {"id": "SQ00000", "description": "x" * 200}
+        self.checks_count = max(1, int(args.checks_size_mb * 1024 * 1024) // (len(json.dumps(checks_padding)) + 2))
+        self.checks_item = checks_padding
+
+    def count(
+        self,
+        **amounts: int,
+    ) -> None:
+        with self.lock:
+            self.stats.update(amounts)
+
+    def inject_error(
+        self,
+    ) -> Optional[int]:
+        with self.lock:
+            if self.args.error_rate and self.random.random() < self.args.error_rate:
+                return self.random.choice(self.error_codes)
+        return None
+
+    def rate_limit(
+        self,
+    ) -> Tuple[bool, Dict[str, str]]:
+        # fixed one second windows for the tenant, as many api gateways count them
+        limit = self.args.rate_limit
+        if not limit:
+            return True, {}
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_started >= 1.0:
+                self.window_started = now
+                self.window_used = 0
+            self.window_used += 1
+            used = self.window_used
+            reset = math.ceil(1.0 - (now - self.window_started))
+        return used <= limit, {
+            "X-RateLimit-Limit": str(limit),
+            "X-RateLimit-Remaining": str(max(limit - used, 0)),
+            "X-RateLimit-Reset": str(reset),
+        }
+
+    def take_upload_error(
+        self,
+    ) -> bool:
+        with self.lock:
+            if self.upload_errors > 0:
+                self.upload_errors -= 1
+                return True
+        return False
+
+    def take_download_error(
+        self,
+    ) -> bool:
+        with self.lock:
+            if self.download_errors > 0:
+                self.download_errors -= 1
+                return True
+        return False
+
+    def add_version(
+        self,
+        purl: str,
+    ) -> None:
+        with self.lock:
+            self.versions[purl] = time.monotonic() + self.args.analysis_sec
+
+    def analysis_done(
+        self,
+        purl: str,
+    ) -> Optional[bool]:
+        # None: unknown version
+        with self.lock:
+            done_at = self.versions.get(purl)
+        return None if done_at is None else time.monotonic() >= done_at
+
+    def package_versions(
+        self,
+        package: str,
+    ) -> List[str]:
+        with self.lock:
+            return sorted(p.split("@", 1)[1] for p in self.versions if p.split("@", 1)[0] == package and "@" in p)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    portal: MockPortal
+    rate_limit_headers: Dict[str, str] = {}
+
+    def log_message(
+        self,
+        format: str,  # pylint: disable=redefined-builtin
+        *args: Any,
+    ) -> None:
+        pass
+
+    def _pace(
+        self,
+        started: float,
+        amount: int,
+    ) -> None:
+        bandwidth = self.portal.args.bandwidth
+        if bandwidth:
+            ahead = amount / (bandwidth * 1024 * 1024) - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+    def _send(
+        self,
+        status: int,
+        body: Any = b"",
+        headers: Optional[Dict[str, str]] = None,
+        size: Optional[int] = None,
+        offset: int = 0,
+        cut_at: Optional[int] = None,
+    ) -> None:
+        # body is json, bytes, or (with size) generated content from offset on; with cut_at the connection
+        # is closed after that many bytes, like a dropped connection
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode("utf-8")
+        length = size if size is not None else len(body)
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json" if size is None else "application/octet-stream")
+        self.send_header("Content-Length", str(length))
+        for key, value in (self.rate_limit_headers | (headers or {})).items():
+            self.send_header(key, value)
+        self.end_headers()
+
+        started = time.monotonic()
+        sent = 0
+        if cut_at is not None:
+            self.close_connection = True
+            length = min(length, cut_at)
+        while sent < length:
+            n = min(BLOCK_SIZE, length - sent)
+            block = body[sent : sent + n] if size is None else _content(offset + sent, n)
+            self.wfile.write(block)
+            sent += n
+            self._pace(started, sent)
+        self.portal.count(bytes_out=length)
+
+    def _read_body(
+        self,
+    ) -> int:
+        started = time.monotonic()
+        received = 0
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                n = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if n == 0:
+                    self.rfile.readline()
+                    break
+                while n > 0:
+                    block = self.rfile.read(min(BLOCK_SIZE, n))
+                    n -= len(block)
+                    received += len(block)
+                    self._pace(started, received)
+                self.rfile.readline()
+        else:
+            length = int(self.headers.get("Content-Length") or 0)
+            while received < length:
+                block = self.rfile.read(min(BLOCK_SIZE, length - received))
+                if not block:
+                    break
+                received += len(block)
+                self._pace(started, received)
+        self.portal.count(bytes_in=received)
+        return received
+
+    def _route(
+        self,
+    ) -> Tuple[str, str]:
+        # /api/public/v1/<what>/<org>/<group>/<path> -> (what, path); "pack/safe" and "report" have a slash
+        path = urlsplit(self.path).path
+        if not path.startswith(API_PREFIX):
+            return "", path
+        rest = path[len(API_PREFIX) :]
+        match = re.match(r"(pack/safe|[a-z-]+)/[^/]+/[^/]+/(.*)", rest)
+        if match is None:
+            return "", path
+        return match.group(1), match.group(2)
+
+    def _before(
+        self,
+        what: str,
+    ) -> bool:
+        self.portal.count(requests=1, **{f"requests_{what or 'other'}": 1})
+        if self.portal.args.latency_ms:
+            time.sleep(self.portal.args.latency_ms / 1000)
+        self.rate_limit_headers = {}
+        if what and what != "download":
+            allowed, self.rate_limit_headers = self.portal.rate_limit()
+            if not allowed:
+                self.portal.count(rate_limited=1)
+                self._send(
+                    429, {"error": "rate limit exceeded"}, {"Retry-After": self.rate_limit_headers["X-RateLimit-Reset"]}
+                )
+                return False
+        if self.command == "GET" and what:
+            status = self.portal.inject_error()
+            if status is not None:
+                self.portal.count(injected_errors=1)
+                self._send(status, {"error": "injected"}, {"Retry-After": str(self.portal.args.retry_after)})
+                return False
+        return True
+
+    def do_POST(
+        self,
+    ) -> None:  # pylint: disable=invalid-name
+        what, purl = self._route()
+        received = self._read_body()
+        if not self._before(what):
+            return
+        if what not in ["scan", "url-import"]:
+            self._send(404, {"error": "not found"})
+            return
+
+        if what == "scan" and self.portal.take_upload_error():
+            self.portal.count(injected_errors=1)
+            if self.portal.args.upload_errors_stored:
+                self.portal.add_version(purl)
+            self._send(503, {"error": "injected"})
+            return
+
+        self.portal.add_version(purl)
+        self._send(200, {"purl": purl, "bytes": received})
+
+    def _analysis(
+        self,
+        purl: str,
+        with_checks: bool,
+    ) -> None:
+        done = self.portal.analysis_done(purl)
+        if done is None:
+            self._send(404, {"error": "version not found"})
+            return
+        if not done:
+            self._send(202, {"status": "in progress"}, {"Retry-After": str(self.portal.args.retry_after)})
+            return
+
+        report: Dict[str, Any] = {
+            "info": {
+                "summary": {"scan_status": self.portal.args.scan_status},
+                "portal": {"reference": f"mock/org/group/{purl}"},
+            },
+        }
+        if with_checks:
+            # the bulky part after the status, like the real checks response
+            report = {"checks": [self.portal.checks_item] * self.portal.checks_count} | report
+        self._send(200, {"analysis": {"report": report}})
+
+    def _report(
+        self,
+    ) -> None:
+        # the report content only depends on its size, conditional requests get a 304 while it is unchanged
+        size = int(self.portal.args.report_size_mb * 1024 * 1024)
+        headers = {"ETag": f'"mock-report-{size}"', "Last-Modified": self.portal.started}
+        # If-None-Match takes precedence over If-Modified-Since
+        if "If-None-Match" in self.headers:
+            not_modified = self.headers["If-None-Match"] == headers["ETag"]
+        else:
+            not_modified = self.headers.get("If-Modified-Since") == headers["Last-Modified"]
+        if not_modified:
+            self.portal.count(not_modified=1)
+            self._send(304, headers=headers)
+            return
+        self._send(200, size=size, headers=headers)
+
+    def _download(
+        self,
+        path: str,
+    ) -> None:
+        size = int(self.portal.args.safe_size_mb * 1024 * 1024)
+        mode = self.portal.args.download_mode
+        # a plain ETag of 32 hex digits is taken as the md5 of the content
+        etag = f'"{"0" * 32}"' if mode == "bad-etag" else f'"mock-{size}"'
+        match = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+        if mode == "no-range":
+            self._send(200, size=size, headers={"ETag": etag})
+            return
+        if match is None or self.headers.get("If-Range", etag) != etag:
+            self._send(200, size=size, headers={"ETag": etag, "Accept-Ranges": "bytes"})
+            return
+
+        start = int(match.group(1))
+        end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+        if start >= size:
+            self._send(416, headers={"Content-Range": f"bytes */{size}"})
+            return
+        length = end - start + 1
+        # the one byte probe is never cut off
+        cut_at = None
+        if length > 1 and self.portal.take_download_error():
+            self.portal.count(injected_errors=1)
+            cut_at = length // 2
+        self._send(
+            206,
+            size=length,
+            offset=start,
+            headers={"ETag": etag, "Accept-Ranges": "bytes", "Content-Range": f"bytes {start}-{end}/{size}"},
+            cut_at=cut_at,
+        )
+        if cut_at is None and length > 1:
+            self.portal.count(ranges_done=1)
+
+    def do_GET(
+        self,
+    ) -> None:  # pylint: disable=invalid-name
+        what, purl = self._route()
+        if purl == STATS_PATH:
+            with self.portal.lock:
+                stats = dict(self.portal.stats)
+            self._send(200, stats)
+            return
+        if not self._before(what or ("download" if purl.startswith(DOWNLOAD_PATH) else "")):
+            return
+
+        if what in ["status", "checks"]:
+            self._analysis(purl, with_checks=what == "checks")
+        elif what == "report":
+            _, _, version_purl = purl.partition("/")
+            if self.portal.analysis_done(version_purl) is None:
+                self._send(404, {"error": "version not found"})
+                return
+            self._report()
+        elif what == "pack/safe":
+            host = self.headers.get("Host", "127.0.0.1")
+            self._send(200, {"file_name": "report.rl-safe", "download_link": f"https://{host}{DOWNLOAD_PATH}{purl}"})
+        elif what == "list":
+            self._list(purl)
+        elif purl.startswith(DOWNLOAD_PATH):
+            self._download(purl)
+        else:
+            self._send(404, {"error": "not found"})
+
+    def _list(
+        self,
+        package: str,
+    ) -> None:
+        versions = self.portal.package_versions(package)
+        if not versions:
+            self._send(404, {"error": "package not found"})
+            return
+
+        page_size = self.portal.args.page_size
+        page = int(parse_qs(urlsplit(self.path).query).get("page", ["1"])[0])
+        chunk = versions[(page - 1) * page_size : page * page_size]
+        headers = {}
+        if page * page_size < len(versions):
+            headers["Link"] = f'<{urlsplit(self.path).path}?page={page + 1}>; rel="next"'
+        self._send(200, {"versions": [{"version": v} for v in chunk]}, headers)
+
+
+def _content(
+    offset: int,
+    size: int,
+) -> bytes:
+    # deterministic content that depends on the offset, so ranges put together in the wrong place show
+    start = offset % 251
+    pattern = bytes(range(251)) * (size // 251 + 2)
+    return pattern[start : start + size]
+
+
+def main() -> int:
+    args = _build_argument_parser().parse_args()
+    host, port = args.listen.rsplit(":", 1)
+    cert_path, key_path = ensure_certificate(args.tls_dir)
+
+    Handler.portal = MockPortal(args)
+    ThreadingHTTPServer.request_queue_size = 128
+    server = ThreadingHTTPServer((host, int(port)), Handler)
+    server.daemon_threads = True
+
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_path, key_path)
+    # the handshake happens in the connection's thread, not in the accept loop
+    server.socket = context.wrap_socket(server.socket, server_side=True, do_handshake_on_connect=False)
+
+    print(f"mock portal on https://{args.listen}, ca bundle {cert_path}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# end-to-end rl-scan runs against the local mock portal (bench/mock_portal.py): upload throughput, polling
+# overhead, export time and peak memory per scenario, from the --metrics-file of each run
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import (
+    Any,
+    Dict,
+    List,
+    Tuple,
+)
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# name -> mock portal options; every scenario uploads the same artifact and exports the same reports
+SCENARIOS: Dict[str, List[str]] = {
+    "baseline": [],
+    "latency-50ms": ["--latency-ms", "50"],
+    "bandwidth-50MBps": ["--bandwidth", "50"],
+    "errors-10pct": ["--error-rate", "0.1", "--seed", "1"],
+    "rate-limit-5rps": ["--rate-limit", "5"],
+}
+
+
+def _build_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="scan_e2e",
+        description="Benchmark complete rl-scan runs against a local mock of the Portal api",
+    )
+
+    parser.add_argument(
+        "--scripts",
+        default=os.path.join(BENCH_DIR, "..", "scripts"),
+        help="Directory with the commands. Defaults to ../scripts",
+    )
+
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        help=f"Comma-separated scenarios to run. Defaults to all: {', '.join(SCENARIOS)}",
+    )
+
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=3,
+        help="Number of runs per scenario, the median is reported. Defaults to 3",
+    )
+
+    parser.add_argument(
+        "--artifact-mb",
+        type=int,
+        default=200,
+        help="Size of the uploaded artifact in MB. Defaults to 200",
+    )
+
+    parser.add_argument(
+        "--analysis-sec",
+        type=float,
+        default=5.0,
+        help="Analysis duration of the mock portal. Defaults to 5",
+    )
+
+    parser.add_argument(
+        "--report-formats",
+        default="cyclonedx,sarif,rl-json",
+        help="Reports exported by each run. Defaults to cyclonedx,sarif,rl-json",
+    )
+
+    parser.add_argument(
+        "--report-size-mb",
+        default="20",
+        help="Size of each report served by the mock portal. Defaults to 20",
+    )
+
+    parser.add_argument(
+        "--safe-size-mb",
+        default="100",
+        help="Size of the rl-safe archive served by the mock portal, 0 to skip --pack-safe. Defaults to 100",
+    )
+
+    parser.add_argument(
+        "--json",
+        help="Also write the results as json to this file, for comparing versions",
+    )
+
+    return parser
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return int(s.getsockname()[1])
+
+
+def _start_mock(
+    args: argparse.Namespace,
+    workdir: str,
+    options: List[str],
+) -> Tuple["subprocess.Popen[bytes]", int, str]:
+    port = _free_port()
+    tls_dir = os.path.join(workdir, "tls")
+    mock = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(BENCH_DIR, "mock_portal.py"),
+            "--listen",
+            f"127.0.0.1:{port}",
+            "--tls-dir",
+            tls_dir,
+            "--analysis-sec",
+            str(args.analysis_sec),
+            "--report-size-mb",
+            args.report_size_mb,
+            "--safe-size-mb",
+            args.safe_size_mb,
+        ]
+        + options,
+        stdout=subprocess.DEVNULL,
+    )
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return mock, port, os.path.join(tls_dir, "cert.pem")
+        except OSError:
+            time.sleep(0.1)
+    mock.kill()
+    raise RuntimeError("The mock portal did not start")
+
+
+def _run_scan(
+    args: argparse.Namespace,
+    workdir: str,
+    artifact: str,
+    port: int,
+    cert: str,
+    run: int,
+) -> Dict[str, Any]:
+    report_path = tempfile.mkdtemp(dir=workdir)
+    metrics_file = os.path.join(workdir, f"metrics-{run}.json")
+    argv = [
+        sys.executable,
+        os.path.join(args.scripts, "rl-scan"),
+        "--rl-portal-host",
+        f"127.0.0.1:{port}",
+        "--rl-portal-org",
+        "bench",
+        "--rl-portal-group",
+        "bench",
+        "--purl",
+        f"bench/artifact@{run}",
+        "--file-path",
+        artifact,
+        "--report-path",
+        report_path,
+        "--report-format",
+        args.report_formats,
+        "--metrics-file",
+        metrics_file,
+    ]
+    if float(args.safe_size_mb) > 0:
+        argv.append("--pack-safe")
+
+    env = os.environ | {"REQUESTS_CA_BUNDLE": cert, "RLPORTAL_ACCESS_TOKEN": "bench"}
+    process = subprocess.Popen(argv, env=env, stdout=subprocess.DEVNULL)
+    # the resource usage of exactly this child, for its peak rss
+    _, status, usage = os.wait4(process.pid, 0)
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError(f"rl-scan exited with {os.waitstatus_to_exitcode(status)}")
+
+    with open(metrics_file, "r", encoding="utf-8") as f:
+        metrics = json.load(f)
+    phases = metrics["phases"]
+    upload_sec = phases["scanning_version"]["duration_sec"]
+    size_mb = os.path.getsize(artifact) / 1024 / 1024
+
+    return {
+        "upload_mb_per_sec": size_mb / max(upload_sec, 1e-6),
+        # how long after the end of the analysis the result was known
+        "polling_overhead_sec": phases["fetching_analysis_status"]["duration_sec"] - args.analysis_sec,
+        "status_requests": phases["fetching_analysis_status"]["http_calls"],
+        "export_sec": phases.get("exporting_analysis_report", {}).get("duration_sec", 0.0),
+        "pack_safe_sec": phases.get("exporting_rl_safe_archive", {}).get("duration_sec", 0.0),
+        "peak_rss_mb": usage.ru_maxrss / 1024,  # KiB on linux
+        "wall_sec": metrics["duration_sec"],
+        "http_calls": metrics["totals"]["http_calls"],
+        "http_retries": metrics["totals"]["http_retries"],
+    }
+
+
+def _create_artifact(
+    path: str,
+    size_mb: int,
+) -> None:
+    block = os.urandom(1024 * 1024)
+    with open(path, "wb") as f:
+        for _ in range(size_mb):
+            f.write(block)
+
+
+def main() -> int:
+    args = _build_argument_parser().parse_args()
+
+    results: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory(prefix="rl-bench-") as workdir:
+        artifact = os.path.join(workdir, "artifact.bin")
+        _create_artifact(artifact, args.artifact_mb)
+
+        for scenario in args.scenarios.split(","):
+            mock, port, cert = _start_mock(args, workdir, SCENARIOS[scenario])
+            try:
+                runs = [_run_scan(args, workdir, artifact, port, cert, run) for run in range(args.runs)]
+            finally:
+                mock.terminate()
+                mock.wait()
+
+            result: Dict[str, Any] = {"scenario": scenario}
+            for key in runs[0]:
+                result[key] = round(statistics.median(run[key] for run in runs), 3)
+            results.append(result)
+            print(
+                f"{scenario:18} upload {result['upload_mb_per_sec']:8.1f} MB/s  "
+                f"polling +{result['polling_overhead_sec']:6.2f} s ({result['status_requests']:.0f} requests)  "
+                f"export {result['export_sec']:6.2f} s  rl-safe {result['pack_safe_sec']:6.2f} s  "
+                f"peak rss {result['peak_rss_mb']:6.1f} MB  total {result['wall_sec']:6.2f} s"
+            )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "python": sys.version.split()[0],
+                    "runs": args.runs,
+                    "artifact_mb": args.artifact_mb,
+                    "analysis_sec": args.analysis_sec,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
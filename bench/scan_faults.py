@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# failure scenarios of complete rl-scan runs against the local mock portal (bench/mock_portal.py): each scenario
+# injects a fault and checks the outcome from the exit code, the counters of the mock portal and the files in the
+# report path. Exits with 1 when a scenario does not behave as expected
+import argparse
+import json
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import (
+    Any,
+    Dict,
+    List,
+    Tuple,
+)
+
+from mock_portal import _content
+from scan_e2e import (
+    _create_artifact,
+    _start_mock,
+)
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# name -> mock portal options, extra rl-scan arguments ({workdir} is the directory of the scenario), the mock
+# portal counters, exit code and files in the report path expected after the run. With interrupt, rl-scan is
+# killed once a mock portal counter reached the given count, then run again with the same arguments after the
+# files in remove were deleted from the report path
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    # a 503 after the body was received and the version was not created: the upload is sent again
+    "upload-retry": {
+        "mock": ["--upload-errors", "1"],
+        "scan": ["--resumable-upload"],
+        "expect": {"requests_scan": 2, "injected_errors": 1},
+    },
+    # a 503 after the Portal created the version: the version list shows it, the upload is not repeated
+    "upload-received": {
+        "mock": ["--upload-errors", "1", "--upload-errors-stored"],
+        "scan": ["--resumable-upload"],
+        "expect": {"requests_scan": 1, "injected_errors": 1},
+    },
+    # two of the three byte ranges of the rl-safe archive are cut off halfway, each continues where it stopped
+    "download-flaky": {
+        "mock": ["--safe-size-mb", "40", "--download-errors", "2"],
+        "scan": ["--pack-safe"],
+        "expect": {"injected_errors": 2, "ranges_done": 3},
+        "files": {"report.rl-safe": True},
+    },
+    # an md5 ETag that does not match: the archive does not appear and nothing is kept to resume
+    "download-bad-etag": {
+        "mock": ["--safe-size-mb", "40", "--download-mode", "bad-etag"],
+        "scan": ["--pack-safe"],
+        "exit_code": 101,
+        "files": {
+            "report.rl-safe": False,
+            ".report.rl-safe.rl-download.part": False,
+            ".report.rl-safe.rl-download.json": False,
+        },
+    },
+    # a download server without range support: one plain download
+    "download-no-range": {
+        "mock": ["--safe-size-mb", "40", "--download-mode", "no-range"],
+        "scan": ["--pack-safe"],
+        "expect": {"ranges_done": 0},
+        "files": {"report.rl-safe": True},
+    },
+    # killed after the first of three ranges arrived, after the sarif report was exported: the rerun takes the
+    # verdict from the scan cache and downloads only the two missing ranges into the same report path
+    "download-resume": {
+        "mock": ["--safe-size-mb", "40", "--bandwidth", "4"],
+        "scan": ["--pack-safe", "--cache-dir", "{workdir}/cache"],
+        "interrupt": {"stat": "ranges_done", "count": 1},
+        "expect": {"requests_scan": 1, "ranges_done": 3},
+        "files": {"report.rl-safe": True, "report.sarif.json": True},
+    },
+    # as download-resume, but the partial file is gone before the rerun: the parts recorded in the state are not
+    # trusted, all three ranges are downloaded again instead of publishing an archive with a zero filled range
+    "download-lost-part": {
+        "mock": ["--safe-size-mb", "40", "--bandwidth", "4"],
+        "scan": ["--pack-safe", "--cache-dir", "{workdir}/cache"],
+        "interrupt": {"stat": "ranges_done", "count": 1, "remove": [".report.rl-safe.rl-download.part"]},
+        "expect": {"requests_scan": 1, "ranges_done": 4},
+        "files": {"report.rl-safe": True},
+    },
+    # killed while polling for the verdict, after the digests were written to the report path: the rerun finds the
+    # submitted job in the journal and continues with the polling, without a second upload
+    "journal-resume": {
+        "mock": ["--analysis-sec", "5"],
+        "scan": ["--digests", "--journal-dir", "{workdir}/journal"],
+        "interrupt": {"stat": "requests_status", "count": 1},
+        "expect": {"requests_scan": 1},
+        "files": {"artifact.digests.json": True, "report.sarif.json": True},
+    },
+}
+
+
+def _build_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="scan_faults",
+        description="Run rl-scan against a local mock of the Portal api that injects faults, and check the outcome",
+    )
+
+    parser.add_argument(
+        "--scripts",
+        default=os.path.join(BENCH_DIR, "..", "scripts"),
+        help="Directory with the commands. Defaults to ../scripts",
+    )
+
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        help=f"Comma-separated scenarios to run. Defaults to all: {', '.join(SCENARIOS)}",
+    )
+
+    parser.add_argument(
+        "--artifact-mb",
+        type=int,
+        default=20,
+        help="Size of the uploaded artifact in MB. Defaults to 20",
+    )
+
+    parser.add_argument(
+        "--json",
+        help="Also write the results as json to this file",
+    )
+
+    return parser
+
+
+def _mock_args() -> argparse.Namespace:
+    # the options _start_mock expects, small reports and a short analysis keep the scenarios quick
+    return argparse.Namespace(
+        analysis_sec=1.0,
+        report_size_mb="1",
+        safe_size_mb="0",
+    )
+
+
+def _stats(
+    port: int,
+    cert: str,
+) -> Dict[str, int]:
+    with urllib.request.urlopen(
+        f"https://127.0.0.1:{port}/__stats",
+        context=ssl.create_default_context(cafile=cert),
+    ) as response:
+        stats: Dict[str, int] = json.load(response)
+    return stats
+
+
+def _scan_argv(
+    args: argparse.Namespace,
+    scenario: Dict[str, Any],
+    artifact: str,
+    workdir: str,
+    port: int,
+) -> List[str]:
+    return [
+        sys.executable,
+        os.path.join(args.scripts, "rl-scan"),
+        "--rl-portal-host",
+        f"127.0.0.1:{port}",
+        "--rl-portal-org",
+        "bench",
+        "--rl-portal-group",
+        "bench",
+        "--purl",
+        "bench/artifact@1",
+        "--file-path",
+        artifact,
+        "--report-path",
+        os.path.join(workdir, "reports"),
+        "--report-format",
+        "sarif",
+    ] + [arg.format(workdir=workdir) for arg in scenario.get("scan", [])]
+
+
+def _scan(
+    args: argparse.Namespace,
+    scenario: Dict[str, Any],
+    artifact: str,
+    workdir: str,
+    port: int,
+    cert: str,
+) -> Tuple[int, List[str]]:
+    argv = _scan_argv(args, scenario, artifact, workdir, port)
+    # the upload state and other temp files of each scenario are kept apart
+    env = os.environ | {"REQUESTS_CA_BUNDLE": cert, "RLPORTAL_ACCESS_TOKEN": "bench", "TMPDIR": workdir}
+
+    failures: List[str] = []
+    interrupt = scenario.get("interrupt")
+    if interrupt:
+        with subprocess.Popen(argv, env=env, stdout=subprocess.DEVNULL) as process:
+            while process.poll() is None and _stats(port, cert).get(interrupt["stat"], 0) < interrupt["count"]:
+                time.sleep(0.1)
+            if process.poll() is None:
+                # time for rl-scan to record what just arrived
+                time.sleep(0.5)
+                process.kill()
+            else:
+                failures.append(f"finished before {interrupt['stat']} reached {interrupt['count']}")
+        for name in interrupt.get("remove", []):
+            path = os.path.join(workdir, "reports", name)
+            if os.path.exists(path):
+                os.unlink(path)
+
+    exit_code = subprocess.run(argv, env=env, stdout=subprocess.DEVNULL, check=False).returncode
+    return exit_code, failures
+
+
+def _check_files(
+    scenario: Dict[str, Any],
+    report_path: str,
+) -> List[str]:
+    failures: List[str] = []
+    for name, expected in scenario.get("files", {}).items():
+        path = os.path.join(report_path, name)
+        if os.path.exists(path) != expected:
+            failures.append(f"{name} {'missing' if expected else 'left behind'}")
+        elif expected and name == "report.rl-safe":
+            # ranges written at the wrong offset show in the content, not in the size
+            size = os.path.getsize(path)
+            with open(path, "rb") as f:
+                if f.read() != _content(0, size):
+                    failures.append(f"{name} content differs from the download")
+    return failures
+
+
+def _run_scenario(
+    args: argparse.Namespace,
+    workdir: str,
+    artifact: str,
+    name: str,
+) -> Dict[str, Any]:
+    scenario = SCENARIOS[name]
+    scenario_dir = tempfile.mkdtemp(prefix=f"{name}-", dir=workdir)
+    os.makedirs(os.path.join(scenario_dir, "reports"))
+    mock, port, cert = _start_mock(_mock_args(), workdir, scenario.get("mock", []))
+    try:
+        started = time.monotonic()
+        exit_code, failures = _scan(args, scenario, artifact, scenario_dir, port, cert)
+        stats = _stats(port, cert)
+    finally:
+        mock.terminate()
+        mock.wait()
+
+    if exit_code != scenario.get("exit_code", 0):
+        failures.append(f"exit code {exit_code}")
+    failures += _check_files(scenario, os.path.join(scenario_dir, "reports"))
+    for key, expected in scenario.get("expect", {}).items():
+        if stats.get(key, 0) != expected:
+            failures.append(f"{key} {stats.get(key, 0)}, expected {expected}")
+
+    return {
+        "scenario": name,
+        "passed": not failures,
+        "failures": failures,
+        "wall_sec": round(time.monotonic() - started, 3),
+        "stats": stats,
+    }
+
+
+def main() -> int:
+    args = _build_argument_parser().parse_args()
+
+    results: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory(prefix="rl-bench-") as workdir:
+        artifact = os.path.join(workdir, "artifact.bin")
+        _create_artifact(artifact, args.artifact_mb)
+
+        for name in args.scenarios.split(","):
+            result = _run_scenario(args, workdir, artifact, name)
+            results.append(result)
+            print(
+                f"{name:18} {'ok' if result['passed'] else 'FAILED'}  {result['wall_sec']:6.2f} s"
+                + (f"  {'; '.join(result['failures'])}" if result["failures"] else "")
+            )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "python": sys.version.split()[0],
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+    return 0 if all(result["passed"] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# cold-start latency per command: every run is a new interpreter, like a new container would start one
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import (
+    Dict,
+    List,
+)
+
+COMMANDS: List[str] = [
+    "rl-scan",
+    "rl-scan-url",
+    "rl-scan-batch",
+    "rl-scan-serve",
+]
+
+# the modules a scan loads after the arguments are parsed
+SCAN_MODULES: List[str] = [
+    "portal_api",
+    "post_scan",
+    "upload",
+    "scan_cache",
+]
+
+
+def _build_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="startup",
+        description="Measure the startup time of the rl-scanner-cloud commands",
+    )
+
+    parser.add_argument(
+        "--scripts",
+        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"),
+        help="Directory with the entrypoint and the commands. Defaults to ../scripts",
+    )
+
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=20,
+        help="Number of runs per case. Defaults to 20",
+    )
+
+    parser.add_argument(
+        "--json",
+        help="Also write the results as json to this file, for tracking them over time",
+    )
+
+    return parser
+
+
+def _time_runs(
+    argv: List[str],
+    runs: int,
+    cwd: str,
+) -> List[float]:
+    # one untimed run first, so a missing __pycache__ is not part of the numbers
+    subprocess.run(argv, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+
+    timings: List[float] = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(argv, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def _cases(
+    scripts: str,
+) -> Dict[str, List[str]]:
+    python = sys.executable
+    cases: Dict[str, List[str]] = {
+        "python (bare interpreter)": [python, "-c", "pass"],
+    }
+    for command in COMMANDS:
+        cases[f"entrypoint {command} --help"] = [python, os.path.join(scripts, "entrypoint"), command, "--help"]
+        cases[f"{command} --help"] = [python, os.path.join(scripts, command), "--help"]
+    cases["import scan modules"] = [python, "-c", "import " + ", ".join(SCAN_MODULES)]
+    return cases
+
+
+def main() -> int:
+    args = _build_argument_parser().parse_args()
+    scripts = os.path.abspath(args.scripts)
+
+    results: Dict[str, Dict[str, float]] = {}
+    for name, argv in _cases(scripts).items():
+        timings = _time_runs(argv, args.runs, scripts)
+        results[name] = {
+            "min_ms": round(min(timings), 1),
+            "median_ms": round(statistics.median(timings), 1),
+            "max_ms": round(max(timings), 1),
+        }
+        print(
+            f"{name:40} min {results[name]['min_ms']:7.1f} ms  "
+            f"median {results[name]['median_ms']:7.1f} ms  max {results[name]['max_ms']:7.1f} ms"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "python": sys.version.split()[0],
+                    "runs": args.runs,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# cost of sending an artifact with each --upload-engine: CPU seconds per GB and MB/s of the upload request
+# through the shared Transport to a local sink, over plain http (os.sendfile) and https (mmap view).
+# The sink runs in its own process and only counts bytes, so the client is what is measured
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import ssl
+import statistics
+import sys
+import tempfile
+import time
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "scripts"))
+
+from constants import (  # noqa: E402 pylint: disable=wrong-import-position
+    UPLOAD_BUFFER_SIZE,
+    UPLOAD_ENGINES,
+)
+from digests import new_hashers  # noqa: E402 pylint: disable=wrong-import-position
+from mock_portal import ensure_certificate  # noqa: E402 pylint: disable=wrong-import-position
+from transport import get_transport  # noqa: E402 pylint: disable=wrong-import-position
+from upload import upload_stream  # noqa: E402 pylint: disable=wrong-import-position
+
+SINK_BUFFER_SIZE = 4 * 1024 * 1024
+RESPONSE = b"HTTP/1.1 201 Created\r\nContent-Type: application/json\r\nContent-Length: 2\r\n\r\n{}"
+
+
+def _build_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="upload_engine",
+        description="Measure CPU seconds per GB and MB/s of each upload engine against a local sink",
+    )
+
+    parser.add_argument(
+        "--artifact-mb",
+        type=int,
+        default=1024,
+        help="Size of the uploaded artifact in MB. Defaults to 1024",
+    )
+
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=3,
+        help="Number of uploads per engine and scheme, the median is reported. Defaults to 3",
+    )
+
+    parser.add_argument(
+        "--buffer-kib",
+        type=int,
+        default=UPLOAD_BUFFER_SIZE // 1024,
+        help=f"Block size in KiB, like --upload-buffer-size. Defaults to {UPLOAD_BUFFER_SIZE // 1024}",
+    )
+
+    parser.add_argument(
+        "--digests",
+        action="store_true",
+        help="Also compute the sha256, sha1 and md5 digests while uploading, like --digests",
+    )
+
+    parser.add_argument(
+        "--json",
+        help="Also write the results as json to this file, for comparing versions",
+    )
+
+    return parser
+
+
+def _serve_connection(
+    conn: socket.socket,
+) -> None:
+    # keep-alive http/1.1: read the headers, discard Content-Length bytes of body, answer 201
+    buffer = bytearray(SINK_BUFFER_SIZE)
+    pending = b""
+    with conn:
+        while True:
+            while b"\r\n\r\n" not in pending:
+                data = conn.recv(65536)
+                if not data:
+                    return
+                pending += data
+            head, _, pending = pending.partition(b"\r\n\r\n")
+            length = 0
+            for line in head.split(b"\r\n")[1:]:
+                name, _, value = line.partition(b":")
+                if name.strip().lower() == b"content-length":
+                    length = int(value)
+            left = length - len(pending)
+            pending = b""
+            while left > 0:
+                n = conn.recv_into(buffer, min(left, SINK_BUFFER_SIZE))
+                if n == 0:
+                    return
+                left -= n
+            conn.sendall(RESPONSE)
+
+
+def _sink(
+    listener: socket.socket,
+    cert: Optional[str],
+    key: Optional[str],
+) -> None:
+    context: Optional[ssl.SSLContext] = None
+    if cert and key:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+    while True:
+        conn, _ = listener.accept()
+        if context is not None:
+            conn = context.wrap_socket(conn, server_side=True)
+        _serve_connection(conn)
+
+
+def _start_sink(
+    cert: Optional[str] = None,
+    key: Optional[str] = None,
+) -> Tuple[multiprocessing.Process, int]:
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    port = int(listener.getsockname()[1])
+    process = multiprocessing.Process(target=_sink, args=(listener, cert, key), daemon=True)
+    process.start()
+    listener.close()
+    return process, port
+
+
+def _upload(
+    url: str,
+    artifact: str,
+    engine: str,
+    args: argparse.Namespace,
+    verify: Any,
+) -> Dict[str, float]:
+    size = os.path.getsize(artifact)
+    hashers = new_hashers(["sha256", "sha1", "md5"] if args.digests else [])
+    cpu = time.process_time()
+    start = time.monotonic()
+    with open(artifact, "rb") as f:
+        response = get_transport().post(
+            url,
+            data=upload_stream(f, size, engine, buffer_size=args.buffer_kib * 1024, hashers=hashers),
+            headers={"Content-Type": "application/octet-stream"},
+            verify=verify,
+        )
+    elapsed = max(time.monotonic() - start, 1e-6)
+    cpu = time.process_time() - cpu
+    if response.status_code != 201:
+        raise RuntimeError(f"Upload with {engine} returned {response.status_code}")
+
+    return {
+        "mb_per_sec": size / 1024 / 1024 / elapsed,
+        "cpu_sec_per_gb": cpu / (size / 1024**3),
+    }
+
+
+def _create_artifact(
+    path: str,
+    size_mb: int,
+) -> None:
+    block = os.urandom(1024 * 1024)
+    with open(path, "wb") as f:
+        for _ in range(size_mb):
+            f.write(block)
+
+
+def main() -> int:
+    args = _build_argument_parser().parse_args()
+    results: List[Dict[str, Any]] = []
+
+    with tempfile.TemporaryDirectory(prefix="rl-bench-") as workdir:
+        artifact = os.path.join(workdir, "artifact.bin")
+        _create_artifact(artifact, args.artifact_mb)
+        cert, key = ensure_certificate(os.path.join(workdir, "tls"))
+
+        for scheme in ["http", "https"]:
+            sink, port = _start_sink(cert, key) if scheme == "https" else _start_sink()
+            url = f"{scheme}://127.0.0.1:{port}/api/public/v1/scan/bench/bench/pkg:rl/bench/artifact@1"
+            try:
+                for engine in UPLOAD_ENGINES:
+                    runs = [_upload(url, artifact, engine, args, cert) for _ in range(args.runs)]
+                    result: Dict[str, Any] = {"scheme": scheme, "engine": engine}
+                    for name in runs[0]:
+                        result[name] = round(statistics.median(run[name] for run in runs), 3)
+                    results.append(result)
+                    print(
+                        f"{scheme:5} {engine:9}  {result['mb_per_sec']:8.1f} MB/s  "
+                        f"{result['cpu_sec_per_gb']:6.3f} CPU s/GB"
+                    )
+            finally:
+                sink.kill()
+                sink.join()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "python": sys.version.split()[0],
+                    "runs": args.runs,
+                    "artifact_mb": args.artifact_mb,
+                    "buffer_kib": args.buffer_kib,
+                    "digests": args.digests,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
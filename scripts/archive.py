@@ -0,0 +1,209 @@
+import os
+import stat
+import tarfile
+from typing import (
+    BinaryIO,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from cimessages import reporter
+
+from constants import (
+    UPLOAD_BUFFER_SIZE,
+    UPLOAD_FILE_SIZE_LIMIT,
+)
+
+_BLOCK = tarfile.BLOCKSIZE
+_RECORD = tarfile.RECORDSIZE
+
+# (name in the archive, source path, tar type, size, mode, link target)
+_Member = Tuple[str, str, bytes, int, int, str]
+
+
+def _padding(
+    size: int,
+    unit: int = _BLOCK,
+) -> int:
+    return -size % unit
+
+
+def _header(
+    member: _Member,
+) -> bytes:
+    # normalized metadata: only the name, type, size, executable bit and link target vary
+    name, _, kind, size, mode, linkname = member
+    info = tarfile.TarInfo(name)
+    info.type = kind
+    info.size = size
+    info.mode = mode
+    info.linkname = linkname
+    info.mtime = 0
+    info.uid = info.gid = 0
+    info.uname = info.gname = ""
+    return info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+
+
+class DirectoryArchive:
+    # a tar of a directory that is generated while it is read, never written to disk. Entries are sorted
+    # by name and carry no owner or time, so the same tree gives the same bytes (and digests) on every
+    # build. The layout is fixed up front, the size is known before the upload starts
+    def __init__(
+        self,
+        path: str,
+        limit: int = UPLOAD_FILE_SIZE_LIMIT,
+    ) -> None:
+        self.path: str = path
+        self.limit: int = limit
+        self.members: List[_Member] = []
+        self.size: int = 2 * _BLOCK  # end of archive marker
+        self.mtime_ns: int = os.stat(path).st_mtime_ns  # newest entry, tells a changed tree from an unchanged one
+        self._scan(path, "")
+        self.size += _padding(self.size, _RECORD)
+
+    def _add(
+        self,
+        member: _Member,
+    ) -> None:
+        self.members.append(member)
+        self.size += len(_header(member)) + member[3] + _padding(member[3])
+        # fail while walking, before anything is uploaded
+        if self.size > self.limit:
+            raise RuntimeError(f"Directory {self.path} is larger than {self.limit / 1024 ** 3:g}GB as an archive")
+
+    def _scan(
+        self,
+        directory: str,
+        prefix: str,
+    ) -> None:
+        with os.scandir(directory) as it:
+            entries = sorted(it, key=lambda e: e.name.encode("utf-8", "surrogateescape"))
+
+        for entry in entries:
+            name = f"{prefix}{entry.name}"
+            st = entry.stat(follow_symlinks=False)
+            self.mtime_ns = max(self.mtime_ns, st.st_mtime_ns)
+            if stat.S_ISLNK(st.st_mode):
+                self._add((name, entry.path, tarfile.SYMTYPE, 0, 0o777, os.readlink(entry.path)))
+            elif stat.S_ISDIR(st.st_mode):
+                self._add((f"{name}/", entry.path, tarfile.DIRTYPE, 0, 0o755, ""))
+                self._scan(entry.path, f"{name}/")
+            elif stat.S_ISREG(st.st_mode):
+                mode = 0o755 if st.st_mode & 0o111 else 0o644
+                self._add((name, entry.path, tarfile.REGTYPE, st.st_size, mode, ""))
+            else:
+                reporter.info(f"Skipping {entry.path}: not a file, directory or symbolic link")
+
+    def blocks(
+        self,
+        buffer_size: int = UPLOAD_BUFFER_SIZE,
+    ) -> Iterator[bytes]:
+        sent = 0
+        for member in self.members:
+            header = _header(member)
+            yield header
+            _, path, kind, size, _, _ = member
+            if kind == tarfile.REGTYPE:
+                yield from self._content(path, size, buffer_size)
+                yield bytes(_padding(size))
+            sent += len(header) + size + _padding(size)
+
+        yield bytes(self.size - sent)
+
+    def _content(
+        self,
+        path: str,
+        size: int,
+        buffer_size: int,
+    ) -> Iterator[bytes]:
+        # the size is in the header and in the Content-Length already, a file that changed cannot be sent
+        with open(path, "rb") as f:
+            left = size
+            while left > 0:
+                chunk = f.read(min(buffer_size, left))
+                if not chunk:
+                    break
+                left -= len(chunk)
+                yield chunk
+            if left or os.fstat(f.fileno()).st_size != size:
+                raise RuntimeError(f"{path} changed while uploading {self.path}")
+
+
+class ArchiveReader:
+    # file-like view of the archive for the upload and digest code, which read in blocks
+    def __init__(
+        self,
+        archive: DirectoryArchive,
+        buffer_size: int = UPLOAD_BUFFER_SIZE,
+    ) -> None:
+        self.blocks: Iterator[bytes] = archive.blocks(buffer_size)
+        self.pending: bytes = b""
+
+    def read(
+        self,
+        size: int,
+    ) -> bytes:
+        # up to size bytes, b"" only at the end; whole blocks are passed on without a copy
+        while not self.pending:
+            block = next(self.blocks, None)
+            if block is None:
+                return b""
+            self.pending = block
+        if size >= len(self.pending):
+            chunk, self.pending = self.pending, b""
+        else:
+            chunk, self.pending = self.pending[:size], self.pending[size:]
+        return chunk
+
+    def close(
+        self,
+    ) -> None:
+        self.pending = b""
+        self.blocks = iter([])
+
+    def __enter__(
+        self,
+    ) -> "ArchiveReader":
+        return self
+
+    def __exit__(
+        self,
+        *_: object,
+    ) -> None:
+        self.close()
+
+
+def open_artifact(
+    file_path: str,
+    buffer_size: int = UPLOAD_BUFFER_SIZE,
+) -> Tuple[Union[BinaryIO, ArchiveReader], int]:
+    # the content that is uploaded for a --file-path and its size
+    if os.path.isdir(file_path):
+        archive = DirectoryArchive(file_path)
+        return ArchiveReader(archive, buffer_size), archive.size
+    return open(file_path, "rb"), os.path.getsize(file_path)  # pylint: disable=consider-using-with
+
+
+def artifact_stat(
+    file_path: str,
+) -> Tuple[int, int]:
+    # size and modification time of the uploaded content, for a directory those of its archive
+    if os.path.isdir(file_path):
+        archive = DirectoryArchive(file_path)
+        return archive.size, archive.mtime_ns
+    st = os.stat(file_path)
+    return st.st_size, st.st_mtime_ns
+
+
+def artifact_name(
+    file_path: str,
+    filename: Optional[str] = None,
+) -> str:
+    # a directory is uploaded as <name>.tar
+    if filename:
+        return filename
+    name = os.path.basename(os.path.normpath(file_path))
+    return f"{name}.tar" if os.path.isdir(file_path) else name
@@ -0,0 +1,498 @@
+import asyncio
+import os
+import random
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+import aiohttp
+
+from archive import (
+    DirectoryArchive,
+    artifact_name,
+)
+from cimessages import reporter
+from helpers import (
+    create_public_api_url,
+    get_default_report_name,
+    get_package_purl,
+    get_portal_url,
+    get_version,
+    has_repro,
+    parse_report_formats,
+)
+from params import Params
+from polling import (
+    PollSchedule,
+    retry_after_sec,
+)
+from portal_api import _transform_purl
+from post_scan import clamp_timeout
+from scheduler import (
+    RequestScheduler,
+    get_scheduler,
+    waiting_since,
+)
+from transport import proxies_from_env
+
+from constants import (
+    REQUEST_TIMEOUT,
+    HTTP_POOL_SIZE,
+    HTTP_RETRIES,
+    HTTP_BACKOFF_FACTOR,
+    HTTP_BACKOFF_MAX,
+    HTTP_RETRY_STATUS,
+    MAX_DOWNLOAD_CHUNK_SIZE,
+    SCHEDULER_RETRIES,
+    EXIT_FATAL,
+)
+
+
+def create_session(
+    limit: int = HTTP_POOL_SIZE,
+) -> aiohttp.ClientSession:
+    # one session (and connection pool) per event loop, shared by all AsyncPortalAPI instances
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=limit),
+        timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+    )
+
+
+async def _archive_body(
+    archive: DirectoryArchive,
+) -> AsyncIterator[bytes]:
+    blocks = archive.blocks()
+    while (block := await asyncio.to_thread(next, blocks, None)) is not None:
+        yield block
+
+
+def _backoff_sec(
+    attempt: int,
+) -> float:
+    return min(HTTP_BACKOFF_FACTOR * (1 << attempt), HTTP_BACKOFF_MAX) + random.uniform(0, 1)
+
+
+class AsyncPortalAPI:
+    # asyncio counterpart of PortalAPI; errors raise RuntimeError instead of ending the process
+    def __init__(
+        self,
+        params: Params,
+        session: aiohttp.ClientSession,
+    ) -> None:
+        self.params: Params = params
+        self.session: aiohttp.ClientSession = session
+        self.api_token: str = str(os.environ.get("RLPORTAL_ACCESS_TOKEN"))
+        self.proxy: Optional[str] = proxies_from_env().get("https")
+        self.scheduler: RequestScheduler = get_scheduler()
+
+        self.params.purl = _transform_purl(self.params.purl)
+
+    async def prepare(
+        self,
+    ) -> None:
+        # same force/replace resolution as PortalAPI._transform_force_and_replace_params
+        if not (self.params.force and self.params.replace):
+            return
+
+        if has_repro(self.params.purl):
+            self.params.force = False
+            return
+
+        status, data = await self.get_package_versions()
+        if status not in [200, 404, 401]:
+            raise RuntimeError(
+                f"Error: while validating force and replace parameters: get_package_versions(): {status}"
+            )
+
+        if status in [404, 401]:
+            self.params.replace = False
+            self.params.force = False
+            return
+
+        purl_version = get_version(self.params.purl)
+        if any(version.get("version") == purl_version for version in data.get("versions", [])):
+            self.params.force = False
+        else:
+            self.params.replace = False
+
+    def _public_api_url_to(
+        self,
+        *,
+        what: str,
+        path: str,
+    ) -> str:
+        public_api_url = create_public_api_url(
+            rl_portal_host=self.params.rl_portal_host or None,
+            rl_portal_server=self.params.rl_portal_server or None,
+            what=what,
+        )
+        return f"{public_api_url}{self.params.rl_portal_org}/{self.params.rl_portal_group}/{path}"
+
+    def _auth_header(
+        self,
+    ) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_token}",
+            "User-Agent": "rl-scanner-cloud",
+        }
+
+    def _scan_query_params(
+        self,
+    ) -> Dict[str, str]:
+        query_params: Dict[str, str] = {}
+        for name in ["force", "replace", "diff_with"]:
+            value = getattr(self.params, name, False)
+            if value:
+                query_params[name] = "true" if value is True else str(value)
+        return query_params
+
+    async def _raise_for_status(
+        self,
+        url: str,
+        response: aiohttp.ClientResponse,
+    ) -> None:
+        if self.params.debug:
+            reporter.info(f"{url} {response.status}")
+        if response.status < 400:
+            return
+
+        try:
+            error = (await response.json(content_type=None)).get("error")
+        except ValueError:
+            error = None
+        raise RuntimeError(f"{error or 'Something went wrong with your request'} ({response.status} {url})")
+
+    async def _read_json(
+        self,
+        url: str,
+        response: aiohttp.ClientResponse,
+    ) -> Dict[str, Any]:
+        # a malformed body (e.g. an html error page of a proxy) fails this version like any other Portal error
+        try:
+            data = await response.json(content_type=None)
+        except ValueError as e:
+            raise RuntimeError(f"Invalid json in the response ({response.status} {url}): {e}") from e
+        return data if isinstance(data, dict) else {}
+
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        body: Optional[Callable[[], Any]] = None,
+        **kwargs: Any,
+    ) -> aiohttp.ClientResponse:
+        # a connection that could not be established sent nothing, safe to retry for any method;
+        # body makes a fresh request body per attempt, aiohttp closes a file body once it is used.
+        # Requests wait for the scheduler, one rejected by the rate limit (429) is sent again when it allows
+        attempt = 0
+        throttled = 0
+        while True:
+            await self.scheduler.acquire_async(url)
+            try:
+                if body is not None:
+                    kwargs["data"] = body()
+                response = await self.session.request(method, url, proxy=self.proxy, **kwargs)
+            except aiohttp.ClientConnectorError:
+                if attempt >= HTTP_RETRIES:
+                    raise
+                await asyncio.sleep(_backoff_sec(attempt))
+                attempt += 1
+                continue
+
+            self.scheduler.learn(url, response.status, response.headers)
+            if response.status != 429 or throttled >= SCHEDULER_RETRIES or not self.scheduler.schedules(url):
+                return response
+            response.release()
+            throttled += 1
+
+    async def _get_json(
+        self,
+        url: str,
+        allowed_status: Optional[List[int]] = None,
+    ) -> Tuple[int, Dict[str, Any]]:
+        # GET is idempotent, retry transient errors with exponential backoff and jitter like the sync transport
+        for attempt in range(HTTP_RETRIES + 1):
+            try:
+                async with await self._request("GET", url, headers=self._auth_header()) as response:
+                    retry = response.status in HTTP_RETRY_STATUS and attempt < HTTP_RETRIES
+                    if not retry:
+                        if response.status not in (allowed_status or []):
+                            await self._raise_for_status(url, response)
+                        data = await self._read_json(url, response) if response.status != 204 else {}
+                        return response.status, data
+                    delay = retry_after_sec(response.headers)
+            except aiohttp.ClientConnectionError:
+                if attempt >= HTTP_RETRIES:
+                    raise
+                delay = None
+
+            await asyncio.sleep(_backoff_sec(attempt) if delay is None else delay)
+
+        raise RuntimeError(f"Giving up on {url}")  # not reached
+
+    async def scan_file_version(
+        self,
+        *,
+        file_path: str,
+        file_name: str,
+    ) -> None:
+        # https://docs.secure.software/api-reference/#tag/Version/operation/scanVersion
+        url = self._public_api_url_to(what="scan", path=self.params.purl)
+        headers = self._auth_header() | {
+            "Content-Disposition": f"attachment; filename={file_name}",
+            "Content-Type": "application/octet-stream",
+        }
+
+        # aiohttp streams a file object in blocks read on the default executor, with Content-Length set;
+        # a directory is archived on the default executor while it is sent, its size is known up front
+        archive: Optional[DirectoryArchive] = None
+        if os.path.isdir(file_path):
+            archive = await asyncio.to_thread(DirectoryArchive, file_path)
+            headers["Content-Length"] = str(archive.size)
+
+        def body() -> Any:
+            return _archive_body(archive) if archive else open(file_path, "rb")  # pylint: disable=consider-using-with
+
+        async with await self._request(
+            "POST",
+            url,
+            body=body,
+            headers=headers,
+            params=self._scan_query_params(),
+            timeout=aiohttp.ClientTimeout(total=None, sock_read=REQUEST_TIMEOUT),
+        ) as response:
+            await self._raise_for_status(url, response)
+
+    async def scan_import_url_version(
+        self,
+        *,
+        import_url: str,
+    ) -> None:
+        data: Dict[str, Any] = {
+            "url": import_url,
+        }
+        if self.params.bearer_token:
+            data["bearer-token"] = self.params.bearer_token
+        else:
+            if self.params.auth_user:
+                data["auto-user"] = self.params.auth_user
+            if self.params.auth_pass:
+                data["auto-pass"] = self.params.auth_pass
+
+        url = self._public_api_url_to(what="url-import", path=self.params.purl)
+        async with await self._request(
+            "POST",
+            url,
+            headers=self._auth_header(),
+            params=self._scan_query_params(),
+            json=data,
+        ) as response:
+            await self._raise_for_status(url, response)
+
+    async def get_performed_checks(
+        self,
+    ) -> Tuple[int, Dict[str, Any]]:
+        # https://docs.secure.software/api-reference/#tag/Version/operation/getVersionChecks
+        return await self._get_json(self._public_api_url_to(what="checks", path=self.params.purl))
+
+    async def get_analysis_status(
+        self,
+    ) -> Tuple[int, Dict[str, Any]]:
+        # https://docs.secure.software/api-reference/#tag/Version/operation/getVersionStatus
+        return await self._get_json(self._public_api_url_to(what="status", path=self.params.purl))
+
+    async def get_package_versions(
+        self,
+    ) -> Tuple[int, Dict[str, Any]]:
+        # https://docs.secure.software/api-reference/#tag/Package/operation/listVersions
+        url = self._public_api_url_to(what="list", path=get_package_purl(self.params.purl))
+        return await self._get_json(url, allowed_status=[401, 404])
+
+    async def _download(
+        self,
+        url: str,
+        target: str,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> int:
+        size = 0
+        tmp_path = os.path.join(os.path.dirname(target), f".{os.path.basename(target)}.{os.getpid()}.part")
+        async with await self._request("GET", url, headers=headers) as response:
+            await self._raise_for_status(url, response)
+            try:
+                with open(tmp_path, "wb") as f:
+                    async for chunk in response.content.iter_chunked(MAX_DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+                        size += len(chunk)
+                os.replace(tmp_path, target)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+        return size
+
+    async def export_analysis_report(
+        self,
+        report_format: str,
+        report_path: str,
+    ) -> int:
+        # https://docs.secure.software/api-reference/#tag/Version/operation/getVersionReport
+        url = self._public_api_url_to(what="report", path=f"{report_format}/{self.params.purl}")
+        target = os.path.join(report_path, get_default_report_name(report_format))
+        return await self._download(url, target, headers=self._auth_header())
+
+    async def export_pack_safe(
+        self,
+        report_path: str,
+    ) -> int:
+        _, data = await self._get_json(self._public_api_url_to(what="pack/safe", path=self.params.purl))
+        target = os.path.join(report_path, str(data.get("file_name")))
+        return await self._download(str(data.get("download_link")), target)
+
+    async def probe(
+        self,
+        schedule: PollSchedule,
+        endpoint: str = "status",
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[float]]:
+        # one poll: the response once done, otherwise None and the Retry-After of the pending answer
+        url = self._public_api_url_to(what=endpoint, path=self.params.purl)
+        request_start = time.monotonic()
+        with waiting_since(schedule.started):
+            response = await self._request("GET", url, headers=self._auth_header())
+        async with response:
+            pending = response.status in [202] + HTTP_RETRY_STATUS
+            schedule.record(request_start, pending)
+            if pending:
+                return None, retry_after_sec(response.headers)
+            await self._raise_for_status(url, response)
+            return await self._read_json(url, response), None
+
+    async def _poll_until_done(
+        self,
+        schedule: PollSchedule,
+        endpoint: str,
+        probe_now: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        retry_after: Optional[float] = None
+        while probe_now or not schedule.expired():
+            if not probe_now:
+                await asyncio.sleep(schedule.next_delay(retry_after))
+            probe_now = False
+
+            data, retry_after = await self.probe(schedule, endpoint)
+            if data is not None:
+                return data
+
+        return None
+
+    async def get_scan_status(
+        self,
+        schedule: PollSchedule,
+    ) -> str:
+        # checks of a finished analysis
+        data = await self._poll_until_done(schedule, "checks", probe_now=True)
+        if data is None:
+            raise RuntimeError("Preset timeout time expired")
+
+        return str(
+            data.get("analysis", {}).get("report", {}).get("info", {}).get("summary", {}).get("scan_status", "fail")
+        )
+
+    async def wait_for_scan(
+        self,
+        timeout_min: int,
+    ) -> str:
+        # the async polling loop: light status endpoint until done, then the checks once
+        schedule = PollSchedule(clamp_timeout(timeout_min) * 60)
+        if await self._poll_until_done(schedule, "status") is None:
+            raise RuntimeError("Preset timeout time expired")
+        return await self.get_scan_status(schedule)
+
+    async def get_report_url(
+        self,
+        status: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        # from the status of the version, fetched unless the caller has it already
+        data = status if status is not None else (await self.get_analysis_status())[1]
+        reference = data.get("analysis", {}).get("report", {}).get("info", {}).get("portal", {}).get("reference")
+        portal_url = get_portal_url(
+            rl_portal_host=self.params.rl_portal_host,
+            rl_portal_server=self.params.rl_portal_server,
+        )
+        return f"{portal_url}/{reference}"
+
+
+async def export_version(
+    portal: AsyncPortalAPI,
+    params: Params,
+) -> None:
+    # the reports (in parallel) and the rl-safe archive of an analyzed version
+    if params.report_format and params.report_path:
+        report_path = params.report_path
+        await asyncio.gather(
+            *[
+                portal.export_analysis_report(report_format, report_path)
+                for report_format in parse_report_formats(params.report_format)
+            ]
+        )
+
+    if params.pack_safe and params.report_path:
+        await portal.export_pack_safe(params.report_path)
+
+
+async def scan_version(
+    session: aiohttp.ClientSession,
+    params: Params,
+) -> Tuple[int, Optional[str], Optional[str]]:
+    # upload (or url import), wait and export one version; returns exit code, scan status and report url
+    label = params.purl
+    portal = AsyncPortalAPI(params, session)
+    await portal.prepare()
+
+    reporter.info(f"{label}: uploading {params.file_path or params.import_url}")
+    if params.file_path:
+        await portal.scan_file_version(
+            file_path=params.file_path,
+            file_name=artifact_name(params.file_path, params.filename),
+        )
+    else:
+        assert params.import_url is not None
+        await portal.scan_import_url_version(import_url=params.import_url)
+
+    if params.submit_only:
+        reporter.info(f"{label}: submitted, skip waiting for analysis result")
+        return 0, None, None
+
+    reporter.info(f"{label}: waiting for analysis result")
+    scan_status = await portal.wait_for_scan(params.timeout)
+    report_url = await portal.get_report_url()
+    await export_version(portal, params)
+
+    reporter.info(f"{label}: scan status {scan_status}, report {report_url}")
+    return (0 if scan_status == "pass" else 1), scan_status, report_url
+
+
+async def scan_versions(
+    artifacts: List[Params],
+    concurrency: int,
+) -> List[Tuple[int, Optional[str], Optional[str], Optional[str]]]:
+    # bounded concurrency on one event loop: memory and threads stay flat with the number of scans
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with create_session(limit=concurrency) as session:
+
+        async def run(params: Params) -> Tuple[int, Optional[str], Optional[str], Optional[str]]:
+            async with semaphore:
+                try:
+                    exit_code, scan_status, report_url = await scan_version(session, params)
+                    return exit_code, scan_status, report_url, None
+                except (RuntimeError, aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError, KeyError) as e:
+                    return EXIT_FATAL, None, None, str(e) or type(e).__name__
+
+        return list(await asyncio.gather(*[run(params) for params in artifacts]))
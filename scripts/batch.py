@@ -0,0 +1,375 @@
+import asyncio
+import csv
+import hashlib
+import json
+import os
+from concurrent.futures import (
+    ThreadPoolExecutor,
+    as_completed,
+)
+from dataclasses import (
+    dataclass,
+    replace,
+)
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+from cimessages import reporter
+from helpers import get_portal_url
+from params import Params
+from validators import (
+    validate_params,
+)
+
+from constants import (
+    EXIT_FATAL,
+)
+
+MANIFEST_FIELDS: List[str] = [
+    "file_path",
+    "purl",
+    "filename",
+    "diff_with",
+    "report_format",
+    "report_path",
+]
+
+
+@dataclass
+class BatchResult:
+    purl: str
+    file_path: str
+    exit_code: int
+    scan_status: Optional[str] = None
+    report_url: Optional[str] = None
+    error: Optional[str] = None
+
+
+def _normalize_entry(
+    entry: Any,
+    line: int,
+) -> Dict[str, str]:
+    # a json manifest can hold anything, a csv row is always a dict
+    if not isinstance(entry, dict):
+        raise RuntimeError(f"Manifest entry {line}: must be an object with the artifact fields")
+
+    normalized: Dict[str, str] = {}
+    for key, value in entry.items():
+        if key is None:
+            raise RuntimeError(f"Manifest entry {line}: too many columns")
+
+        name = key.strip().replace("-", "_")
+        if name not in MANIFEST_FIELDS:
+            raise RuntimeError(f"Manifest entry {line}: unknown field '{key}', we currently support: {MANIFEST_FIELDS}")
+
+        if value is None or str(value).strip() == "":
+            continue
+        normalized[name] = str(value).strip()
+
+    for name in ["file_path", "purl"]:
+        if name not in normalized:
+            raise RuntimeError(f"Manifest entry {line}: missing mandatory field '{name}'")
+
+    return normalized
+
+
+def read_manifest(
+    manifest_path: str,
+) -> List[Dict[str, str]]:
+    if not os.path.isfile(manifest_path):
+        raise RuntimeError("Manifest file does not exist")
+
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        if manifest_path.lower().endswith(".json"):
+            data = json.load(f)
+            if isinstance(data, dict):
+                data = data.get("artifacts", [])
+            if not isinstance(data, list):
+                raise RuntimeError("Manifest json must be a list of artifacts or have an 'artifacts' list")
+            rows = data
+        else:
+            rows = list(csv.DictReader(f))
+
+    entries = [_normalize_entry(row, line) for line, row in enumerate(rows, start=1)]
+    if not entries:
+        raise RuntimeError("Manifest does not contain any artifacts")
+
+    purls = [entry["purl"] for entry in entries]
+    if len(set(purls)) != len(purls):
+        raise RuntimeError("Manifest contains duplicate purls")
+
+    return entries
+
+
+def _safe_dir_name(
+    purl: str,
+) -> str:
+    name = "".join(c if c.isalnum() or c in "-_.@" else "_" for c in purl)
+    if name == purl:
+        return name
+    # a short hash of the purl keeps e.g. a/b@1 and a_b@1 apart
+    return f"{name}-{hashlib.sha256(purl.encode('utf-8')).hexdigest()[:8]}"
+
+
+def make_artifact_params(
+    base: Params,
+    entry: Dict[str, str],
+) -> Params:
+    report_format = entry.get("report_format", base.report_format)
+    report_path = entry.get("report_path")
+
+    if report_path is None and base.report_path and report_format:
+        # each artifact gets its own empty sub directory below the batch report path
+        report_path = os.path.join(base.report_path, _safe_dir_name(entry["purl"]))
+        os.makedirs(report_path, exist_ok=True)
+
+    params = replace(
+        base,
+        purl=entry["purl"],
+        file_path=entry["file_path"],
+        filename=entry.get("filename"),
+        diff_with=entry.get("diff_with", base.diff_with),
+        report_format=report_format,
+        report_path=report_path,
+    )
+    validate_params(params)
+    return params
+
+
+def make_batch_params(
+    base: Params,
+    entries: List[Dict[str, str]],
+) -> Tuple[List[Params], List[BatchResult]]:
+    # an invalid entry (missing file, report path not empty) fails on its own, the other artifacts are scanned
+    artifacts: List[Params] = []
+    invalid: List[BatchResult] = []
+    for entry in entries:
+        try:
+            artifacts.append(make_artifact_params(base, entry))
+        except (RuntimeError, OSError) as e:
+            result = BatchResult(
+                purl=entry["purl"],
+                file_path=entry["file_path"],
+                exit_code=EXIT_FATAL,
+                error=str(e),
+            )
+            invalid.append(result)
+            reporter.error(f"{result.purl}: {result.error}")
+    return artifacts, invalid
+
+
+def scan_artifact(
+    params: Params,
+) -> BatchResult:
+    # pylint: disable=import-outside-toplevel
+    # requests and the scan code are imported with the first scan, not when the manifest is read
+    from portal_api import PortalAPI
+    from archive import artifact_name
+    from post_scan import (
+        get_analysis_url,
+        get_scan_status,
+        export_analysis_report,
+        export_pack_safe,
+    )
+    from digests import (
+        digest_algorithms,
+        file_digests,
+        report_digests,
+    )
+    from scan_cache import (
+        lookup_scan,
+        store_scan,
+    )
+    from report_summary import summarize_reports
+    from upload import upload_file
+
+    # a file upload, or a url import when the params have an import_url (rl-scan-serve jobs)
+    assert params.file_path is not None or params.import_url is not None
+    file_path: str = params.file_path or ""
+    file_name: str = artifact_name(file_path, params.filename)
+    label = params.purl
+
+    result = BatchResult(
+        purl=params.purl,
+        file_path=file_path,
+        exit_code=EXIT_FATAL,
+    )
+
+    try:
+        scanner = PortalAPI(params)
+
+        digests: Dict[str, str] = {}
+        cached: Optional[Dict[str, Any]] = None
+        if params.cache_dir and file_path:
+            digests = file_digests(file_path, digest_algorithms(params.digests))
+            cached = lookup_scan(scanner, params.cache_dir, digests["sha256"])
+
+        if params.import_url:
+            reporter.info(f"{label}: importing {params.import_url}")
+            scanner.scan_import_url_version(import_url=params.import_url)
+        elif cached:
+            reporter.info(f"{label}: {file_path} was already scanned, skip upload")
+        else:
+            reporter.info(f"{label}: uploading {file_path}")
+            uploaded_digests = upload_file(
+                scanner,
+                params,
+                file_path,
+                file_name,
+                digest_algorithms=digest_algorithms(params.digests) if params.digests and not digests else None,
+            )
+            digests = digests or uploaded_digests
+
+        if params.digests and digests:
+            report_digests(file_path, file_name, params.purl, digests, params.report_path)
+
+        if params.submit_only:
+            reporter.info(f"{label}: submitted, skip waiting for analysis result")
+            result.exit_code = 0
+            return result
+
+        reporter.info(f"{label}: waiting for analysis result")
+        result.scan_status = get_scan_status(scanner, params.timeout, probe_now=cached is not None)
+        passed_analysis = result.scan_status == "pass"
+
+        analysis_url = get_analysis_url(scanner)
+        portal_url = get_portal_url(
+            rl_portal_host=params.rl_portal_host,
+            rl_portal_server=params.rl_portal_server,
+        )
+        result.report_url = f"{portal_url}/{analysis_url}"
+
+        if params.report_format and params.report_path:
+            export_analysis_report(
+                scanner,
+                params.report_format,
+                params.report_path,
+            )
+
+        if params.report_summary and params.report_path:
+            summarize_reports(
+                params.report_path,
+                purl=params.purl,
+                scan_status=result.scan_status,
+                report_url=result.report_url,
+                label=label,
+            )
+
+        if params.cache_dir and digests:
+            store_scan(
+                params.cache_dir,
+                digests["sha256"],
+                purl=params.purl,
+                scan_status=result.scan_status,
+                report_url=result.report_url,
+            )
+
+        if params.pack_safe and params.report_path:
+            export_pack_safe(
+                scanner,
+                params.report_path,
+            )
+
+        result.exit_code = 0 if passed_analysis else 1
+
+    except SystemExit as e:
+        # PortalAPI exits on fatal http errors, in a batch that only ends this artifact
+        result.error = f"exit {e.code}"
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        result.error = str(e)
+
+    return result
+
+
+def run_batch(
+    artifacts: List[Params],
+    workers: int,
+) -> List[BatchResult]:
+    results: List[BatchResult] = []
+    order = {params.purl: i for i, params in enumerate(artifacts)}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(scan_artifact, params): params for params in artifacts}
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+
+            if result.error:
+                reporter.error(f"{result.purl}: {result.error}")
+            reporter.info(
+                f"{result.purl}: exit code {result.exit_code}, scan status {result.scan_status or 'NONE'}"
+                + (f", report {result.report_url}" if result.report_url else "")
+            )
+
+    results.sort(key=lambda r: order.get(r.purl, 0))
+    return results
+
+
+def run_batch_async(
+    artifacts: List[Params],
+    workers: int,
+) -> List[BatchResult]:
+    # imported here, the async client is only needed for --async
+    from async_portal_api import scan_versions  # pylint: disable=import-outside-toplevel
+
+    results: List[BatchResult] = []
+    file_paths = [params.file_path or "" for params in artifacts]
+    purls = [params.purl for params in artifacts]
+
+    outcomes = asyncio.run(scan_versions(artifacts, workers))
+    for params, purl, file_path, outcome in zip(artifacts, purls, file_paths, outcomes):
+        exit_code, scan_status, report_url, error = outcome
+        if params.report_summary and params.report_path and scan_status and not error:
+            # local work on the downloaded files, done after the event loop
+            from report_summary import summarize_reports  # pylint: disable=import-outside-toplevel
+
+            summarize_reports(
+                params.report_path,
+                purl=purl,
+                scan_status=scan_status,
+                report_url=report_url,
+                label=purl,
+            )
+
+        result = BatchResult(
+            purl=purl,
+            file_path=file_path,
+            exit_code=exit_code,
+            scan_status=scan_status,
+            report_url=report_url,
+            error=error,
+        )
+        results.append(result)
+
+        if result.error:
+            reporter.error(f"{result.purl}: {result.error}")
+        reporter.info(f"{result.purl}: exit code {result.exit_code}, scan status {result.scan_status or 'NONE'}")
+
+    return results
+
+
+def aggregate_exit_code(
+    results: List[BatchResult],
+) -> int:
+    # EXIT_FATAL > 1 (scan failed) > 0 (all passed or submitted)
+    return max((result.exit_code for result in results), default=0)
+
+
+def write_results(
+    results: List[BatchResult],
+    results_file: str,
+) -> None:
+    with open(results_file, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "exit_code": aggregate_exit_code(results),
+                "artifacts": [vars(result) for result in results],
+            },
+            f,
+            indent=2,
+        )
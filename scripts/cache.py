@@ -0,0 +1,116 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+)
+
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _thread_lock(
+    path: str,
+) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(path, threading.Lock())
+
+
+class JsonCache:
+    # a small json file with entries that expire after ttl_sec, at most max_entries (newest win);
+    # safe for threads of one process and for several processes sharing the cache directory
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        ttl_sec: float,
+        max_entries: int,
+    ) -> None:
+        self.path: str = path
+        self.ttl_sec: float = ttl_sec
+        self.max_entries: int = max_entries
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    @contextmanager
+    def _locked(
+        self,
+    ) -> Iterator[None]:
+        with _thread_lock(self.path):
+            with open(f"{self.path}.lock", "a", encoding="utf-8") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(
+        self,
+    ) -> Dict[str, Any]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _save(
+        self,
+        data: Dict[str, Any],
+    ) -> None:
+        tmp_path = f"{self.path}.{os.getpid()}.part"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def _evict(
+        self,
+        data: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        now = time.time()
+        alive = {k: v for k, v in data.items() if now - v.get("stored_at", 0) < self.ttl_sec}
+        newest = sorted(alive.items(), key=lambda kv: kv[1].get("stored_at", 0), reverse=True)
+        return dict(newest[: self.max_entries])
+
+    def get(
+        self,
+        key: str,
+    ) -> Optional[Dict[str, Any]]:
+        with self._locked():
+            entry = self._evict(self._load()).get(key)
+        return None if entry is None else dict(entry.get("value", {}))
+
+    def values(
+        self,
+    ) -> List[Dict[str, Any]]:
+        with self._locked():
+            return [dict(entry.get("value", {})) for entry in self._evict(self._load()).values()]
+
+    def put(
+        self,
+        key: str,
+        value: Dict[str, Any],
+    ) -> None:
+        with self._locked():
+            data = self._load()
+            data[key] = {
+                "stored_at": time.time(),
+                "value": value,
+            }
+            self._save(self._evict(data))
+
+    def delete(
+        self,
+        key: str,
+    ) -> None:
+        with self._locked():
+            data = self._load()
+            if data.pop(key, None) is not None:
+                self._save(self._evict(data))
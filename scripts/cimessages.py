@@ -1,6 +1,10 @@
 from __future__ import annotations
 
 import abc
+import json
+import sys
+import threading
+import time
 from contextlib import contextmanager
 from enum import Enum
 from typing import (
@@ -10,10 +14,74 @@ from typing import (
     Optional,
 )
 
+from metrics import metrics
+
+from constants import (
+    METRICS_PREFIX,
+    MESSAGES_FLUSH_INTERVAL_SEC,
+)
+
+_output_lock = threading.Lock()
+_flushed_at: float = 0.0
+_flush_timer: Optional[threading.Timer] = None
+
+
+def _flush() -> None:
+    global _flushed_at, _flush_timer  # pylint: disable=global-statement
+
+    with _output_lock:
+        sys.stdout.flush()
+        _flushed_at = time.monotonic()
+        _flush_timer = None
+
+
+def _print(
+    line: str,
+    flush: bool = True,
+) -> None:
+    # one write per line, so messages from concurrent scans do not interleave;
+    # without flush the line stays in the stdout buffer until a flush, at most MESSAGES_FLUSH_INTERVAL_SEC:
+    # a timer writes it out when no other line follows, e.g. the last progress line before a long poll
+    global _flushed_at, _flush_timer  # pylint: disable=global-statement
+
+    with _output_lock:
+        sys.stdout.write(line + "\n")
+        now = time.monotonic()
+        if flush or now - _flushed_at >= MESSAGES_FLUSH_INTERVAL_SEC:
+            sys.stdout.flush()
+            _flushed_at = now
+        elif _flush_timer is None:
+            _flush_timer = threading.Timer(MESSAGES_FLUSH_INTERVAL_SEC - (now - _flushed_at), _flush)
+            _flush_timer.daemon = True
+            _flush_timer.start()
+
+
+# https://www.jetbrains.com/help/teamcity/service-messages.html#Escaped+Values
+_TEAMCITY_ESCAPE = str.maketrans(
+    {
+        "'": "|'",
+        "|": "||",
+        "\n": "|n",
+        "\r": "|r",
+        "[": "|[",
+        "]": "|]",
+        "\u0085": "|x",
+        "\u2028": "|l",
+        "\u2029": "|p",
+    }
+)
+
+
+def teamcity_escape(
+    msg: str,
+) -> str:
+    return msg.translate(_TEAMCITY_ESCAPE)
+
 
 class MessageFormat(Enum):
     TEXT = "text"
     TEAMCITY = "teamcity"
+    JSONL = "jsonl"
 
     def __str__(self) -> str:
         return self.value
@@ -24,6 +92,8 @@ class Messages(abc.ABC):
     def create(cls, name: str) -> Any:
         if name == "teamcity":
             return TeamCityMessages()
+        if name == "jsonl":
+            return JsonLinesMessages()
         return TextMessages()
 
     @abc.abstractmethod
@@ -46,6 +116,10 @@ class Messages(abc.ABC):
     def with_prefix(self, prefix: str, msg: str) -> None:
         pass
 
+    @abc.abstractmethod
+    def progress(self, msg: str) -> None:
+        pass
+
     @abc.abstractmethod
     def show_scan_result(
         self,
@@ -53,10 +127,19 @@ class Messages(abc.ABC):
     ) -> None:
         pass
 
+    @abc.abstractmethod
+    def statistic(
+        self,
+        key: str,
+        value: Any,
+    ) -> None:
+        pass
+
     @contextmanager
     def progress_block(self, msg: str) -> Any:
         self.block_start(msg)
-        yield
+        with metrics.phase(msg):
+            yield
         self.block_end(msg)
 
 
@@ -65,44 +148,58 @@ class TextMessages(Messages):
         self,
         msg: str,
     ) -> None:
-        print(f"Started: {msg}", flush=True)
+        _print(f"Started: {msg}")
 
     def block_end(
         self,
         msg: str,
     ) -> None:
-        print(f"Finished: {msg}", flush=True)
+        _print(f"Finished: {msg}")
 
     def info(
         self,
         msg: str,
     ) -> None:
-        print(f"Info: {msg}", flush=True)
+        _print(f"Info: {msg}")
 
     def error(
         self,
         msg: str,
     ) -> None:
-        print(f"Error: {msg}", flush=True)
+        _print(f"Error: {msg}")
 
     def with_prefix(
         self,
         prefix: str,
         msg: str,
     ) -> None:
-        print(f"{prefix}: {msg}", flush=True)
+        _print(f"{prefix}: {msg}")
+
+    def progress(
+        self,
+        msg: str,
+    ) -> None:
+        _print(f"Progress: {msg}")
 
     def show_scan_result(
         self,
         passed: Optional[bool],
     ) -> None:
         if passed is None:
-            print("Scan result: NONE", flush=True)
+            _print("Scan result: NONE")
         else:
             if passed:
-                print("Scan result: PASS", flush=True)
+                _print("Scan result: PASS")
             else:
-                print("Scan result: FAIL", flush=True)
+                _print("Scan result: FAIL")
+
+    def statistic(
+        self,
+        key: str,
+        value: Any,
+    ) -> None:
+        # plain text output has no place for them, see --metrics-file
+        pass
 
 
 class TeamCityMessages(Messages):
@@ -112,69 +209,61 @@ class TeamCityMessages(Messages):
         name: str,
         msg: Any,
     ) -> str:
-        def escape(m: str) -> str:
-            escape_map: Dict[str, str] = {
-                "'": "|'",
-                "|": "||",
-                "\n": "|n",
-                "\r": "|r",
-                "[": "|[",
-                "]": "|]",
-            }
-            return "".join(escape_map.get(x, x) for x in m)
-
         if isinstance(msg, dict):
-            msg_content: List[str] = [f"{k}='{escape(v)}'" for k, v in msg.items()]
+            msg_content: List[str] = [f"{k}='{teamcity_escape(v)}'" for k, v in msg.items()]
             return f"##teamcity[{name} {' '.join(msg_content)}]"
-        return f"##teamcity[{name} '{escape(msg)}']"
+        return f"##teamcity[{name} '{teamcity_escape(msg)}']"
 
     def block_start(
         self,
         msg: str,
     ) -> None:
-        print(TeamCityMessages.service_message("progressStart", msg), flush=True)
-        print(TeamCityMessages.service_message("blockOpened", {"name": msg}), flush=True)
+        _print(TeamCityMessages.service_message("progressStart", msg))
+        _print(TeamCityMessages.service_message("blockOpened", {"name": msg}))
 
     def block_end(
         self,
         msg: str,
     ) -> None:
-        print(TeamCityMessages.service_message("blockClosed", {"name": msg}), flush=True)
-        print(TeamCityMessages.service_message("progressFinish", msg), flush=True)
+        _print(TeamCityMessages.service_message("blockClosed", {"name": msg}))
+        _print(TeamCityMessages.service_message("progressFinish", msg))
 
     def __build_problem(
         self,
         msg: str,
     ) -> None:
-        print(
-            TeamCityMessages.service_message("buildProblem", {"description": msg}),
-            flush=True,
-        )
+        _print(TeamCityMessages.service_message("buildProblem", {"description": msg}))
 
     def __build_status(
         self,
         msg: str,
     ) -> None:
-        print(TeamCityMessages.service_message("buildStatus", {"text": msg}), flush=True)
+        _print(TeamCityMessages.service_message("buildStatus", {"text": msg}))
 
     def info(
         self,
         msg: str,
     ) -> None:
-        print(TeamCityMessages.service_message("message", {"text": msg}), flush=True)
+        _print(TeamCityMessages.service_message("message", {"text": msg}))
 
     def error(
         self,
         msg: str,
     ) -> None:
-        print(TeamCityMessages.service_message("message", {"text": msg}), flush=True)
+        _print(TeamCityMessages.service_message("message", {"text": msg}))
 
     def with_prefix(
         self,
         prefix: str,
         msg: str,
     ) -> None:
-        print(TeamCityMessages.service_message(prefix, msg), flush=True)
+        _print(TeamCityMessages.service_message(prefix, msg))
+
+    def progress(
+        self,
+        msg: str,
+    ) -> None:
+        _print(TeamCityMessages.service_message("progressMessage", msg))
 
     def show_scan_result(
         self,
@@ -188,6 +277,90 @@ class TeamCityMessages(Messages):
             else:
                 self.__build_problem("Scan result: FAIL")
 
+    def statistic(
+        self,
+        key: str,
+        value: Any,
+    ) -> None:
+        _print(
+            TeamCityMessages.service_message(
+                "buildStatisticValue", {"key": f"{METRICS_PREFIX}.{key}", "value": str(value)}
+            )
+        )
+
+
+class JsonLinesMessages(Messages):
+    # one json object per line for orchestrators; written through the stdout buffer and flushed at phase
+    # boundaries, results and errors, other lines within MESSAGES_FLUSH_INTERVAL_SEC
+    def __init__(
+        self,
+    ) -> None:
+        self.started: Dict[str, float] = {}
+
+    def _event(
+        self,
+        event: str,
+        flush: bool = False,
+        **fields: Any,
+    ) -> None:
+        _print(json.dumps({"ts": round(time.time(), 3), "event": event} | fields), flush=flush)
+
+    def block_start(
+        self,
+        msg: str,
+    ) -> None:
+        self.started[msg] = time.monotonic()
+        self._event("phase_start", flush=True, phase=msg)
+
+    def block_end(
+        self,
+        msg: str,
+    ) -> None:
+        duration = time.monotonic() - self.started.pop(msg, time.monotonic())
+        self._event("phase_end", flush=True, phase=msg, duration_sec=round(duration, 3))
+
+    def info(
+        self,
+        msg: str,
+    ) -> None:
+        self._event("info", message=msg)
+
+    def error(
+        self,
+        msg: str,
+    ) -> None:
+        self._event("error", flush=True, message=msg)
+
+    def with_prefix(
+        self,
+        prefix: str,
+        msg: str,
+    ) -> None:
+        if prefix == "Report URL":
+            self._event("report_url", flush=True, url=msg)
+        else:
+            self._event("value", name=prefix, value=msg)
+
+    def progress(
+        self,
+        msg: str,
+    ) -> None:
+        self._event("progress", message=msg)
+
+    def show_scan_result(
+        self,
+        passed: Optional[bool],
+    ) -> None:
+        result = "NONE" if passed is None else "PASS" if passed else "FAIL"
+        self._event("result", flush=True, result=result, passed=passed)
+
+    def statistic(
+        self,
+        key: str,
+        value: Any,
+    ) -> None:
+        self._event("metric", key=key, value=value)
+
 
 class Reporter:
     def __init__(
@@ -201,6 +374,17 @@ class Reporter:
     ) -> None:
         self._underlying = Messages.create(msg_format.value)
 
+    def fatal(
+        self,
+        command: str,
+        e: Exception,
+    ) -> None:
+        # the error that ends a command: an error event when stdout carries json lines, a plain line otherwise
+        if isinstance(self._underlying, JsonLinesMessages):
+            self._underlying.error(f"{command}: {str(e)}")
+        else:
+            print(f"Error: {command}: {str(e)}")
+
     def __getattr__(
         self,
         attr: str,
@@ -22,6 +22,9 @@ _DEV = os.getenv("ENVIRONMENT", "") == "DEVELOPMENT"
 SCANNER_COMMANDS: List[str] = [
     "rl-scan",
     "rl-scan-url",
+    "rl-scan-batch",
+    "rl-scan-serve",
+    "rl-wait",
     # "rl-scan-purl",
     # "rl-scan-docker",
 ]
@@ -35,8 +38,95 @@ DEFAULT_ATTEMPT_TIMEOUT_MIN = 20
 
 # IN SECONDS
 ATTEMPT_TIMEOUT_SEC: int = 30
+POLL_FIRST_DELAY_SEC: float = 2.0
+POLL_MIN_INTERVAL_SEC: float = 2.0
+POLL_MAX_INTERVAL_SEC: float = 300.0
+POLL_BACKOFF_FACTOR: float = 1.5
+POLL_JITTER: float = 0.2  # +/- 20%
+POLL_ELAPSED_FRACTION: float = 0.1  # poll at least every 10% of the time already waited
 REQUEST_TIMEOUT = 600  # 10 minutes
 
+# HTTP transport, can be tuned with RLSECURE_HTTP_POOL_SIZE, RLSECURE_HTTP_RETRIES, RLSECURE_HTTP_BACKOFF
+HTTP_POOL_SIZE: int = 32
+HTTP_RETRIES: int = 5
+HTTP_BACKOFF_FACTOR: float = 1.0
+HTTP_BACKOFF_MAX: float = 60.0
+HTTP_BACKOFF_JITTER: float = 1.0
+HTTP_RETRY_STATUS: List[int] = [429, 500, 502, 503, 504]
+
+# request scheduler shared by all scans of a process, the rate can be tuned with RLSECURE_HTTP_RATE
+SCHEDULER_RATE: float = 20.0  # requests per second and endpoint, until the Portal announces its own limit
+SCHEDULER_MIN_RATE: float = 0.2
+SCHEDULER_RATE_STEP: float = 0.5  # added per successful request after throttling
+SCHEDULER_BACKOFF_SEC: float = 5.0  # on 429 without Retry-After or reset header
+SCHEDULER_RETRIES: int = 10  # requests rejected with 429 and sent again
+SCHEDULER_WAKEUP_SEC: float = 0.05
+
+DEFAULT_BATCH_WORKERS: int = 4
+MAX_BATCH_WORKERS: int = 32
+MAX_ASYNC_BATCH_WORKERS: int = 256
+
+SERVE_DEFAULT_SOCKET: str = "/tmp/rl-scan-serve.sock"
+SERVE_QUEUE_SIZE: int = 10000
+SERVE_MAX_JOBS: int = 10000  # jobs kept for status queries, the oldest finished are dropped first
+SERVE_MAX_REQUEST_SIZE: int = 1024 * 1024
+
+UPLOAD_BUFFER_SIZE: int = 1024 * 1024  # 1M
+UPLOAD_PROGRESS_INTERVAL_SEC: float = 10.0
+UPLOAD_RETRIES: int = 3
+UPLOAD_RETRY_BACKOFF_SEC: float = 10.0
+UPLOAD_STATE_DIR: str = "uploads"  # below the --cache-dir, or the temp directory
+# buffered: read into python buffers (default); zero-copy: os.sendfile without tls, a mmap view with tls
+UPLOAD_ENGINES: List[str] = ["buffered", "zero-copy"]
+
+SCAN_CACHE_FILE: str = "scan-cache.json"
+SCAN_CACHE_TTL_SEC: int = 24 * 60 * 60  # 1 day
+SCAN_CACHE_MAX_ENTRIES: int = 1000
+
+URL_CACHE_FILE: str = "url-cache.json"
+URL_CACHE_TTL_SEC: int = 7 * 24 * 60 * 60  # 7 days, covers weekly jobs
+URL_CACHE_MAX_ENTRIES: int = 1000
+URL_FINGERPRINT_TIMEOUT: int = 30
+
+REPORT_CACHE_FILE: str = "report-cache.json"
+REPORT_CACHE_DIR: str = "reports"  # the cached report files, named by their sha256
+REPORT_CACHE_TTL_SEC: int = 7 * 24 * 60 * 60  # 7 days, entries are revalidated with the Portal anyway
+REPORT_CACHE_MAX_ENTRIES: int = 1000
+REPORT_CACHE_PRUNE_AGE_SEC: int = 60  # unreferenced files younger than this may still get their entry
+
+JOURNAL_FILE: str = "journal.sqlite"
+JOURNAL_TIMEOUT_SEC: float = 30.0  # waiting for the lock of another process writing the journal
+# the lifecycle of a scan job in the journal, in order
+JOURNAL_PHASES: List[str] = ["uploading", "submitted", "analysing", "verdict", "exported", "done"]
+
+VERSION_INDEX_FILE: str = "version-index.json"
+VERSION_INDEX_TTL_SEC: int = 5 * 60
+VERSION_INDEX_MAX_ENTRIES: int = 1000
+
+JSON_STREAM_CHUNK_SIZE: int = 64 * 1024
+JSON_STREAM_DRAIN_LIMIT: int = 1024 * 1024  # a larger rest of a response is not read, the connection is closed
+SCAN_STATUS_PATH: str = "analysis.report.info.summary.scan_status"
+PORTAL_REFERENCE_PATH: str = "analysis.report.info.portal.reference"
+
+REPORT_SUMMARY_FILE: str = "scan-summary.json"
+SEVERITY_ORDER: List[str] = ["critical", "high", "medium", "low", "info", "none", "unknown"]
+
+MESSAGES_FLUSH_INTERVAL_SEC: float = 1.0  # for the buffered jsonl messages
+
+METRICS_PREFIX: str = "rl_scanner"
+METRICS_OTHER_PHASE: str = "other"  # http calls outside of a progress block
+
+DIGEST_ALGORITHMS: List[str] = ["sha256", "sha1", "md5"]
+DIGESTS_FILE: str = "artifact.digests.json"
+
 DOWNLOAD_CHUNK_SIZE: int = 16 * 1024  # 16k
+MAX_DOWNLOAD_CHUNK_SIZE: int = 4 * 1024 * 1024  # 4M
+EXPORT_WORKERS: int = 4
+DOWNLOAD_WORKERS: int = 4  # parallel ranges of one rl-safe archive
+DOWNLOAD_PART_SIZE: int = 16 * 1024 * 1024  # 16M
+DOWNLOAD_PART_RETRIES: int = 3
+DOWNLOAD_BUFFER_SIZE: int = 1024 * 1024  # 1M
+DOWNLOAD_PART_SUFFIX: str = ".rl-download.part"
+DOWNLOAD_STATE_SUFFIX: str = ".rl-download.json"
 
 DEFAULT_DOMAIN: str = "secure.software"
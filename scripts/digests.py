@@ -0,0 +1,81 @@
+import hashlib
+import json
+import os
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+)
+
+from archive import (
+    artifact_stat,
+    open_artifact,
+)
+from cimessages import reporter
+
+from constants import (
+    DIGEST_ALGORITHMS,
+    DIGESTS_FILE,
+    UPLOAD_BUFFER_SIZE,
+)
+
+
+def new_hashers(
+    algorithms: List[str],
+) -> Dict[str, Any]:
+    return {name: hashlib.new(name, usedforsecurity=False) for name in algorithms}
+
+
+def hexdigests(
+    hashers: Dict[str, Any],
+) -> Dict[str, str]:
+    return {name: hasher.hexdigest() for name, hasher in hashers.items()}
+
+
+def file_digests(
+    file_path: str,
+    algorithms: List[str],
+    buffer_size: int = UPLOAD_BUFFER_SIZE,
+) -> Dict[str, str]:
+    # of the uploaded content: a directory is hashed as its archive, which is the same for the same tree
+    hashers = new_hashers(algorithms)
+    f, _ = open_artifact(file_path, buffer_size)
+    with f:
+        while chunk := f.read(buffer_size):
+            for hasher in hashers.values():
+                hasher.update(chunk)
+    return hexdigests(hashers)
+
+
+def digest_algorithms(
+    want_digests: Optional[bool],
+) -> List[str]:
+    # the scan cache needs sha256 only, --digests asks for all of them
+    return list(DIGEST_ALGORITHMS) if want_digests else ["sha256"]
+
+
+def report_digests(
+    file_path: str,
+    file_name: str,
+    purl: str,
+    digests: Dict[str, str],
+    report_path: Optional[str],
+) -> None:
+    for name in DIGEST_ALGORITHMS:
+        if name in digests:
+            reporter.with_prefix(f"Digest {name}", digests[name])
+
+    if not report_path:
+        return
+
+    sidecar = {
+        "purl": purl,
+        "file_name": file_name,
+        "size": artifact_stat(file_path)[0],
+        "digests": digests,
+    }
+    tmp_path = os.path.join(report_path, f".{DIGESTS_FILE}.{os.getpid()}.part")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(sidecar, f, indent=2)
+    os.replace(tmp_path, os.path.join(report_path, DIGESTS_FILE))
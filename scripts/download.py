@@ -0,0 +1,284 @@
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from dataclasses import (
+    dataclass,
+    field,
+)
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from requests import Response
+from requests.exceptions import (
+    ChunkedEncodingError,
+    ConnectionError,  # pylint: disable=redefined-builtin
+    Timeout,
+)
+
+from cimessages import reporter
+from digests import file_digests
+from transport import Transport
+from upload import UploadProgress
+
+from constants import (
+    DOWNLOAD_BUFFER_SIZE,
+    DOWNLOAD_PART_RETRIES,
+    DOWNLOAD_PART_SIZE,
+    DOWNLOAD_PART_SUFFIX,
+    DOWNLOAD_STATE_SUFFIX,
+    DOWNLOAD_WORKERS,
+)
+
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+# a single part S3 upload has the md5 of the content as its ETag, multipart ETags end with -<parts>
+_MD5_ETAG = re.compile(r'^"?([0-9a-fA-F]{32})"?$')
+
+
+@dataclass
+class _Probe:
+    size: int
+    etag: Optional[str] = None
+    ranges: bool = False
+
+
+@dataclass
+class _DownloadState:
+    size: int
+    etag: Optional[str]
+    part_size: int
+    done: Set[int] = field(default_factory=set)
+
+    def to_dict(
+        self,
+    ) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "etag": self.etag,
+            "part_size": self.part_size,
+            "done": sorted(self.done),
+        }
+
+
+def _paths(
+    target_path: str,
+) -> Tuple[str, str]:
+    # hidden partial file and state next to the target, a rerun with the same report path resumes from them
+    directory, name = os.path.split(os.path.abspath(target_path))
+    return (
+        os.path.join(directory, f".{name}{DOWNLOAD_PART_SUFFIX}"),
+        os.path.join(directory, f".{name}{DOWNLOAD_STATE_SUFFIX}"),
+    )
+
+
+def _read_state(
+    state_path: str,
+    probe: _Probe,
+    part_size: int,
+) -> _DownloadState:
+    state = _DownloadState(size=probe.size, etag=probe.etag, part_size=part_size)
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        return state
+
+    # the same content (size and ETag) cut into the same parts, otherwise start over
+    if isinstance(previous, dict) and all(
+        previous.get(k) == v for k, v in [("size", probe.size), ("etag", probe.etag), ("part_size", part_size)]
+    ):
+        state.done = {int(i) for i in previous.get("done", [])}
+    return state
+
+
+def _write_state(
+    state_path: str,
+    state: _DownloadState,
+) -> None:
+    tmp_path = f"{state_path}.{os.getpid()}.part"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state.to_dict(), f)
+    os.replace(tmp_path, state_path)
+
+
+def _probe(
+    transport: Transport,
+    url: str,
+) -> Tuple[_Probe, Response]:
+    # a one byte range GET instead of HEAD: presigned download links are usually only valid for GET;
+    # a server without range support answers 200 and that response is used for a plain download
+    response = transport.get(url, headers={"Range": "bytes=0-0"}, stream=True)
+    if not response.ok:
+        response.close()
+        raise RuntimeError(f"Download failed: {response.status_code}")
+
+    etag = response.headers.get("ETag")
+    match = _CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+    if response.status_code == 206 and match and match.group(3) != "*":
+        return _Probe(size=int(match.group(3)), etag=etag, ranges=True), response
+
+    return _Probe(size=int(response.headers.get("Content-Length") or -1), etag=etag), response
+
+
+class _RangeDownload:
+    def __init__(
+        self,
+        transport: Transport,
+        url: str,
+        fd: int,
+        state: _DownloadState,
+        state_path: str,
+        progress: UploadProgress,
+    ) -> None:
+        self.transport = transport
+        self.url = url
+        self.fd = fd
+        self.state = state
+        self.state_path = state_path
+        self.progress = progress
+        self.lock = threading.Lock()
+
+    def _fetch(
+        self,
+        start: int,
+        end: int,
+        last_attempt: bool,
+    ) -> int:
+        # returns the offset up to which the range was written, a broken connection ends the range early
+        headers = {"Range": f"bytes={start}-{end}"}
+        if self.state.etag and not self.state.etag.startswith("W/"):
+            headers["If-Range"] = self.state.etag
+
+        offset = start
+        try:
+            with self.transport.get(self.url, headers=headers, stream=True) as response:
+                match = _CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+                if response.status_code != 206 or not match or int(match.group(1)) != start:
+                    # a 200 after If-Range means the content changed since the download started
+                    raise RuntimeError(
+                        f"Download failed: no range {start}-{end} in the response ({response.status_code})"
+                    )
+
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_BUFFER_SIZE):
+                    chunk = chunk[: end + 1 - offset]
+                    os.pwrite(self.fd, chunk, offset)
+                    offset += len(chunk)
+                    with self.lock:
+                        self.progress.update(len(chunk))
+        except (ConnectionError, Timeout, ChunkedEncodingError) as e:
+            if last_attempt:
+                raise
+            reporter.info(f"Download of bytes {offset}-{end} interrupted, retrying: {e}")
+        return offset
+
+    def part(
+        self,
+        index: int,
+    ) -> None:
+        start = index * self.state.part_size
+        end = min(start + self.state.part_size, self.state.size) - 1
+
+        # an interrupted range continues where it stopped
+        attempts = 1 + DOWNLOAD_PART_RETRIES
+        for attempt in range(1, attempts + 1):
+            start = self._fetch(start, end, last_attempt=attempt == attempts)
+            if start > end:
+                break
+        else:
+            raise RuntimeError(f"Download failed: bytes {start}-{end} are missing")
+
+        with self.lock:
+            self.state.done.add(index)
+            _write_state(self.state_path, self.state)
+
+
+def _verify(
+    part_path: str,
+    probe: _Probe,
+) -> None:
+    size = os.path.getsize(part_path)
+    if probe.size >= 0 and size != probe.size:
+        raise RuntimeError(f"Download incomplete: {size} of {probe.size} bytes")
+
+    match = _MD5_ETAG.match(probe.etag or "")
+    if match and file_digests(part_path, ["md5"])["md5"] != match.group(1).lower():
+        raise RuntimeError("Download corrupt: the md5 does not match the ETag")
+
+
+def _plain_download(
+    response: Response,
+    part_path: str,
+    progress: UploadProgress,
+) -> None:
+    with response, open(part_path, "wb") as f:
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_BUFFER_SIZE):
+            f.write(chunk)
+            progress.update(len(chunk))
+
+
+def download_file(
+    transport: Transport,
+    url: str,
+    target_path: str,
+    workers: int = DOWNLOAD_WORKERS,
+    part_size: int = DOWNLOAD_PART_SIZE,
+) -> int:
+    # parallel byte ranges into a preallocated file when the server supports them, one stream otherwise;
+    # finished parts are recorded, so a failed download continues with the missing parts on the next run.
+    # The target only appears after the size (and the md5 of a plain ETag) matched. Returns the size.
+    part_path, state_path = _paths(target_path)
+    probe, response = _probe(transport, url)
+    progress = UploadProgress(max(probe.size, 0), label=f"Download {os.path.basename(target_path)}")
+
+    if not probe.ranges:
+        _plain_download(response, part_path, progress)
+    else:
+        response.close()
+        state = _read_state(state_path, probe, part_size)
+        if not os.path.isfile(part_path) or os.path.getsize(part_path) != probe.size:
+            # the recorded parts are only in a partial file of the full size, a missing or truncated one
+            # would be filled up with zeros that pass the size check
+            state.done = set()
+        parts: List[int] = [i for i in range(-(-probe.size // part_size)) if i not in state.done]
+        if state.done:
+            reporter.info(
+                f"Resuming download of {target_path}: {len(parts)} of {len(parts) + len(state.done)} parts left"
+            )
+            progress.update(probe.size - sum(min(part_size, probe.size - i * part_size) for i in parts))
+        else:
+            _write_state(state_path, state)
+
+        fd = os.open(part_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # reserve the space up front, the parts are written in place at their offset
+            os.ftruncate(fd, probe.size)
+            download = _RangeDownload(transport, url, fd, state, state_path, progress)
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(parts)))) as executor:
+                # the ranges count to the metrics phase of the caller
+                for future in [executor.submit(copy_context().run, download.part, i) for i in parts]:
+                    future.result()
+        finally:
+            os.close(fd)
+
+    reporter.progress(progress.message())
+    try:
+        _verify(part_path, probe)
+    except RuntimeError:
+        # a corrupt or short file is not worth resuming
+        for path in [part_path, state_path]:
+            if os.path.exists(path):
+                os.unlink(path)
+        raise
+
+    os.replace(part_path, target_path)
+    if os.path.exists(state_path):
+        os.unlink(state_path)
+    return os.path.getsize(target_path)
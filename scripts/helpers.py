@@ -6,6 +6,8 @@ from typing import (
 from constants import (
     REPORT_FORMATS,
     DEFAULT_DOMAIN,
+    DOWNLOAD_PART_SUFFIX,
+    DOWNLOAD_STATE_SUFFIX,
 )
 
 
@@ -121,3 +123,10 @@ def get_default_report_name(
         return str(REPORT_FORMATS.get(report_format))
 
     assert False  # to get rid of mypy no return code
+
+
+def is_download_leftover(
+    name: str,
+) -> bool:
+    # the partial file and state of an interrupted rl-safe download, kept to resume it
+    return name.startswith(".") and (name.endswith(DOWNLOAD_PART_SUFFIX) or name.endswith(DOWNLOAD_STATE_SUFFIX))
@@ -0,0 +1,176 @@
+import os
+import sqlite3
+import time
+from typing import (
+    Any,
+    Dict,
+    Optional,
+)
+
+from constants import (
+    JOURNAL_FILE,
+    JOURNAL_PHASES,
+    JOURNAL_TIMEOUT_SEC,
+)
+
+# one row per run of a scan, with the time each phase was reached, e.g. for throughput statistics:
+#   SELECT count(*), avg(verdict_at - submitted_at) FROM jobs WHERE phase = 'done'
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    purl TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    phase TEXT NOT NULL,
+    scan_status TEXT,
+    report_url TEXT,
+    exit_code INTEGER,
+    {", ".join(f"{phase}_at REAL" for phase in JOURNAL_PHASES)}
+);
+CREATE INDEX IF NOT EXISTS jobs_purl ON jobs (purl, id);
+"""
+
+
+def _connect(
+    journal_dir: str,
+) -> sqlite3.Connection:
+    os.makedirs(journal_dir, exist_ok=True)
+    db = sqlite3.connect(
+        os.path.join(journal_dir, JOURNAL_FILE),
+        timeout=JOURNAL_TIMEOUT_SEC,
+        isolation_level=None,
+    )
+    db.row_factory = sqlite3.Row
+    # the default rollback journal, WAL needs shared memory that a network mount may not provide;
+    # each phase is on disk before the next one starts
+    db.execute("PRAGMA synchronous = FULL")
+    db.executescript(_SCHEMA)
+    return db
+
+
+class JournalJob:
+    # the journal row of this run; phase is where an earlier run of the same scan stopped, "uploading" when new
+    def __init__(
+        self,
+        db: sqlite3.Connection,
+        row: sqlite3.Row,
+    ) -> None:
+        self.db: sqlite3.Connection = db
+        self.id: int = 0
+        self.phase: str = ""
+        self.submitted_at: Optional[float] = None
+        self._load(row)
+
+    def _load(
+        self,
+        row: sqlite3.Row,
+    ) -> None:
+        self.id = int(row["id"])
+        self.phase = str(row["phase"])
+        self.submitted_at = row["submitted_at"]
+
+    def reached(
+        self,
+        phase: str,
+    ) -> bool:
+        return JOURNAL_PHASES.index(self.phase) >= JOURNAL_PHASES.index(phase)
+
+    def advance(
+        self,
+        phase: str,
+        **fields: Any,
+    ) -> None:
+        # phase names come from JOURNAL_PHASES and the field names from the callers, never from input.
+        # A resumed job passes its phases again, each keeps the time it was first reached
+        assert phase in JOURNAL_PHASES
+        values: Dict[str, Any] = {"phase": phase, **fields}
+        columns = "".join(f"{name} = ?, " for name in values)
+        self.db.execute(
+            f"UPDATE jobs SET {columns}{phase}_at = coalesce({phase}_at, ?) WHERE id = ?",
+            [*values.values(), time.time(), self.id],
+        )
+        self.phase = phase
+
+    def restart(
+        self,
+    ) -> None:
+        # a new job for the same file, e.g. when the version of a resumed one is gone from the Portal
+        row = self.db.execute("SELECT * FROM jobs WHERE id = ?", [self.id]).fetchone()
+        self._load(_insert(self.db, row["purl"], row["file_path"], row["size"], row["mtime_ns"]))
+
+    def close(
+        self,
+    ) -> None:
+        self.db.close()
+
+
+def _insert(
+    db: sqlite3.Connection,
+    purl: str,
+    file_path: str,
+    size: int,
+    mtime_ns: int,
+) -> sqlite3.Row:
+    cursor = db.execute(
+        "INSERT INTO jobs (purl, file_path, size, mtime_ns, phase, uploading_at) VALUES (?, ?, ?, ?, ?, ?)",
+        [purl, file_path, size, mtime_ns, "uploading", time.time()],
+    )
+    row: sqlite3.Row = db.execute("SELECT * FROM jobs WHERE id = ?", [cursor.lastrowid]).fetchone()
+    return row
+
+
+def _submitted_row(
+    db: sqlite3.Connection,
+    purl: str,
+    file_path: str,
+    size: int,
+    mtime_ns: int,
+) -> Optional[sqlite3.Row]:
+    # the last unfinished job of this purl when it had submitted the same file
+    row: Optional[sqlite3.Row] = db.execute(
+        "SELECT * FROM jobs WHERE purl = ? ORDER BY id DESC LIMIT 1",
+        [purl],
+    ).fetchone()
+    if (
+        row is None
+        or row["phase"] in ["uploading", "done"]
+        or row["file_path"] != file_path
+        or row["size"] != size
+        or row["mtime_ns"] != mtime_ns
+    ):
+        return None
+    return row
+
+
+def submitted_job(
+    journal_dir: str,
+    purl: str,
+    file_path: str,
+    size: int,
+    mtime_ns: int,
+) -> bool:
+    # whether open_job will resume a submitted job, without recording a new one
+    if not os.path.exists(os.path.join(journal_dir, JOURNAL_FILE)):
+        return False
+    db = _connect(journal_dir)
+    try:
+        return _submitted_row(db, purl, os.path.abspath(file_path), size, mtime_ns) is not None
+    finally:
+        db.close()
+
+
+def open_job(
+    journal_dir: str,
+    purl: str,
+    file_path: str,
+    size: int,
+    mtime_ns: int,
+) -> JournalJob:
+    # the last unfinished job of this purl when it had submitted the same file, otherwise a new one
+    file_path = os.path.abspath(file_path)
+    db = _connect(journal_dir)
+    row = _submitted_row(db, purl, file_path, size, mtime_ns)
+    if row is None:
+        row = _insert(db, purl, file_path, size, mtime_ns)
+    return JournalJob(db, row)
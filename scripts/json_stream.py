@@ -0,0 +1,344 @@
+import codecs
+import json
+import re
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from requests import Response
+
+from constants import (
+    JSON_STREAM_CHUNK_SIZE,
+    JSON_STREAM_DRAIN_LIMIT,
+)
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# possessive quantifiers (python 3.11+) keep the skipping linear, nothing is ever backtracked into
+_STRING = r'"[^"\\]*+(?:\\.[^"\\]*+)*+"'
+_STRING_RE = re.compile(_STRING, re.S)
+_FLAT = r'[\[{](?:[^"\[\]{}]++|' + _STRING + r")*+[\]}]"
+_NESTED = r'[\[{](?:[^"\[\]{}]++|' + _STRING + "|" + _FLAT + r")*+[\]}]"
+# everything up to the next bracket that is not part of a complete string or a container of at most
+# two levels (a list element like {"cves": [...]}); only the remaining brackets are counted in python
+_SKIP_RE = re.compile(r'(?:[^"\[\]{}]++|' + _STRING + "|" + _NESTED + r")*+", re.S)
+_STRING_SPECIAL = re.compile(r'["\\]')
+_SCALAR = re.compile(r"[^ \t\n\r,\]}]+")
+
+
+class _AllFound(Exception):
+    pass
+
+
+class _Scanner:
+    # a pull parser over a stream of byte chunks, it only keeps the unconsumed part of the current chunk
+    # (or of the value being captured) in memory
+
+    def __init__(
+        self,
+        chunks: Iterable[bytes],
+    ) -> None:
+        self.chunks: Iterator[bytes] = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf: str = ""
+        self.pos: int = 0
+        self.mark: Optional[int] = None
+        self.eof: bool = False
+
+    def _fill(
+        self,
+    ) -> bool:
+        if self.eof:
+            return False
+
+        keep = self.pos if self.mark is None else self.mark
+        self.buf = self.buf[keep:]
+        self.pos -= keep
+        if self.mark is not None:
+            self.mark -= keep
+
+        for chunk in self.chunks:
+            text = self.decoder.decode(chunk)
+            if text:
+                self.buf += text
+                return True
+
+        self.eof = True
+        self.buf += self.decoder.decode(b"", final=True)
+        return False
+
+    def _need_more(
+        self,
+    ) -> None:
+        if not self._fill():
+            raise ValueError("Unexpected end of json document")
+
+    def peek(
+        self,
+    ) -> str:
+        while True:
+            match = _WHITESPACE.match(self.buf, self.pos)
+            assert match is not None
+            self.pos = match.end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(
+        self,
+        char: str,
+    ) -> None:
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' at json offset {self.pos}")
+        self.pos += 1
+
+    def read_string(
+        self,
+    ) -> str:
+        # keys and wanted values are short, a string that does not fit the buffer is simply read again
+        self.peek()
+        while True:
+            match = _STRING_RE.match(self.buf, self.pos)
+            if match is not None:
+                self.pos = match.end()
+                return str(json.loads(match.group()))
+            self._need_more()
+
+    def _skip_string(
+        self,
+    ) -> None:
+        self.pos += 1
+        while True:
+            match = _STRING_SPECIAL.search(self.buf, self.pos)
+            if match is None:
+                self.pos = len(self.buf)
+                self._need_more()
+            elif match.group() == '"':
+                self.pos = match.end()
+                return
+            elif match.end() < len(self.buf):
+                self.pos = match.end() + 1
+            else:
+                self.pos = match.start()
+                self._need_more()
+
+    def _skip_scalar(
+        self,
+    ) -> None:
+        while True:
+            match = _SCALAR.match(self.buf, self.pos)
+            if match is None:
+                raise ValueError(f"Unexpected character at json offset {self.pos}")
+            if match.end() < len(self.buf) or self.eof:
+                self.pos = match.end()
+                return
+            self._fill()
+
+    def skip_value(
+        self,
+    ) -> None:
+        char = self.peek()
+        if char == '"':
+            self._skip_string()
+            return
+        if char == "" or char not in "[{":
+            self._skip_scalar()
+            return
+
+        # the opening bracket by hand, the regex would otherwise run past the end of a small container
+        self.pos += 1
+        depth = 1
+        while True:
+            match = _SKIP_RE.match(self.buf, self.pos)
+            assert match is not None
+            self.pos = match.end()
+            if self.pos >= len(self.buf):
+                self._need_more()
+                continue
+
+            char = self.buf[self.pos]
+            if char == '"':
+                # a string that continues in the next chunk
+                self._skip_string()
+                continue
+
+            self.pos += 1
+            depth += 1 if char in "[{" else -1
+            if depth == 0:
+                return
+
+    def read_value(
+        self,
+    ) -> Any:
+        self.peek()
+        self.mark = self.pos
+        try:
+            self.skip_value()
+            return json.loads(self.buf[self.mark : self.pos])
+        finally:
+            self.mark = None
+
+
+_MISSING = object()
+
+
+def _lookup(
+    value: Any,
+    path: Tuple[str, ...],
+) -> Any:
+    for key in path:
+        if not isinstance(value, dict) or key not in value:
+            return _MISSING
+        value = value[key]
+    return value
+
+
+def _walk(
+    scanner: _Scanner,
+    path: Tuple[str, ...],
+    wanted: Dict[Tuple[str, ...], str],
+    prefixes: Set[Tuple[str, ...]],
+    found: Dict[str, Any],
+) -> None:
+    scanner.expect("{")
+    if scanner.peek() == "}":
+        scanner.pos += 1
+        return
+
+    while True:
+        key = scanner.read_string()
+        scanner.expect(":")
+        child = path + (key,)
+        if child in wanted and wanted[child] not in found:
+            value = scanner.read_value()
+            found[wanted[child]] = value
+            # wanted paths below this one are taken from the value itself
+            for other, name in wanted.items():
+                if other[: len(child)] == child and other != child and name not in found:
+                    nested = _lookup(value, other[len(child) :])
+                    if nested is not _MISSING:
+                        found[name] = nested
+            if len(found) == len(wanted):
+                raise _AllFound()
+        elif child in prefixes and scanner.peek() == "{":
+            _walk(scanner, child, wanted, prefixes, found)
+        else:
+            scanner.skip_value()
+
+        char = scanner.peek()
+        scanner.pos += 1
+        if char == "}":
+            return
+        if char != ",":
+            raise ValueError(f"Expected ',' or '}}' at json offset {scanner.pos - 1}")
+
+
+def extract_paths(
+    chunks: Iterable[bytes],
+    paths: Dict[str, str],
+) -> Dict[str, Any]:
+    # values of dotted object paths ("analysis.report.info.summary.scan_status") keyed by name;
+    # parsing stops as soon as all of them are found, subtrees off the paths are skipped without building them
+    wanted = {tuple(path.split(".")): name for name, path in paths.items()}
+    prefixes = {path[:i] for path in wanted for i in range(1, len(path))}
+    found: Dict[str, Any] = {}
+
+    scanner = _Scanner(chunks)
+    if scanner.peek() != "{":
+        return found
+    try:
+        _walk(scanner, (), wanted, prefixes, found)
+    except _AllFound:
+        pass
+    return found
+
+
+def _matches(
+    pattern: Tuple[str, ...],
+    path: Tuple[str, ...],
+) -> bool:
+    return len(pattern) >= len(path) and all(want in ("*", key) for want, key in zip(pattern, path))
+
+
+def _iter_members(
+    scanner: _Scanner,
+    path: Tuple[str, ...],
+    patterns: Dict[Tuple[str, ...], str],
+) -> Iterator[Tuple[str, Any]]:
+    # the members of an object (key) or the elements of an array ("*" in the path)
+    close = "}" if scanner.peek() == "{" else "]"
+    scanner.pos += 1
+    if scanner.peek() == close:
+        scanner.pos += 1
+        return
+
+    while True:
+        if close == "}":
+            key = scanner.read_string()
+            scanner.expect(":")
+        else:
+            key = "*"
+        child = path + (key,)
+
+        name = next(
+            (name for pattern, name in patterns.items() if len(pattern) == len(child) and _matches(pattern, child)),
+            None,
+        )
+        if name is not None:
+            yield name, scanner.read_value()
+        elif any(_matches(pattern, child) for pattern in patterns) and scanner.peek() in ("{", "["):
+            yield from _iter_members(scanner, child, patterns)
+        else:
+            scanner.skip_value()
+
+        char = scanner.peek()
+        scanner.pos += 1
+        if char == close:
+            return
+        if char != ",":
+            raise ValueError(f"Expected ',' or '{close}' at json offset {scanner.pos - 1}")
+
+
+def iter_items(
+    chunks: Iterable[bytes],
+    paths: Dict[str, str],
+) -> Iterator[Tuple[str, Any]]:
+    # (name, value) for every value at one of the dotted paths, in document order; "*" stands for any
+    # array element or object member, e.g. "runs.*.results.*". Only one item is held in memory at a time.
+    patterns = {tuple(path.split(".")): name for name, path in paths.items()}
+
+    scanner = _Scanner(chunks)
+    if scanner.peek() not in ("{", "["):
+        raise ValueError("Expected a json object or array")
+    yield from _iter_members(scanner, (), patterns)
+
+
+def release(
+    response: Response,
+    chunks: Optional[Iterator[bytes]] = None,
+) -> None:
+    # read a small rest so the connection goes back to the pool, close it when a large rest is left
+    drained = 0
+    for chunk in chunks if chunks is not None else response.iter_content(JSON_STREAM_CHUNK_SIZE):
+        drained += len(chunk)
+        if drained > JSON_STREAM_DRAIN_LIMIT:
+            response.close()
+            return
+
+
+def extract_from_response(
+    response: Response,
+    paths: Dict[str, str],
+) -> Dict[str, Any]:
+    # use with a response requested with stream=True, otherwise the body is already in memory
+    chunks = response.iter_content(JSON_STREAM_CHUNK_SIZE)
+    try:
+        return extract_paths(chunks, paths)
+    finally:
+        release(response, chunks)
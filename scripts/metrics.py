@@ -0,0 +1,215 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import (
+    dataclass,
+    field,
+)
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+)
+
+from constants import (
+    METRICS_PREFIX,
+    METRICS_OTHER_PHASE,
+)
+
+# the innermost open phase, a context variable: separate per thread and per asyncio task, so the scans of
+# concurrent workers do not count each other's http calls. Pools working for a phase run in a copy of its context
+_current_phase: ContextVar[Optional[str]] = ContextVar("metrics_phase", default=None)
+
+
+def phase_id(
+    name: str,
+) -> str:
+    # "Exporting analysis report" -> "exporting_analysis_report", usable as a label and statistic key
+    return re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_") or METRICS_OTHER_PHASE
+
+
+@dataclass
+class PhaseMetrics:
+    name: str
+    duration_sec: float = 0.0
+    http_sec: float = 0.0  # time in requests; for streamed responses until the headers arrived
+    http_calls: int = 0
+    http_retries: int = 0
+    http_status: Counter[str] = field(default_factory=Counter)
+    bytes_sent: int = 0
+    bytes_received: int = 0
+
+    def to_dict(
+        self,
+    ) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "duration_sec": round(self.duration_sec, 3),
+            # what is left of the phase besides http: waiting between polls, hashing, disk
+            "other_sec": round(max(self.duration_sec - self.http_sec, 0.0), 3),
+            "http_sec": round(self.http_sec, 3),
+            "http_calls": self.http_calls,
+            "http_retries": self.http_retries,
+            "http_status": dict(sorted(self.http_status.items())),
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+        }
+
+
+class Metrics:
+    # one collector per process; an http call belongs to the innermost phase open in its context
+    def __init__(
+        self,
+    ) -> None:
+        self.lock = threading.Lock()
+        self.started: float = time.monotonic()
+        self.phases: Dict[str, PhaseMetrics] = {}
+
+    def _phase(
+        self,
+        key: str,
+        name: str,
+    ) -> PhaseMetrics:
+        if key not in self.phases:
+            self.phases[key] = PhaseMetrics(name=name)
+        return self.phases[key]
+
+    @contextmanager
+    def phase(
+        self,
+        name: str,
+    ) -> Iterator[None]:
+        key = phase_id(name)
+        start = time.monotonic()
+        with self.lock:
+            self._phase(key, name)
+        token = _current_phase.set(key)
+        try:
+            yield
+        finally:
+            _current_phase.reset(token)
+            with self.lock:
+                self.phases[key].duration_sec += time.monotonic() - start
+
+    def record_http(
+        self,
+        status: Optional[int],
+        elapsed: float,
+        bytes_sent: int = 0,
+        bytes_received: int = 0,
+        retries: int = 0,
+    ) -> None:
+        key = _current_phase.get() or METRICS_OTHER_PHASE
+        with self.lock:
+            phase = self._phase(key, key)
+            phase.http_calls += 1
+            phase.http_retries += retries
+            phase.http_status[str(status) if status is not None else "error"] += 1
+            phase.http_sec += elapsed
+            phase.bytes_sent += bytes_sent
+            phase.bytes_received += bytes_received
+
+    def to_dict(
+        self,
+        **info: Any,
+    ) -> Dict[str, Any]:
+        with self.lock:
+            phases = {key: phase.to_dict() for key, phase in self.phases.items()}
+        totals: Dict[str, Any] = {
+            "http_calls": sum(phase["http_calls"] for phase in phases.values()),
+            "http_retries": sum(phase["http_retries"] for phase in phases.values()),
+            "bytes_sent": sum(phase["bytes_sent"] for phase in phases.values()),
+            "bytes_received": sum(phase["bytes_received"] for phase in phases.values()),
+        }
+        return info | {
+            "duration_sec": round(time.monotonic() - self.started, 3),
+            "totals": totals,
+            "phases": phases,
+        }
+
+
+metrics = Metrics()
+
+
+def _prometheus_lines(
+    data: Dict[str, Any],
+    command: str,
+) -> List[str]:
+    def gauge(name: str, help_text: str, samples: List[str]) -> List[str]:
+        return [f"# HELP {METRICS_PREFIX}_{name} {help_text}", f"# TYPE {METRICS_PREFIX}_{name} gauge"] + samples
+
+    def sample(name: str, value: Any, **labels: str) -> str:
+        text = ",".join(f'{k}="{v}"' for k, v in ({"command": command} | labels).items())
+        return f"{METRICS_PREFIX}_{name}{{{text}}} {value}"
+
+    phases: Dict[str, Dict[str, Any]] = data["phases"]
+    lines: List[str] = []
+    lines += gauge(
+        "run_duration_seconds", "Wall time of the last run.", [sample("run_duration_seconds", data["duration_sec"])]
+    )
+    lines += gauge("run_exit_code", "Exit code of the last run.", [sample("run_exit_code", data.get("exit_code"))])
+    for name, key, help_text in [
+        ("phase_duration_seconds", "duration_sec", "Wall time per phase of the last run."),
+        ("phase_http_seconds", "http_sec", "Time spent in http requests per phase of the last run."),
+        ("phase_bytes_sent", "bytes_sent", "Bytes sent per phase of the last run."),
+        ("phase_bytes_received", "bytes_received", "Bytes received per phase of the last run."),
+        ("phase_http_retries", "http_retries", "Retried http requests per phase of the last run."),
+    ]:
+        lines += gauge(name, help_text, [sample(name, phase[key], phase=p) for p, phase in phases.items()])
+    lines += gauge(
+        "phase_http_requests",
+        "Http requests per phase and status code of the last run.",
+        [
+            sample("phase_http_requests", n, phase=p, code=code)
+            for p, phase in phases.items()
+            for code, n in phase["http_status"].items()
+        ],
+    )
+    return lines
+
+
+def _write_atomic(
+    path: str,
+    text: str,
+) -> None:
+    # the node exporter textfile collector may read at any time, it must never see a partial file
+    directory, name = os.path.split(os.path.abspath(path))
+    tmp_path = os.path.join(directory, f".{name}.{os.getpid()}.part")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def report_metrics(
+    command: str,
+    exit_code: int,
+    metrics_file: Optional[str] = None,
+    metrics_prometheus: Optional[str] = None,
+    **info: Any,
+) -> None:
+    from cimessages import reporter  # pylint: disable=import-outside-toplevel
+
+    data = metrics.to_dict(command=command, exit_code=exit_code, **info)
+
+    reporter.statistic("duration_sec", data["duration_sec"])
+    for key, value in data["totals"].items():
+        reporter.statistic(key, value)
+    for key, phase in data["phases"].items():
+        for name in ["duration_sec", "http_sec", "http_calls", "bytes_sent", "bytes_received"]:
+            reporter.statistic(f"{key}.{name}", phase[name])
+
+    try:
+        if metrics_file:
+            _write_atomic(metrics_file, json.dumps(data, indent=2) + "\n")
+        if metrics_prometheus:
+            _write_atomic(metrics_prometheus, "\n".join(_prometheus_lines(data, command)) + "\n")
+    except OSError as e:
+        # the scan result counts, not its metrics
+        reporter.error(f"Could not write metrics: {e}")
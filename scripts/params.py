@@ -25,10 +25,21 @@ class Params:  # pylint: disable=too-many-instance-attributes
     report_path: Optional[str] = None
     report_format: Optional[str] = None
     pack_safe: bool = False
+    cache_dir: Optional[str] = None
+    journal_dir: Optional[str] = None
+    report_summary: bool = False
+    report_incremental: bool = False
+    metrics_file: Optional[str] = None
+    metrics_prometheus: Optional[str] = None
 
     # command rl-scan
     file_path: Optional[str] = None
     filename: Optional[str] = None
+    upload_buffer_size: Optional[int] = None  # KiB
+    upload_bandwidth_limit: Optional[float] = None  # MB/s
+    upload_engine: Optional[str] = None  # UPLOAD_ENGINES, None is buffered
+    resumable_upload: bool = False
+    digests: bool = False
 
     # command rl-scan-url
     import_url: Optional[str] = None
@@ -0,0 +1,138 @@
+import random
+import time
+from datetime import (
+    datetime,
+    timezone,
+)
+from email.utils import parsedate_to_datetime
+from typing import (
+    Mapping,
+    Optional,
+)
+
+from constants import (
+    ATTEMPT_TIMEOUT_SEC,
+    POLL_FIRST_DELAY_SEC,
+    POLL_MIN_INTERVAL_SEC,
+    POLL_MAX_INTERVAL_SEC,
+    POLL_BACKOFF_FACTOR,
+    POLL_JITTER,
+    POLL_ELAPSED_FRACTION,
+)
+
+
+def retry_after_sec(
+    headers: Mapping[str, str],
+) -> Optional[float]:
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class PollSchedule:  # pylint: disable=too-many-instance-attributes
+    # wall clock deadline with a fast first probe and growing, jittered intervals;
+    # the interval cap grows with the time already waited, so long analyses are polled less often
+
+    def __init__(
+        self,
+        timeout_sec: float,
+        *,
+        first_delay: float = POLL_FIRST_DELAY_SEC,
+        min_interval: float = POLL_MIN_INTERVAL_SEC,
+        max_interval: float = POLL_MAX_INTERVAL_SEC,
+        base_interval_cap: float = ATTEMPT_TIMEOUT_SEC,
+        factor: float = POLL_BACKOFF_FACTOR,
+        jitter: float = POLL_JITTER,
+    ) -> None:
+        self.started: float = time.monotonic()
+        self.deadline: float = self.started + timeout_sec
+        self.first_delay = first_delay
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.base_interval_cap = base_interval_cap
+        self.factor = factor
+        self.jitter = jitter
+
+        self.interval: float = min_interval
+        self.polls: int = 0
+        self.request_sec: float = 0.0
+        self.last_pending: Optional[float] = None
+
+    def elapsed(
+        self,
+    ) -> float:
+        return time.monotonic() - self.started
+
+    def remaining(
+        self,
+    ) -> float:
+        return self.deadline - time.monotonic()
+
+    def expired(
+        self,
+    ) -> bool:
+        return self.remaining() <= 0
+
+    def _cap(
+        self,
+    ) -> float:
+        return min(max(self.base_interval_cap, self.elapsed() * POLL_ELAPSED_FRACTION), self.max_interval)
+
+    def next_delay(
+        self,
+        retry_after: Optional[float] = None,
+    ) -> float:
+        if self.polls == 0:
+            delay = self.first_delay
+        elif retry_after is not None:
+            delay = retry_after
+        else:
+            delay = self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+            self.interval = min(self.interval * self.factor, self._cap())
+
+        return max(min(delay, self.remaining()), 0.0)
+
+    def wait(
+        self,
+        retry_after: Optional[float] = None,
+    ) -> bool:
+        # sleep until the next probe, returns False when the deadline has passed
+        if self.expired():
+            return False
+        time.sleep(self.next_delay(retry_after))
+        return True
+
+    def record(
+        self,
+        request_start: float,
+        pending: bool,
+    ) -> None:
+        now = time.monotonic()
+        self.polls += 1
+        self.request_sec += now - request_start
+        if pending:
+            self.last_pending = now
+
+    def summary(
+        self,
+    ) -> str:
+        elapsed = self.elapsed()
+        # the analysis finished somewhere between the last pending answer and now
+        detection = elapsed if self.last_pending is None else time.monotonic() - self.last_pending
+        return (
+            f"analysis finished within {elapsed:.1f}s; "
+            + f"polling: {self.polls} requests, {self.request_sec:.1f}s in requests, "
+            + f"up to {detection:.1f}s detection delay"
+        )
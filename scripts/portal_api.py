@@ -4,9 +4,12 @@ from typing import (
     BinaryIO,
     Dict,
     Any,
+    Iterable,
+    Optional,
+    Union,
 )
+from urllib.parse import urljoin
 
-import requests
 from requests import Response
 from requests.exceptions import (
     HTTPError,
@@ -21,6 +24,15 @@ from helpers import (
     get_package_purl,
 )
 from params import Params
+from transport import (
+    Transport,
+    get_transport,
+)
+from version_index import (
+    VersionIndex,
+    cached_version_index,
+    invalidate_version_index,
+)
 
 from constants import (
     REQUEST_TIMEOUT,
@@ -45,26 +57,8 @@ class PortalAPI:
     ) -> None:
         self.params: Params = params
         self.api_token: str = str(os.environ.get("RLPORTAL_ACCESS_TOKEN"))
-        self.proxies: Dict[str, str] = {}
-
-        proxy_server = os.environ.get("RLSECURE_PROXY_SERVER", None)
-        if proxy_server and len(proxy_server) == 0:
-            proxy_server = None
-        proxy_port = os.environ.get("RLSECURE_PROXY_PORT", None)
-        if proxy_port and len(proxy_port) == 0:
-            proxy_port = None
-        proxy_user = os.environ.get("RLSECURE_PROXY_USER", None)
-        if proxy_user and len(proxy_user) == 0:
-            proxy_user = None
-        proxy_password = os.environ.get("RLSECURE_PROXY_PASSWORD", None)
-        if proxy_password and len(proxy_password) == 0:
-            proxy_password = None
-
-        if proxy_server is not None:
-            self.proxies = {
-                "http": f"http://{proxy_user}:{proxy_password}@{proxy_server}:{proxy_port}",
-                "https": f"http://{proxy_user}:{proxy_password}@{proxy_server}:{proxy_port}",
-            }
+        self.transport: Transport = get_transport()
+        self.proxies: Dict[str, str] = self.transport.proxies
 
         # update params.purl, params.force and params.replace if necessary
         self.params.purl = _transform_purl(self.params.purl)
@@ -82,29 +76,23 @@ class PortalAPI:
             self.params.force = False
             return
 
-        response = self.get_package_versions()
-        if response.status_code not in [200, 404, 401]:
-            msg = (
-                f"Error: while validating force and replace parameters: get_package_versions(): {response.status_code}"
-            )
-            raise RuntimeError(msg)
+        try:
+            index = self.get_version_index()
+        except RuntimeError as e:
+            raise RuntimeError(f"Error: while validating force and replace parameters: {e}") from e
 
-        if response.status_code in [404, 401]:
+        if not index.found:
             # if we have no versions at all we dont need replace or force
             self.params.replace = False
             self.params.force = False
             return
 
-        if response.status_code == 200:
-            data = response.json()
-            purl_version = get_version(self.params.purl)
-            version_exists = [version for version in data.get("versions") if version.get("version") == purl_version]
-            if version_exists:
-                # when we have replace:True, we dont need force:True at all
-                self.params.force = False
-            else:
-                # this version does not exist so we dont need replace, but we may need force
-                self.params.replace = False
+        if index.has(get_version(self.params.purl)):
+            # when we have replace:True, we dont need force:True at all
+            self.params.force = False
+        else:
+            # this version does not exist so we dont need replace, but we may need force
+            self.params.replace = False
 
         return
 
@@ -138,7 +126,7 @@ class PortalAPI:
     ) -> None:
         try:
             if self.params.debug:
-                print(url, response.status_code, file=sys.stderr)
+                print(url, response.status_code, self.transport.connection_stats(), file=sys.stderr)
             response.raise_for_status()
         except HTTPError as http_error:
             if self.params.debug:
@@ -163,12 +151,17 @@ class PortalAPI:
             "User-Agent": "rl-scanner-cloud",
         }
 
-    def _do_get(self, url: str) -> Response:
-        return requests.get(
+    def _do_get(
+        self,
+        url: str,
+        stream: bool = False,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Response:
+        return self.transport.get(
             url,
-            headers=self._auth_header(),
-            proxies=self.proxies,
+            headers=self._auth_header() | (headers or {}),
             timeout=REQUEST_TIMEOUT,
+            stream=stream,
         )
 
     # Public
@@ -177,8 +170,9 @@ class PortalAPI:
     def scan_file_version(
         self,
         *,
-        file_stream: BinaryIO,
+        file_stream: Union[BinaryIO, Iterable[bytes]],
         file_name: str,
+        should_exit: bool = True,
     ) -> Response:
         params = self.params
 
@@ -201,10 +195,9 @@ class PortalAPI:
             what="scan",
             path=params.purl,
         )
-        response = requests.post(
+        response = self.transport.post(
             url,
             headers=headers,
-            proxies=self.proxies,
             data=file_stream,
             params=query_params,
             timeout=REQUEST_TIMEOUT,
@@ -213,7 +206,9 @@ class PortalAPI:
         self._check_and_handle_http_error(
             url,
             response,
+            should_exit=should_exit,
         )
+        self._invalidate_version_index(response)
         return response
 
     def scan_import_url_version(
@@ -252,10 +247,9 @@ class PortalAPI:
             path=self.params.purl,
         )
 
-        response = requests.post(
+        response = self.transport.post(
             url,
             headers=headers,
-            proxies=self.proxies,
             json=data,
             params=query_params,
             timeout=REQUEST_TIMEOUT,
@@ -265,17 +259,19 @@ class PortalAPI:
             url,
             response,
         )
+        self._invalidate_version_index(response)
         return response
 
     def get_performed_checks(
         self,
+        stream: bool = False,
     ) -> Response:
         # https://docs.secure.software/api-reference/#tag/Version/operation/getVersionChecks
         url = self._public_api_url_to(
             what="checks",
             path=self.params.purl,
         )
-        response = self._do_get(url)
+        response = self._do_get(url, stream=stream)
         self._check_and_handle_http_error(
             url,
             response,
@@ -285,13 +281,15 @@ class PortalAPI:
     def export_analysis_report(
         self,
         report_format: str,
+        headers: Optional[Dict[str, str]] = None,
     ) -> Response:
         # https://docs.secure.software/api-reference/#tag/Version/operation/getVersionReport
+        # with If-None-Match or If-Modified-Since headers the answer can be 304 Not Modified
         url = self._public_api_url_to(
             what="report",
             path=f"{report_format}/{self.params.purl}",
         )
-        response = self._do_get(url)
+        response = self._do_get(url, stream=True, headers=headers)
         self._check_and_handle_http_error(
             url,
             response,
@@ -317,13 +315,14 @@ class PortalAPI:
 
     def get_analysis_status(
         self,
+        stream: bool = False,
     ) -> Response:
         # https://docs.secure.software/api-reference/#tag/Version/operation/getVersionStatus
         url = self._public_api_url_to(
             what="status",
             path=self.params.purl,
         )
-        response = self._do_get(url)
+        response = self._do_get(url, stream=stream)
         self._check_and_handle_http_error(
             url,
             response,
@@ -331,6 +330,67 @@ class PortalAPI:
         )
         return response
 
+    def version_exists(
+        self,
+        fresh: bool = False,
+    ) -> bool:
+        # fresh: not from a listing cached before an upload whose outcome is unknown
+        if fresh:
+            invalidate_version_index(self._version_index_key(), self.params.cache_dir)
+        try:
+            return self.get_version_index().has(get_version(self.params.purl))
+        except RuntimeError:
+            return False
+
+    def _version_index_key(
+        self,
+    ) -> str:
+        return self._public_api_url_to(
+            what="list",
+            path=get_package_purl(
+                self.params.purl,
+            ),
+        )
+
+    def _fetch_version_index(
+        self,
+    ) -> VersionIndex:
+        # all pages of the version listing, following a "next" Link header or "next" field when the Portal pages it
+        url: Optional[str] = self._version_index_key()
+        index = VersionIndex(package=get_package_purl(self.params.purl))
+        while url:
+            response = self._do_get(url)
+            if response.status_code in [404, 401]:
+                return VersionIndex(package=index.package, found=False)
+            if response.status_code != 200:
+                raise RuntimeError(f"get_package_versions(): {response.status_code}")
+
+            data = response.json()
+            for entry in data.get("versions", []):
+                index.add(entry)
+
+            next_url = response.links.get("next", {}).get("url") or data.get("next")
+            url = urljoin(url, next_url) if next_url else None
+
+        return index
+
+    def get_version_index(
+        self,
+    ) -> VersionIndex:
+        # cached per package for all scans of this process, and in the --cache-dir when given
+        return cached_version_index(
+            self._version_index_key(),
+            self._fetch_version_index,
+            self.params.cache_dir,
+        )
+
+    def _invalidate_version_index(
+        self,
+        response: Response,
+    ) -> None:
+        if response.status_code < 400:
+            invalidate_version_index(self._version_index_key(), self.params.cache_dir)
+
     def get_package_versions(
         self,
     ) -> Response:
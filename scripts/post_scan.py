@@ -1,11 +1,37 @@
-from time import sleep
-import requests
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import (
+    Callable,
+    Optional,
+)
+
+from requests import Response
+
 from cimessages import reporter
+from download import download_file
 from helpers import (
     get_default_report_name,
     parse_report_formats,
 )
+from json_stream import (
+    extract_from_response,
+    release,
+)
+from polling import (
+    PollSchedule,
+    retry_after_sec,
+)
 from portal_api import PortalAPI
+from report_cache import (
+    cached_report,
+    conditional_headers,
+    reuse_report,
+    store_report,
+)
+from scheduler import waiting_since
 
 from constants import (
     _DEV,
@@ -14,16 +40,44 @@ from constants import (
     DEFAULT_ATTEMPT_TIMEOUT_MIN,
     ATTEMPT_TIMEOUT_SEC,
     DOWNLOAD_CHUNK_SIZE,
+    MAX_DOWNLOAD_CHUNK_SIZE,
+    EXPORT_WORKERS,
+    DOWNLOAD_WORKERS,
+    SCAN_STATUS_PATH,
+    PORTAL_REFERENCE_PATH,
 )
 
 
-def get_scan_status(
-    portal: PortalAPI,
+def _poll_until_done(
+    schedule: PollSchedule,
+    request: Callable[[], Response],
+    probe_now: bool = False,
+) -> Optional[Response]:
+    retry_after: Optional[float] = None
+    while probe_now or schedule.wait(retry_after):
+        probe_now = False
+        reporter.info("Attempting to fetch analysis status")
+
+        request_start = time.monotonic()
+        with waiting_since(schedule.started):
+            response = request()
+        pending = response.status_code == 202
+        schedule.record(request_start, pending)
+        if not pending:
+            return response
+
+        release(response)
+        retry_after = retry_after_sec(response.headers)
+
+    return None
+
+
+def clamp_timeout(
     timeout: int,
     lower_attempt_timeout_min: int = LOWER_ATTEMPT_TIMEOUT_MIN,
     upper_attempt_timeout_min: int = UPPER_ATTEMPT_TIMEOUT_MIN,
-    attempt_timeout_sec: int = ATTEMPT_TIMEOUT_SEC,
-) -> str:
+) -> int:
+    # the timeout in minutes, an out of bounds value falls back to the default; also for the async polling
     if _DEV:
         lower_attempt_timeout_min = 1
 
@@ -35,56 +89,112 @@ def get_scan_status(
             Will set it to default {DEFAULT_ATTEMPT_TIMEOUT_MIN} minutes
         """
         )
+    return timeout
 
-    number_of_attempts = (timeout * 60) // attempt_timeout_sec
 
-    while number_of_attempts > 0:
-        reporter.info("Attempting to fetch analysis status")
+def get_scan_status(
+    portal: PortalAPI,
+    timeout: int,
+    lower_attempt_timeout_min: int = LOWER_ATTEMPT_TIMEOUT_MIN,
+    upper_attempt_timeout_min: int = UPPER_ATTEMPT_TIMEOUT_MIN,
+    attempt_timeout_sec: int = ATTEMPT_TIMEOUT_SEC,
+    probe_now: bool = False,
+) -> str:
+    timeout = clamp_timeout(timeout, lower_attempt_timeout_min, upper_attempt_timeout_min)
 
-        sleep(attempt_timeout_sec)
-        response = portal.get_performed_checks()
-        if response.status_code == 202:
-            number_of_attempts -= 1
-            continue
-
-        return str(
-            response.json()
-            .get("analysis", {})
-            .get("report", {})
-            .get("info", {})
-            .get("summary", {})
-            .get("scan_status", "fail")
-        )
+    schedule = PollSchedule(
+        timeout * 60,
+        base_interval_cap=attempt_timeout_sec,
+    )
+
+    # poll the light status endpoint until the analysis is done, then fetch the checks once
+    response = _poll_until_done(schedule, portal.get_analysis_status, probe_now=probe_now)
+    if response is not None:
+        # the checks can be large, only the scan status is parsed out of the stream
+        response = _poll_until_done(schedule, lambda: portal.get_performed_checks(stream=True), probe_now=True)
+
+    if response is None:
+        msg = "Preset timeout time expired"
+        reporter.info(msg)
+        raise RuntimeError(msg)
 
-    msg = "Preset timeout time expired"
-    reporter.info(msg)
-    raise RuntimeError(msg)
+    reporter.info(schedule.summary())
+    fields = extract_from_response(response, {"scan_status": SCAN_STATUS_PATH})
+    return str(fields.get("scan_status", "fail"))
 
 
 def get_analysis_url(
     request_invoker: PortalAPI,
 ) -> str:
-    response = request_invoker.get_analysis_status()
+    response = request_invoker.get_analysis_status(stream=True)
+    fields = extract_from_response(response, {"reference": PORTAL_REFERENCE_PATH})
+    return str(fields.get("reference"))
 
-    return str(
-        response.json()
-        .get(
-            "analysis",
-            {},
-        )
-        .get(
-            "report",
-            {},
-        )
-        .get(
-            "info",
-            {},
-        )
-        .get(
-            "portal",
-            {},
-        )
-        .get("reference"),
+
+def _adaptive_chunk_size(
+    response: Response,
+) -> int:
+    # aim for about 64 writes per report, bounded to keep memory per download small
+    content_length = int(response.headers.get("Content-Length") or 0)
+    return min(max(content_length // 64, DOWNLOAD_CHUNK_SIZE), MAX_DOWNLOAD_CHUNK_SIZE)
+
+
+def _export_one_report(
+    portal: PortalAPI,
+    report_format: str,
+    report_path: str,
+    chunk_size: Optional[int],
+) -> None:
+    reporter.info(f"Started {report_format} export")
+
+    start = time.monotonic()
+    params = portal.params
+    report_filename = get_default_report_name(report_format)
+    target = os.path.join(report_path, report_filename)
+    if params.report_incremental and not params.cache_dir and os.path.isfile(target):
+        reporter.info(f"Kept the {report_format} report already in {report_path}")
+        return
+
+    # with a cache the Portal is asked whether the report changed since it was cached
+    cached = cached_report(params.cache_dir, params.purl, report_format) if params.cache_dir else None
+    response = portal.export_analysis_report(report_format, headers=conditional_headers(cached))
+    if cached and response.status_code == 304:
+        response.close()
+        how = "linked" if reuse_report(cached, target) else "copied"
+        reporter.info(f"Finished {report_format} export: not modified, {how} from the report cache")
+        return
+
+    if not response.ok:
+        response.close()
+        reporter.error(f"Failed {report_format} export: {response.status_code}")
+        return
+
+    # write to a temporary file in the same directory, so the report appears complete or not at all
+    size = 0
+    digest = hashlib.sha256()
+    tmp_path = os.path.join(report_path, f".{report_filename}.{os.getpid()}.part")
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=chunk_size or _adaptive_chunk_size(response)):
+                f.write(chunk)
+                size += len(chunk)
+                if params.cache_dir:
+                    digest.update(chunk)
+        os.replace(tmp_path, target)
+    except BaseException:
+        # open() may have failed before the file existed, the original error counts
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    finally:
+        response.close()
+
+    if params.cache_dir:
+        store_report(params.cache_dir, params.purl, report_format, target, response.headers, digest.hexdigest())
+
+    elapsed = max(time.monotonic() - start, 1e-6)
+    reporter.info(
+        f"Finished {report_format} export: {size} bytes in {elapsed:.2f}s ({size / elapsed / 1024 / 1024:.2f} MB/s)"
     )
 
 
@@ -92,23 +202,30 @@ def export_analysis_report(
     portal: PortalAPI,
     report_formats: str,
     report_path: str,
+    chunk_size: Optional[int] = None,
+    workers: int = EXPORT_WORKERS,
 ) -> None:
-    for report_format in parse_report_formats(report_formats):
-        reporter.info(f"Started {report_format} export")
-
-        report_filename = get_default_report_name(report_format)
-        response = portal.export_analysis_report(report_format)
-        with open(f"{report_path}/{report_filename}", "wb") as f:
-            for chunk in response.iter_content(chunk_size=1024):
-                f.write(chunk)
-
-        reporter.info(f"Finished {report_format} export")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # in copies of the caller's context, the exports count to its metrics phase
+        futures = [
+            executor.submit(
+                copy_context().run,
+                _export_one_report,
+                portal,
+                report_format,
+                report_path,
+                chunk_size,
+            )
+            for report_format in parse_report_formats(report_formats)
+        ]
+        for future in futures:
+            future.result()
 
 
 def export_pack_safe(
     portal: PortalAPI,
     report_path: str,
-    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    workers: int = DOWNLOAD_WORKERS,
 ) -> None:
     response = portal.export_pack_safe()
     data = response.json()
@@ -117,9 +234,13 @@ def export_pack_safe(
 
     reporter.info("Started rl-safe export")
 
-    response = requests.get(download_url, stream=True)
-    with open(f"{report_path}/{report_filename}", mode="wb") as file:
-        for chunk in response.iter_content(chunk_size=chunk_size):
-            file.write(chunk)
+    start = time.monotonic()
+    size = download_file(
+        portal.transport,
+        download_url,
+        os.path.join(report_path, report_filename),
+        workers=workers,
+    )
 
-    reporter.info("Finished rl-safe export")
+    elapsed = max(time.monotonic() - start, 1e-6)
+    reporter.info(f"Finished rl-safe export: {size} bytes in {elapsed:.2f}s ({size / elapsed / 1024 / 1024:.2f} MB/s)")
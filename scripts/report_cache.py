@@ -0,0 +1,158 @@
+import os
+import shutil
+import time
+from typing import (
+    Any,
+    Dict,
+    Mapping,
+    Optional,
+)
+
+from cache import JsonCache
+
+from constants import (
+    REPORT_CACHE_FILE,
+    REPORT_CACHE_DIR,
+    REPORT_CACHE_TTL_SEC,
+    REPORT_CACHE_MAX_ENTRIES,
+    REPORT_CACHE_PRUNE_AGE_SEC,
+)
+
+
+def _report_cache(
+    cache_dir: str,
+) -> JsonCache:
+    return JsonCache(
+        os.path.join(cache_dir, REPORT_CACHE_FILE),
+        ttl_sec=REPORT_CACHE_TTL_SEC,
+        max_entries=REPORT_CACHE_MAX_ENTRIES,
+    )
+
+
+def _key(
+    purl: str,
+    report_format: str,
+) -> str:
+    return f"{purl} {report_format}"
+
+
+def link_or_copy(
+    source: str,
+    target: str,
+) -> bool:
+    # a hard link on the same file system, otherwise a copy; the target is replaced atomically.
+    # Returns True for a link
+    if os.path.exists(target) and os.path.samefile(source, target):
+        return True
+
+    tmp_path = os.path.join(os.path.dirname(target), f".{os.path.basename(target)}.{os.getpid()}.part")
+    if os.path.exists(tmp_path):
+        os.unlink(tmp_path)
+    try:
+        os.link(source, tmp_path)
+        linked = True
+    except OSError:
+        shutil.copyfile(source, tmp_path)
+        linked = False
+    os.replace(tmp_path, target)
+    return linked
+
+
+def cached_report(
+    cache_dir: str,
+    purl: str,
+    report_format: str,
+) -> Optional[Dict[str, Any]]:
+    # the entry of the last export of this report, if its file is still unchanged
+    cache = _report_cache(cache_dir)
+    entry = cache.get(_key(purl, report_format))
+    if entry is None:
+        return None
+
+    try:
+        st = os.stat(entry["path"])
+    except (KeyError, OSError):
+        st = None
+    # the file is a hard link of an exported report, which someone may have changed in place
+    if st is None or st.st_size != entry.get("size") or st.st_mtime_ns != entry.get("mtime_ns"):
+        cache.delete(_key(purl, report_format))
+        return None
+    return entry
+
+
+def conditional_headers(
+    entry: Optional[Dict[str, Any]],
+) -> Dict[str, str]:
+    headers: Dict[str, str] = {}
+    if entry is None:
+        return headers
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def reuse_report(
+    entry: Dict[str, Any],
+    target: str,
+) -> bool:
+    # after a 304 Not Modified
+    return link_or_copy(entry["path"], target)
+
+
+def store_report(
+    cache_dir: str,
+    purl: str,
+    report_format: str,
+    path: str,
+    headers: Mapping[str, str],
+    sha256: str,
+) -> None:
+    # a report that cannot be validated with the Portal cannot be reused safely
+    etag = headers.get("ETag")
+    last_modified = headers.get("Last-Modified")
+    if not etag and not last_modified:
+        return
+
+    # stored by content, the same report of several purls or formats is kept once
+    directory = os.path.join(cache_dir, REPORT_CACHE_DIR)
+    os.makedirs(directory, exist_ok=True)
+    cached_path = os.path.abspath(os.path.join(directory, sha256))
+    if not os.path.isfile(cached_path) or os.path.getsize(cached_path) != os.path.getsize(path):
+        link_or_copy(path, cached_path)
+
+    st = os.stat(cached_path)
+    cache = _report_cache(cache_dir)
+    cache.put(
+        _key(purl, report_format),
+        {
+            "etag": etag,
+            "last_modified": last_modified,
+            "sha256": sha256,
+            "path": cached_path,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+        },
+    )
+    _prune(cache, directory)
+
+
+def _prune(
+    cache: JsonCache,
+    directory: str,
+) -> None:
+    # files of expired and evicted entries
+    used = {os.path.basename(str(entry.get("path"))) for entry in cache.values()}
+    now = time.time()
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if (
+                name not in used
+                and not name.startswith(".")
+                and now - os.stat(path).st_ctime > REPORT_CACHE_PRUNE_AGE_SEC
+            ):
+                os.unlink(path)
+        except OSError:
+            pass
@@ -0,0 +1,264 @@
+import csv
+import json
+import os
+from collections import Counter
+from functools import partial
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+)
+
+from cimessages import reporter
+from json_stream import iter_items
+
+from constants import (
+    JSON_STREAM_CHUNK_SIZE,
+    REPORT_FORMATS,
+    REPORT_SUMMARY_FILE,
+    SEVERITY_ORDER,
+)
+
+# the summary is taken from the first of these reports that was exported
+COMPONENT_SOURCES: List[str] = ["cyclonedx", "spdx", "rl-json"]
+VULNERABILITY_SOURCES: List[str] = ["cyclonedx", "rl-json", "rl-cve"]
+POLICY_SOURCES: List[str] = ["rl-json", "rl-checks"]
+
+FAILED_STATUSES: List[str] = ["fail", "failed", "violated", "violation"]
+
+
+def _chunks(
+    path: str,
+) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        yield from iter(partial(f.read, JSON_STREAM_CHUNK_SIZE), b"")
+
+
+def _severity(
+    value: Any,
+) -> str:
+    value = str(value or "").lower()
+    return value if value in SEVERITY_ORDER else "unknown"
+
+
+def _cvss_severity(
+    score: Any,
+) -> str:
+    try:
+        score = float(score)
+    except (TypeError, ValueError):
+        return "unknown"
+    # cvss v3 qualitative rating scale
+    for bound, severity in [(9.0, "critical"), (7.0, "high"), (4.0, "medium"), (0.1, "low")]:
+        if score >= bound:
+            return severity
+    return "none"
+
+
+def _highest(
+    severities: List[str],
+) -> str:
+    return min(severities, key=SEVERITY_ORDER.index, default="unknown")
+
+
+def _by_severity(
+    counts: Counter[str],
+) -> Dict[str, int]:
+    return {severity: counts[severity] for severity in SEVERITY_ORDER if counts[severity]}
+
+
+def _count_components(
+    component: Any,
+    types: Counter[str],
+) -> None:
+    # cyclonedx components can contain components (the files of an archive, the layers of an image)
+    if not isinstance(component, dict):
+        return
+    types[str(component.get("type", "unknown"))] += 1
+    for child in component.get("components") or []:
+        _count_components(child, types)
+
+
+def _summarize_cyclonedx(
+    path: str,
+) -> Dict[str, Any]:
+    types: Counter[str] = Counter()
+    severities: Counter[str] = Counter()
+    paths = {"component": "components.*", "vulnerability": "vulnerabilities.*"}
+    for name, item in iter_items(_chunks(path), paths):
+        if name == "component":
+            _count_components(item, types)
+        elif isinstance(item, dict):
+            ratings = [rating for rating in item.get("ratings") or [] if isinstance(rating, dict)]
+            severities[_highest([_severity(rating.get("severity")) for rating in ratings])] += 1
+
+    return {
+        "components": {"total": sum(types.values()), "by_type": dict(types.most_common())},
+        "vulnerabilities": {"total": sum(severities.values()), "by_severity": _by_severity(severities)},
+    }
+
+
+def _summarize_spdx(
+    path: str,
+) -> Dict[str, Any]:
+    total = sum(1 for _ in iter_items(_chunks(path), {"package": "packages.*"}))
+    return {
+        "components": {"total": total},
+    }
+
+
+def _summarize_sarif(
+    path: str,
+) -> Dict[str, Any]:
+    levels: Counter[str] = Counter()
+    for _, result in iter_items(_chunks(path), {"result": "runs.*.results.*"}):
+        # "warning" is the sarif default when a result has no level
+        levels[str(result.get("level", "warning")) if isinstance(result, dict) else "warning"] += 1
+    return {
+        "results": {"total": sum(levels.values()), "by_level": dict(levels.most_common())},
+    }
+
+
+def _summarize_violations(
+    path: str,
+    root: str,
+) -> Dict[str, Any]:
+    # rl-json and rl-checks share the metadata layout below their root
+    types: Counter[str] = Counter()
+    severities: Counter[str] = Counter()
+    failed: List[Dict[str, Any]] = []
+    paths = {
+        "component": f"{root}.metadata.components.*",
+        "vulnerability": f"{root}.metadata.vulnerabilities.*",
+        "violation": f"{root}.metadata.violations.*",
+    }
+    for name, item in iter_items(_chunks(path), paths):
+        if not isinstance(item, dict):
+            continue
+        if name == "component":
+            types[str(item.get("type", "unknown"))] += 1
+        elif name == "vulnerability":
+            severity = _severity(item.get("severity"))
+            if severity == "unknown" and isinstance(item.get("cvss"), dict):
+                severity = _cvss_severity(item["cvss"].get("baseScore"))
+            severities[severity] += 1
+        elif str(item.get("status", "violated")).lower() in FAILED_STATUSES:
+            failed.append(
+                {
+                    "id": item.get("rule_id", item.get("id")),
+                    "severity": _severity(item.get("severity")),
+                    "category": item.get("category"),
+                }
+            )
+
+    summary: Dict[str, Any] = {
+        "failed_policy_checks": {
+            "total": len(failed),
+            "by_severity": _by_severity(Counter(check["severity"] for check in failed)),
+            "checks": failed,
+        },
+    }
+    if types:
+        summary["components"] = {"total": sum(types.values()), "by_type": dict(types.most_common())}
+    if severities:
+        summary["vulnerabilities"] = {"total": sum(severities.values()), "by_severity": _by_severity(severities)}
+    return summary
+
+
+def _summarize_cve_csv(
+    path: str,
+) -> Dict[str, Any]:
+    severities: Counter[str] = Counter()
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = csv.DictReader(f)
+        column = next((name for name in rows.fieldnames or [] if "severity" in name.lower()), None)
+        for row in rows:
+            severities[_severity(row.get(column)) if column else "unknown"] += 1
+    return {
+        "vulnerabilities": {"total": sum(severities.values()), "by_severity": _by_severity(severities)},
+    }
+
+
+SUMMARIZERS: Dict[str, Callable[[str], Dict[str, Any]]] = {
+    "cyclonedx": _summarize_cyclonedx,
+    "spdx": _summarize_spdx,
+    "sarif": _summarize_sarif,
+    "rl-json": partial(_summarize_violations, root="report"),
+    "rl-checks": partial(_summarize_violations, root="analysis.report"),
+    "rl-cve": _summarize_cve_csv,
+}
+
+
+def _first(
+    reports: Dict[str, Dict[str, Any]],
+    sources: List[str],
+    key: str,
+) -> Optional[Dict[str, Any]]:
+    for report_format in sources:
+        if key in reports.get(report_format, {}):
+            return dict(reports[report_format][key], source=report_format)
+    return None
+
+
+def _headline(
+    summary: Dict[str, Any],
+) -> str:
+    parts: List[str] = []
+    if summary.get("components"):
+        parts.append(f"{summary['components']['total']} components")
+    if summary.get("vulnerabilities"):
+        vulnerabilities = summary["vulnerabilities"]
+        severities = ", ".join(f"{severity} {n}" for severity, n in vulnerabilities["by_severity"].items())
+        parts.append(f"{vulnerabilities['total']} vulnerabilities" + (f" ({severities})" if severities else ""))
+    if summary.get("failed_policy_checks"):
+        parts.append(f"{summary['failed_policy_checks']['total']} failed policy checks")
+    if summary.get("sarif_results"):
+        parts.append(f"{summary['sarif_results']['total']} sarif results")
+    return ", ".join(parts) or "no summarized reports"
+
+
+def summarize_reports(
+    report_path: str,
+    purl: Optional[str] = None,
+    scan_status: Optional[str] = None,
+    report_url: Optional[str] = None,
+    label: Optional[str] = None,
+) -> Dict[str, Any]:
+    # one pass over each exported report, items are counted as they are parsed so memory does not grow
+    # with the report size; a report that cannot be read is noted in the summary, the scan result stands
+    reports: Dict[str, Dict[str, Any]] = {}
+    for report_format, summarize in SUMMARIZERS.items():
+        path = os.path.join(report_path, REPORT_FORMATS[report_format])
+        if not os.path.isfile(path):
+            continue
+        try:
+            reports[report_format] = summarize(path)
+        except (OSError, ValueError, UnicodeDecodeError, csv.Error) as e:
+            reporter.error(f"{label + ': ' if label else ''}Failed to summarize the {report_format} report: {e}")
+            reports[report_format] = {"error": str(e)}
+
+    summary: Dict[str, Any] = {
+        "purl": purl,
+        "scan_status": scan_status,
+        "report_url": report_url,
+        "components": _first(reports, COMPONENT_SOURCES, "components"),
+        "vulnerabilities": _first(reports, VULNERABILITY_SOURCES, "vulnerabilities"),
+        "failed_policy_checks": _first(reports, POLICY_SOURCES, "failed_policy_checks"),
+        "sarif_results": _first(reports, ["sarif"], "results"),
+        "reports": reports,
+    }
+
+    tmp_path = os.path.join(report_path, f".{REPORT_SUMMARY_FILE}.{os.getpid()}.part")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    os.replace(tmp_path, os.path.join(report_path, REPORT_SUMMARY_FILE))
+
+    headline = _headline(summary)
+    if label:
+        reporter.info(f"{label}: {headline}")
+    else:
+        reporter.with_prefix("Summary", headline)
+    return summary
@@ -0,0 +1,65 @@
+import os
+from typing import (
+    Any,
+    Dict,
+    Optional,
+)
+
+from cache import JsonCache
+from portal_api import PortalAPI
+
+from constants import (
+    SCAN_CACHE_FILE,
+    SCAN_CACHE_TTL_SEC,
+    SCAN_CACHE_MAX_ENTRIES,
+)
+
+
+def _scan_cache(
+    cache_dir: str,
+) -> JsonCache:
+    return JsonCache(
+        os.path.join(cache_dir, SCAN_CACHE_FILE),
+        ttl_sec=SCAN_CACHE_TTL_SEC,
+        max_entries=SCAN_CACHE_MAX_ENTRIES,
+    )
+
+
+def lookup_scan(
+    scanner: PortalAPI,
+    cache_dir: str,
+    sha256: str,
+) -> Optional[Dict[str, Any]]:
+    # a hit needs the same content scanned as the same purl, and that version must still exist on the Portal;
+    # --replace asks for the upload even then
+    if scanner.params.replace:
+        return None
+
+    entry = _scan_cache(cache_dir).get(sha256)
+    if entry is None or entry.get("purl") != scanner.params.purl:
+        return None
+
+    if not scanner.version_exists():
+        _scan_cache(cache_dir).delete(sha256)
+        return None
+
+    return entry
+
+
+def store_scan(
+    cache_dir: str,
+    sha256: str,
+    *,
+    purl: str,
+    scan_status: str,
+    report_url: str,
+) -> None:
+    # the reports are not kept here, they are in the report cache by purl and format
+    _scan_cache(cache_dir).put(
+        sha256,
+        {
+            "purl": purl,
+            "scan_status": scan_status,
+            "report_url": report_url,
+        },
+    )
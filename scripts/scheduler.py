@@ -0,0 +1,310 @@
+import asyncio
+import bisect
+import itertools
+import math
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import (
+    dataclass,
+    field,
+)
+from enum import IntEnum
+from typing import (
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+)
+from urllib.parse import urlsplit
+
+from cimessages import reporter
+from polling import retry_after_sec
+
+from constants import (
+    SCHEDULER_RATE,
+    SCHEDULER_MIN_RATE,
+    SCHEDULER_RATE_STEP,
+    SCHEDULER_BACKOFF_SEC,
+    SCHEDULER_WAKEUP_SEC,
+)
+
+
+class Priority(IntEnum):
+    # the order in which requests waiting for the same endpoint are sent, lowest first
+    RESULT = 0  # checks of a finished analysis
+    POLL = 1
+    EXPORT = 2
+    LOOKUP = 3
+    UPLOAD = 4
+
+
+_ENDPOINT_PRIORITY: Dict[str, Priority] = {
+    "checks": Priority.RESULT,
+    "status": Priority.POLL,
+    "report": Priority.EXPORT,
+    "pack": Priority.EXPORT,
+    "list": Priority.LOOKUP,
+    "scan": Priority.UPLOAD,
+    "url-import": Priority.UPLOAD,
+}
+
+_API_PATH = re.compile(r"/api/public/v\d+/([^/]+)/")
+_RATE_LIMIT_FIELD = re.compile(r"\b(remaining|reset)=(\d+)")
+
+# within a priority, requests of the scan that has waited longest for its analysis go first
+_waiting_since: ContextVar[Optional[float]] = ContextVar("waiting_since", default=None)
+
+
+@contextmanager
+def waiting_since(
+    started: float,
+) -> Iterator[None]:
+    # a context variable: separate per thread and per asyncio task
+    token = _waiting_since.set(started)
+    try:
+        yield
+    finally:
+        _waiting_since.reset(token)
+
+
+def _endpoint(
+    url: str,
+) -> Optional[Tuple[str, str]]:
+    # (host, name) of a Portal api url; other urls, like presigned download links, are not scheduled
+    parts = urlsplit(url)
+    match = _API_PATH.search(parts.path)
+    if match is None:
+        return None
+    return parts.netloc, match.group(1)
+
+
+def _rate_limit_headers(
+    headers: Mapping[str, str],
+) -> Tuple[Optional[int], Optional[float]]:
+    # remaining requests and seconds until the window resets, from RateLimit-* or X-RateLimit-* headers
+    # or a combined RateLimit: limit=100, remaining=50, reset=5
+    values: Dict[str, str] = {}
+    for prefix in ["RateLimit-", "X-RateLimit-"]:
+        for name in ["remaining", "reset"]:
+            value = headers.get(f"{prefix}{name.capitalize()}")
+            if value is not None and name not in values:
+                values[name] = value.strip()
+    for name, value in _RATE_LIMIT_FIELD.findall(headers.get("RateLimit", "")):
+        values.setdefault(name, value)
+
+    try:
+        remaining = int(values["remaining"]) if "remaining" in values else None
+        reset = float(values["reset"]) if "reset" in values else None
+    except ValueError:
+        return None, None
+
+    if reset is not None and reset > 1e9:
+        reset = max(reset - time.time(), 0.0)  # an epoch timestamp
+    return remaining, reset
+
+
+# (priority, waiting since, ticket, endpoint key), ordered as they should be sent
+_Entry = Tuple[int, float, int, str]
+
+
+@dataclass
+class _Limit:
+    # token bucket with a learned rate, of one endpoint or of a whole tenant (host)
+    rate: float
+    burst: float
+    tokens: float
+    updated: float = field(default_factory=time.monotonic)
+    blocked_until: float = 0.0
+
+    def delay(
+        self,
+        now: float,
+    ) -> float:
+        # seconds until a request may use this limit
+        if self.blocked_until > now:
+            return self.blocked_until - now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class RequestScheduler:
+    # paces the Portal api requests of all scans in this process (batch and serve workers, async tasks):
+    # a token bucket per endpoint, which halves its rate and holds its requests on 429 and grows back on
+    # success, under one per tenant that follows the rate limit headers (the quota of the token).
+    # Waiting requests of a tenant go out by priority, so polls and results are not stuck behind uploads
+    def __init__(
+        self,
+        rate: float = SCHEDULER_RATE,
+    ) -> None:
+        self.max_rate: float = max(rate, SCHEDULER_MIN_RATE)
+        self.changed = threading.Condition()
+        self.limits: Dict[str, _Limit] = {}
+        self.waiting: Dict[str, List[_Entry]] = {}  # host -> sorted entries
+        self.tickets = itertools.count()
+
+    def _limit(
+        self,
+        key: str,
+    ) -> _Limit:
+        if key not in self.limits:
+            burst = max(self.max_rate, 1.0)
+            self.limits[key] = _Limit(rate=self.max_rate, burst=burst, tokens=burst)
+        return self.limits[key]
+
+    def _enqueue(
+        self,
+        host: str,
+        name: str,
+    ) -> _Entry:
+        since = _waiting_since.get()
+        entry = (
+            int(_ENDPOINT_PRIORITY.get(name, Priority.LOOKUP)),
+            since if since is not None else time.monotonic(),
+            next(self.tickets),
+            f"{host}/{name}",
+        )
+        with self.changed:
+            bisect.insort(self.waiting.setdefault(host, []), entry)
+        return entry
+
+    def _take(
+        self,
+        host: str,
+        entry: _Entry,
+    ) -> float:
+        # with the lock held: 0 when the request may go (its tokens are taken), otherwise the time to wait
+        now = time.monotonic()
+        tenant = self._limit(host)
+        delay = tenant.delay(now)
+        if delay > 0:
+            return delay
+
+        waiting = self.waiting[host]
+        for other in waiting:
+            if other == entry:
+                break
+            # a request ahead goes first, unless its own endpoint holds it back
+            if self._limit(other[3]).delay(now) <= 0:
+                return SCHEDULER_WAKEUP_SEC
+
+        endpoint = self._limit(entry[3])
+        delay = endpoint.delay(now)
+        if delay > 0:
+            return delay
+        tenant.tokens -= 1
+        endpoint.tokens -= 1
+        waiting.remove(entry)
+        return 0.0
+
+    def _discard(
+        self,
+        host: str,
+        entry: _Entry,
+    ) -> None:
+        # also after an interrupted wait, which must not block the requests behind it
+        with self.changed:
+            waiting = self.waiting[host]
+            if entry in waiting:
+                waiting.remove(entry)
+            self.changed.notify_all()
+
+    def schedules(
+        self,
+        url: str,
+    ) -> bool:
+        return _endpoint(url) is not None
+
+    def acquire(
+        self,
+        url: str,
+    ) -> None:
+        endpoint = _endpoint(url)
+        if endpoint is None:
+            return
+
+        host, name = endpoint
+        entry = self._enqueue(host, name)
+        try:
+            with self.changed:
+                while (delay := self._take(host, entry)) > 0:
+                    self.changed.wait(delay)
+        finally:
+            self._discard(host, entry)
+
+    async def acquire_async(
+        self,
+        url: str,
+    ) -> None:
+        endpoint = _endpoint(url)
+        if endpoint is None:
+            return
+
+        host, name = endpoint
+        entry = self._enqueue(host, name)
+        try:
+            while True:
+                with self.changed:
+                    delay = self._take(host, entry)
+                if delay <= 0:
+                    return
+                # tasks are not notified, a shorter hold learned meanwhile is seen within a second
+                await asyncio.sleep(min(delay, 1.0))
+        finally:
+            self._discard(host, entry)
+
+    def learn(
+        self,
+        url: str,
+        status: int,
+        headers: Mapping[str, str],
+    ) -> None:
+        endpoint = _endpoint(url)
+        if endpoint is None:
+            return
+
+        host, name = endpoint
+        remaining, reset = _rate_limit_headers(headers)
+        wait = next((w for w in [retry_after_sec(headers), reset] if w is not None), SCHEDULER_BACKOFF_SEC)
+        with self.changed:
+            now = time.monotonic()
+            limit = self._limit(f"{host}/{name}")
+            if status == 429:
+                limit.blocked_until = max(limit.blocked_until, now + wait)
+                limit.rate = max(limit.rate / 2, SCHEDULER_MIN_RATE)
+                limit.tokens = min(limit.tokens, 0.0)
+            else:
+                limit.rate = min(limit.rate + SCHEDULER_RATE_STEP, self.max_rate)
+
+            if remaining is not None and reset is not None:
+                tenant = self._limit(host)
+                if remaining <= 0:
+                    tenant.blocked_until = max(tenant.blocked_until, now + reset)
+                else:
+                    # spread what is left of the window over its rest
+                    tenant.rate = min(max(remaining / max(reset, 1.0), SCHEDULER_MIN_RATE), self.max_rate)
+                    tenant.blocked_until = 0.0
+            self.changed.notify_all()
+
+        if status == 429:
+            reporter.info(f"Rate limited by the Portal on {name}, holding its requests for {math.ceil(wait)}s")
+
+
+_scheduler: Optional[RequestScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RequestScheduler:
+    global _scheduler  # pylint: disable=global-statement
+
+    with _scheduler_lock:
+        if _scheduler is None:
+            rate = os.environ.get("RLSECURE_HTTP_RATE")
+            _scheduler = RequestScheduler(float(rate) if rate else SCHEDULER_RATE)
+        return _scheduler
@@ -0,0 +1,448 @@
+import hmac
+import json
+import os
+import queue
+import socket
+import socketserver
+import stat
+import threading
+import uuid
+from dataclasses import (
+    asdict,
+    dataclass,
+    field,
+    replace,
+)
+from datetime import (
+    datetime,
+    timezone,
+)
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+from batch import (
+    BatchResult,
+    scan_artifact,
+)
+from cimessages import reporter
+from params import Params
+from validators import validate_params
+
+from constants import (
+    SERVE_MAX_JOBS,
+    SERVE_QUEUE_SIZE,
+    SERVE_MAX_REQUEST_SIZE,
+)
+
+# fields of Params a job may set, the others (message_reporter, debug) belong to the service
+JOB_FIELDS: Dict[str, type] = {
+    "rl_portal_host": str,
+    "rl_portal_server": str,
+    "rl_portal_org": str,
+    "rl_portal_group": str,
+    "purl": str,
+    "timeout": int,
+    "replace": bool,
+    "force": bool,
+    "diff_with": str,
+    "submit_only": bool,
+    "report_path": str,
+    "report_format": str,
+    "pack_safe": bool,
+    "report_summary": bool,
+    "report_incremental": bool,
+    "cache_dir": str,
+    "file_path": str,
+    "filename": str,
+    "upload_buffer_size": int,
+    "upload_bandwidth_limit": float,
+    "upload_engine": str,
+    "resumable_upload": bool,
+    "digests": bool,
+    "import_url": str,
+    "auth_user": str,
+    "auth_pass": str,
+    "bearer_token": str,
+}
+
+# never echoed back in the job status
+SECRET_FIELDS: List[str] = [
+    "auth_user",
+    "auth_pass",
+    "bearer_token",
+]
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+@dataclass
+class Job:
+    id: str
+    params: Params
+    state: str = JOB_QUEUED
+    submitted_at: str = field(default_factory=_now)
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    result: Optional[BatchResult] = None
+
+    def to_dict(
+        self,
+    ) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "state": self.state,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "params": {
+                name: getattr(self.params, name)
+                for name in JOB_FIELDS
+                if name not in SECRET_FIELDS and getattr(self.params, name) not in [None, False]
+            },
+            "result": asdict(self.result) if self.result else None,
+        }
+
+
+def make_job_params(
+    base: Params,
+    body: Dict[str, Any],
+    job_id: str,
+) -> Params:
+    values: Dict[str, Any] = {}
+    for key, value in body.items():
+        name = key.replace("-", "_")
+        if name not in JOB_FIELDS:
+            raise RuntimeError(f"unknown field '{key}', we currently support: {list(JOB_FIELDS)}")
+
+        expected = JOB_FIELDS[name]
+        if value is not None and not isinstance(value, expected):
+            if not (expected is float and isinstance(value, int) and not isinstance(value, bool)):
+                raise RuntimeError(f"field '{key}' must be of type {expected.__name__}")
+        values[name] = value
+
+    for name in ["purl", "rl_portal_org", "rl_portal_group"]:
+        if not values.get(name, getattr(base, name)):
+            raise RuntimeError(f"missing mandatory field '{name}'")
+
+    if bool(values.get("file_path")) == bool(values.get("import_url")):
+        raise RuntimeError("a job needs either 'file_path' or 'import_url'")
+
+    if values.get("import_url") and (values.get("digests") or values.get("resumable_upload")):
+        raise RuntimeError("'digests' and 'resumable_upload' need a 'file_path'")
+
+    params = replace(base, **values)
+    if params.import_url:
+        params.cache_dir = None
+
+    if "report_path" not in values and base.report_path and params.report_format:
+        # like rl-scan-batch: each job gets its own empty sub directory below the service report path
+        params.report_path = os.path.join(base.report_path, job_id)
+        os.makedirs(params.report_path, exist_ok=True)
+
+    try:
+        validate_params(params)
+    except RuntimeError:
+        _remove_job_dir(base, params)
+        raise
+    return params
+
+
+def _remove_job_dir(
+    base: Params,
+    params: Params,
+) -> None:
+    # the per job report directory of a rejected job
+    report_path = params.report_path
+    if not base.report_path or not report_path or os.path.dirname(report_path) != base.report_path:
+        return
+    if os.path.isdir(report_path) and not os.listdir(report_path):
+        os.rmdir(report_path)
+
+
+class ScanService:
+    # a bounded job queue served by a pool of worker threads, all sharing the pooled Portal transport
+
+    def __init__(
+        self,
+        base: Params,
+        workers: int,
+    ) -> None:
+        self.base: Params = base
+        self.workers: int = workers
+        self.jobs: Dict[str, Job] = {}
+        self.lock = threading.Lock()
+        self.queue: "queue.Queue[Job]" = queue.Queue(maxsize=SERVE_QUEUE_SIZE)
+
+    def start(
+        self,
+    ) -> None:
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f"scan-worker-{i}", daemon=True).start()
+
+    def _work(
+        self,
+    ) -> None:
+        while True:
+            job = self.queue.get()
+            with self.lock:
+                job.state = JOB_RUNNING
+                job.started_at = _now()
+
+            reporter.info(f"Job {job.id}: started {job.params.purl}")
+            result = scan_artifact(job.params)
+            if result.error:
+                reporter.error(f"Job {job.id}: {result.purl}: {result.error}")
+            reporter.info(
+                f"Job {job.id}: {result.purl}: exit code {result.exit_code}, "
+                f"scan status {result.scan_status or 'NONE'}"
+            )
+
+            with self.lock:
+                job.result = result
+                job.state = JOB_DONE
+                job.finished_at = _now()
+            self.queue.task_done()
+
+    def _prune(
+        self,
+    ) -> None:
+        # keep at most SERVE_MAX_JOBS, forget the oldest finished jobs first
+        finished = [job_id for job_id, job in self.jobs.items() if job.state == JOB_DONE]
+        for job_id in finished[: max(0, len(self.jobs) - SERVE_MAX_JOBS)]:
+            del self.jobs[job_id]
+
+    def submit(
+        self,
+        body: Dict[str, Any],
+    ) -> Job:
+        job_id = uuid.uuid4().hex
+        job = Job(id=job_id, params=make_job_params(self.base, body, job_id))
+        with self.lock:
+            try:
+                self.queue.put_nowait(job)
+            except queue.Full as e:
+                _remove_job_dir(self.base, job.params)
+                raise OverflowError(f"the job queue is full ({SERVE_QUEUE_SIZE} jobs)") from e
+            self.jobs[job_id] = job
+            self._prune()
+        reporter.info(f"Job {job_id}: queued {job.params.purl}")
+        return job
+
+    def get(
+        self,
+        job_id: str,
+    ) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def all_jobs(
+        self,
+    ) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [job.to_dict() for job in self.jobs.values()]
+
+    def health(
+        self,
+    ) -> Dict[str, Any]:
+        with self.lock:
+            states = [job.state for job in self.jobs.values()]
+        return {
+            "status": "ok",
+            "workers": self.workers,
+            JOB_QUEUED: states.count(JOB_QUEUED),
+            JOB_RUNNING: states.count(JOB_RUNNING),
+            JOB_DONE: states.count(JOB_DONE),
+        }
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    # POST /jobs, GET /jobs, GET /jobs/<id>, GET /health; all bodies are json
+    protocol_version = "HTTP/1.1"
+    server_version = "rl-scan-serve"
+    service: ScanService
+    # the bearer token every request must carry, None on a unix socket without a token
+    token: Optional[str] = None
+
+    def log_message(
+        self,
+        format: str,  # pylint: disable=redefined-builtin
+        *args: Any,
+    ) -> None:
+        if self.service.base.debug:
+            reporter.info(f"{self.command} {self.path}: " + format % args)
+
+    def _send_json(
+        self,
+        status: int,
+        data: Any,
+    ) -> None:
+        body = json.dumps(data, indent=2).encode("utf-8")
+        self.send_response(status)
+        if status == 401:
+            self.send_header("WWW-Authenticate", "Bearer")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(
+        self,
+    ) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > SERVE_MAX_REQUEST_SIZE:
+            raise RuntimeError("request body too large")
+        data = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(data, dict):
+            raise RuntimeError("request body must be a json object")
+        return data
+
+    def _authorized(
+        self,
+    ) -> bool:
+        if self.token is None:
+            return True
+        scheme, _, token = (self.headers.get("Authorization") or "").partition(" ")
+        return scheme.lower() == "bearer" and hmac.compare_digest(token.strip().encode(), self.token.encode())
+
+    def _route(
+        self,
+    ) -> Tuple[str, Optional[str]]:
+        parts = [part for part in self.path.split("?")[0].split("/") if part]
+        if len(parts) == 1:
+            return parts[0], None
+        if len(parts) == 2:
+            return parts[0], parts[1]
+        return "", None
+
+    def do_GET(  # pylint: disable=invalid-name
+        self,
+    ) -> None:
+        if not self._authorized():
+            self._send_json(401, {"error": "missing or wrong bearer token"})
+            return
+
+        resource, job_id = self._route()
+        if resource == "health" and job_id is None:
+            self._send_json(200, self.service.health())
+        elif resource == "jobs" and job_id is None:
+            self._send_json(200, {"jobs": self.service.all_jobs()})
+        elif resource == "jobs" and job_id is not None:
+            job = self.service.get(job_id)
+            if job is None:
+                self._send_json(404, {"error": f"no such job {job_id}"})
+            else:
+                self._send_json(200, job)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(  # pylint: disable=invalid-name
+        self,
+    ) -> None:
+        if not self._authorized():
+            # the body is not read, the connection cannot be reused
+            self.close_connection = True
+            self._send_json(401, {"error": "missing or wrong bearer token"})
+            return
+
+        resource, job_id = self._route()
+        if resource != "jobs" or job_id is not None:
+            self._send_json(404, {"error": "not found"})
+            return
+
+        # a browser sends a cross-site form or text/plain POST without asking first, never application/json
+        if self.headers.get_content_type() != "application/json":
+            self.close_connection = True
+            self._send_json(415, {"error": "the request body must be application/json"})
+            return
+
+        try:
+            job = self.service.submit(self._read_json())
+        except OverflowError as e:
+            self._send_json(503, {"error": str(e)})
+            return
+        except (RuntimeError, ValueError, TypeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        self._send_json(202, self.service.get(job.id))
+
+
+def _remove_stale_socket(
+    path: str,
+) -> None:
+    # the socket a stopped service left behind; never another file, or the socket of a running service
+    if not stat.S_ISSOCK(os.lstat(path).st_mode):
+        raise RuntimeError(f"{path} exists and is not a unix socket")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(path)
+            return
+    raise RuntimeError(f"another service is already listening on {path}")
+
+
+class UnixHTTPServer(ThreadingHTTPServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(
+        self,
+    ) -> None:
+        path = str(self.server_address)
+        if os.path.exists(path):
+            _remove_stale_socket(path)
+        # created with mode 0600 right away, a chmod after the bind leaves a window with the umask of the process
+        umask = os.umask(0o177)
+        try:
+            # HTTPServer.server_bind expects a (host, port) address
+            socketserver.TCPServer.server_bind(self)
+        finally:
+            os.umask(umask)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+    def get_request(
+        self,
+    ) -> Tuple[socket.socket, Any]:
+        # unix sockets have no peer address, the handler expects a (host, port) pair
+        request, _ = super().get_request()
+        return request, ("local", 0)
+
+
+def create_server(
+    service: ScanService,
+    *,
+    listen: Optional[Tuple[str, int]] = None,
+    unix_socket: Optional[str] = None,
+    token: Optional[str] = None,
+) -> ThreadingHTTPServer:
+    if listen is not None and not token:
+        raise RuntimeError("a tcp listener needs a bearer token")
+    handler = type("Handler", (ServiceRequestHandler,), {"service": service, "token": token or None})
+    server: ThreadingHTTPServer
+    if unix_socket:
+        server = UnixHTTPServer(unix_socket, handler)  # type: ignore[arg-type]
+    else:
+        assert listen is not None
+        server = ThreadingHTTPServer(listen, handler)
+
+    # idle keep-alive connections must not hold up a shutdown
+    server.daemon_threads = True
+    server.block_on_close = False
+    return server
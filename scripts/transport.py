@@ -0,0 +1,313 @@
+import os
+import socket
+import ssl
+import threading
+import time
+from typing import (
+    Any,
+    BinaryIO,
+    Dict,
+    Optional,
+)
+
+import requests
+from requests import Response
+from requests.adapters import HTTPAdapter
+from urllib3 import (
+    HTTPConnectionPool,
+    HTTPSConnectionPool,
+    PoolManager,
+)
+from urllib3.connection import (
+    HTTPConnection,
+    HTTPSConnection,
+)
+from urllib3.util.retry import Retry
+
+from metrics import metrics
+from scheduler import (
+    RequestScheduler,
+    get_scheduler,
+)
+
+from constants import (
+    REQUEST_TIMEOUT,
+    HTTP_POOL_SIZE,
+    HTTP_RETRIES,
+    HTTP_BACKOFF_FACTOR,
+    HTTP_BACKOFF_MAX,
+    HTTP_BACKOFF_JITTER,
+    HTTP_RETRY_STATUS,
+    SCHEDULER_RETRIES,
+)
+
+
+def _env(
+    name: str,
+) -> Optional[str]:
+    value = os.environ.get(name, None)
+    if value is not None and len(value) == 0:
+        return None
+    return value
+
+
+def proxies_from_env() -> Dict[str, str]:
+    proxy_server = _env("RLSECURE_PROXY_SERVER")
+    proxy_port = _env("RLSECURE_PROXY_PORT")
+    proxy_user = _env("RLSECURE_PROXY_USER")
+    proxy_password = _env("RLSECURE_PROXY_PASSWORD")
+
+    if proxy_server is None:
+        return {}
+
+    return {
+        "http": f"http://{proxy_user}:{proxy_password}@{proxy_server}:{proxy_port}",
+        "https": f"http://{proxy_user}:{proxy_password}@{proxy_server}:{proxy_port}",
+    }
+
+
+def _int_from_env(
+    name: str,
+    default: int,
+) -> int:
+    value = _env(name)
+    return int(value) if value is not None else default
+
+
+def _float_from_env(
+    name: str,
+    default: float,
+) -> float:
+    value = _env(name)
+    return float(value) if value is not None else default
+
+
+def _replayable(
+    kwargs: Dict[str, Any],
+) -> bool:
+    # a streamed body (file or iterator) is used up by the first attempt
+    return isinstance(kwargs.get("data"), (type(None), bytes, str, dict))
+
+
+class FileRegion:
+    # a block of an open file as a chunk of a request body, sent without a copy into a bytes object:
+    # with os.sendfile on a plain socket (http, or a plain http proxy), otherwise (tls) from a mmap view
+    def __init__(
+        self,
+        file: BinaryIO,
+        view: memoryview,
+        offset: int,
+    ) -> None:
+        self.file = file
+        self.view = view
+        self.offset = offset
+
+    def __len__(
+        self,
+    ) -> int:
+        return len(self.view)
+
+    def send_to(
+        self,
+        sock: Any,
+    ) -> None:
+        if isinstance(sock, socket.socket) and not isinstance(sock, ssl.SSLSocket):
+            sock.sendfile(self.file, self.offset, len(self.view))
+        else:
+            sock.sendall(self.view)
+
+
+class _FileRegionMixin:
+    sock: Any
+
+    def send(
+        self,
+        data: Any,
+    ) -> None:
+        if isinstance(data, FileRegion):
+            data.send_to(self.sock)
+            return
+        super().send(data)  # type: ignore[misc]
+
+
+class _HTTPConnection(_FileRegionMixin, HTTPConnection):
+    pass
+
+
+class _HTTPSConnection(_FileRegionMixin, HTTPSConnection):
+    pass
+
+
+class _HTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _HTTPConnection
+
+
+class _HTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _HTTPSConnection
+
+
+class _Adapter(HTTPAdapter):
+    # the connections of all pools, also those through a proxy, can send a FileRegion
+    def _with_file_regions(
+        self,
+        manager: PoolManager,
+    ) -> PoolManager:
+        manager.pool_classes_by_scheme = {"http": _HTTPConnectionPool, "https": _HTTPSConnectionPool}
+        return manager
+
+    def init_poolmanager(
+        self,
+        *args: Any,
+        **kwargs: Any,
+    ) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self._with_file_regions(self.poolmanager)
+
+    def proxy_manager_for(
+        self,
+        proxy: str,
+        **proxy_kwargs: Any,
+    ) -> PoolManager:
+        return self._with_file_regions(super().proxy_manager_for(proxy, **proxy_kwargs))
+
+
+# one keep-alive session with a connection pool, shared by all Portal calls of the process;
+# only idempotent requests (GET, HEAD) are retried on 5xx and read errors,
+# uploads are never replayed after the body was sent.
+# Every request waits for the scheduler; 429 is left to it, requests rejected by the rate limit
+# are sent again once it allows, except streamed bodies: their 429 goes back to the caller
+class Transport:
+    def __init__(
+        self,
+        *,
+        proxies: Dict[str, str],
+        pool_size: int = HTTP_POOL_SIZE,
+        retries: int = HTTP_RETRIES,
+        backoff_factor: float = HTTP_BACKOFF_FACTOR,
+        scheduler: Optional[RequestScheduler] = None,
+    ) -> None:
+        self.proxies: Dict[str, str] = proxies
+        self.scheduler: RequestScheduler = scheduler or get_scheduler()
+        self.retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            other=0,
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            status_forcelist=[status for status in HTTP_RETRY_STATUS if status != 429],
+            backoff_factor=backoff_factor,
+            backoff_max=HTTP_BACKOFF_MAX,
+            backoff_jitter=HTTP_BACKOFF_JITTER,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        self.adapter = _Adapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=self.retry,
+        )
+
+        self.session = requests.Session()
+        self.session.proxies.update(proxies)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        **kwargs: Any,
+    ) -> Response:
+        kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+        throttled = 0
+        while True:
+            response = self._send(method, url, **kwargs)
+            self.scheduler.learn(url, response.status_code, response.headers)
+            if (
+                response.status_code != 429
+                or throttled >= SCHEDULER_RETRIES
+                or not _replayable(kwargs)
+                or not self.scheduler.schedules(url)
+            ):
+                return response
+            response.close()
+            throttled += 1
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        **kwargs: Any,
+    ) -> Response:
+        self.scheduler.acquire(url)
+        start = time.monotonic()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            metrics.record_http(None, time.monotonic() - start)
+            raise
+
+        # sizes from the headers: a streamed body is read after this returns
+        retries = getattr(response.raw, "retries", None)
+        metrics.record_http(
+            response.status_code,
+            time.monotonic() - start,
+            bytes_sent=int(response.request.headers.get("Content-Length") or 0),
+            bytes_received=int(response.headers.get("Content-Length") or 0),
+            retries=len(retries.history) if retries is not None else 0,
+        )
+        return response
+
+    def get(
+        self,
+        url: str,
+        **kwargs: Any,
+    ) -> Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(
+        self,
+        url: str,
+        **kwargs: Any,
+    ) -> Response:
+        return self.request("POST", url, **kwargs)
+
+    def connection_stats(
+        self,
+    ) -> Dict[str, int]:
+        # urllib3 counts per pool how many connections it opened and how many requests it sent
+        managers = [self.adapter.poolmanager] + list(self.adapter.proxy_manager.values())
+        connections = 0
+        requests_sent = 0
+        for manager in managers:
+            for key in list(manager.pools.keys()):
+                pool = manager.pools.get(key)
+                if pool is None:
+                    continue
+                connections += pool.num_connections
+                requests_sent += pool.num_requests
+
+        return {
+            "requests": requests_sent,
+            "connections": connections,
+            "reused": max(requests_sent - connections, 0),
+        }
+
+
+_transport: Optional[Transport] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> Transport:
+    global _transport  # pylint: disable=global-statement
+
+    with _transport_lock:
+        if _transport is None:
+            _transport = Transport(
+                proxies=proxies_from_env(),
+                pool_size=_int_from_env("RLSECURE_HTTP_POOL_SIZE", HTTP_POOL_SIZE),
+                retries=_int_from_env("RLSECURE_HTTP_RETRIES", HTTP_RETRIES),
+                backoff_factor=_float_from_env("RLSECURE_HTTP_BACKOFF", HTTP_BACKOFF_FACTOR),
+            )
+        return _transport
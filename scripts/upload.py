@@ -0,0 +1,381 @@
+import hashlib
+import json
+import mmap
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from typing import (
+    Any,
+    BinaryIO,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Union,
+)
+
+from requests import Response
+from requests.exceptions import (
+    ChunkedEncodingError,
+    ConnectionError,  # pylint: disable=redefined-builtin
+    Timeout,
+)
+
+from archive import (
+    ArchiveReader,
+    artifact_stat,
+    open_artifact,
+)
+from cimessages import reporter
+from digests import (
+    file_digests,
+    hexdigests,
+    new_hashers,
+)
+from params import Params
+from portal_api import PortalAPI
+from transport import FileRegion
+
+from constants import (
+    UPLOAD_BUFFER_SIZE,
+    UPLOAD_PROGRESS_INTERVAL_SEC,
+    UPLOAD_RETRIES,
+    UPLOAD_RETRY_BACKOFF_SEC,
+    UPLOAD_STATE_DIR,
+    SCHEDULER_RETRIES,
+    EXIT_FATAL,
+)
+
+
+class TokenBucket:
+    # classic token bucket, tokens are bytes; shared by all threads that upload in this process
+    def __init__(
+        self,
+        rate: float,
+        burst: Optional[float] = None,
+    ) -> None:
+        assert rate > 0
+        self.rate: float = rate
+        self.burst: float = burst if burst is not None else rate
+        self.tokens: float = self.burst
+        self.updated: float = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(
+        self,
+        amount: int,
+    ) -> None:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # go into debt and sleep it off, so chunks larger than the burst still pass
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+        if wait > 0:
+            time.sleep(wait)
+
+
+_bandwidth_limiter: Optional[TokenBucket] = None
+_bandwidth_limiter_lock = threading.Lock()
+
+
+def bandwidth_limiter(
+    mb_per_sec: float,
+) -> TokenBucket:
+    global _bandwidth_limiter  # pylint: disable=global-statement
+
+    with _bandwidth_limiter_lock:
+        if _bandwidth_limiter is None:
+            _bandwidth_limiter = TokenBucket(mb_per_sec * 1024 * 1024)
+        return _bandwidth_limiter
+
+
+def _format_duration(
+    seconds: float,
+) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600:d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+class UploadProgress:
+    def __init__(
+        self,
+        total: int,
+        interval: float = UPLOAD_PROGRESS_INTERVAL_SEC,
+        label: str = "Upload",
+    ) -> None:
+        self.total: int = total
+        self.interval: float = interval
+        self.label: str = label
+        self.sent: int = 0
+        self.started: float = time.monotonic()
+        self.reported: float = self.started
+
+    def message(
+        self,
+    ) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        rate = self.sent / elapsed
+        percent = 100 * self.sent / self.total if self.total else 100
+        eta = (self.total - self.sent) / rate if rate > 0 else 0
+
+        return (
+            f"{self.label}: {self.sent / 1024 / 1024:.1f} of {self.total / 1024 / 1024:.1f} MB ({percent:.0f}%), "
+            + f"{rate / 1024 / 1024:.2f} MB/s, ETA {_format_duration(eta)}"
+        )
+
+    def update(
+        self,
+        amount: int,
+    ) -> None:
+        self.sent += amount
+        now = time.monotonic()
+        if now - self.reported >= self.interval:
+            self.reported = now
+            reporter.progress(self.message())
+
+
+class UploadStream:
+    # iterable request body with a known length, requests sends it with a Content-Length header
+    def __init__(
+        self,
+        file_stream: Union[BinaryIO, ArchiveReader],
+        size: int,
+        *,
+        buffer_size: int = UPLOAD_BUFFER_SIZE,
+        limiter: Optional[TokenBucket] = None,
+        progress: Optional[UploadProgress] = None,
+        hashers: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.file_stream = file_stream
+        self.size = size
+        self.buffer_size = buffer_size
+        self.limiter = limiter
+        self.progress = progress
+        self.hashers = hashers or {}
+
+    def __len__(
+        self,
+    ) -> int:
+        return self.size
+
+    def __iter__(
+        self,
+    ) -> Iterator[bytes]:
+        while True:
+            chunk = self.file_stream.read(self.buffer_size)
+            if not chunk:
+                return
+
+            # tee: every block read for the request body also feeds the digests
+            for hasher in self.hashers.values():
+                hasher.update(chunk)
+            if self.limiter:
+                self.limiter.consume(len(chunk))
+            yield chunk
+            if self.progress:
+                self.progress.update(len(chunk))
+
+
+class MappedUploadStream(UploadStream):
+    # zero-copy body of a regular file: blocks are views of a read-only mmap, digests are computed on
+    # the views and the connection sends each block with os.sendfile or straight from the view
+    def __iter__(  # type: ignore[override]
+        self,
+    ) -> Iterator[FileRegion]:
+        file_stream = self.file_stream
+        assert not isinstance(file_stream, ArchiveReader)
+        fileno = file_stream.fileno()
+
+        mapped = mmap.mmap(fileno, self.size, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        try:
+            if hasattr(mapped, "madvise"):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            for offset in range(0, self.size, self.buffer_size):
+                # reading a mapped page past the end of a truncated file kills the process (SIGBUS)
+                if os.fstat(fileno).st_size < self.size:
+                    raise RuntimeError(f"{file_stream.name} changed while uploading")
+
+                block = view[offset : offset + self.buffer_size]
+                for hasher in self.hashers.values():
+                    hasher.update(block)
+                if self.limiter:
+                    self.limiter.consume(len(block))
+                yield FileRegion(file_stream, block, offset)
+                if self.progress:
+                    self.progress.update(len(block))
+                block.release()
+        finally:
+            try:
+                view.release()
+                mapped.close()
+            except BufferError:
+                pass  # a block still held by the connection, the mapping goes with the last reference
+
+
+def upload_stream(
+    file_stream: Union[BinaryIO, ArchiveReader],
+    size: int,
+    engine: Optional[str] = None,
+    **kwargs: Any,
+) -> UploadStream:
+    # the zero-copy engine needs a non empty regular file, a directory archive is always buffered
+    if engine == "zero-copy" and not isinstance(file_stream, ArchiveReader) and size > 0:
+        return MappedUploadStream(file_stream, size, **kwargs)
+    return UploadStream(file_stream, size, **kwargs)
+
+
+def _upload_state_path(
+    file_path: str,
+    cache_dir: Optional[str],
+) -> str:
+    # in the cache directory, which a rerun finds, otherwise in the temp directory; never in the
+    # directory of the artifact, that belongs to the user
+    directory = os.path.join(cache_dir or os.path.join(tempfile.gettempdir(), "rl-scanner-cloud"), UPLOAD_STATE_DIR)
+    key = hashlib.sha256(os.path.abspath(file_path).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(directory, f"{key}.json")
+
+
+def _read_upload_state(
+    state_path: str,
+) -> Optional[Dict[str, Any]]:
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return state if isinstance(state, dict) else None
+
+
+def _write_upload_state(
+    state_path: str,
+    state: Dict[str, Any],
+) -> None:
+    tmp_path = f"{state_path}.{os.getpid()}.part"
+    try:
+        os.makedirs(os.path.dirname(state_path), exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, state_path)
+    except OSError as e:
+        # a directory we cannot write only costs us the resume information
+        reporter.info(f"Could not write upload state {state_path}: {e}")
+
+
+def _send_file(
+    scanner: PortalAPI,
+    params: Params,
+    file_path: str,
+    file_name: str,
+    should_exit: bool,
+    hashers: Dict[str, Any],
+) -> Response:
+    buffer_size = (params.upload_buffer_size or UPLOAD_BUFFER_SIZE // 1024) * 1024
+    limiter = bandwidth_limiter(params.upload_bandwidth_limit) if params.upload_bandwidth_limit else None
+    # a directory is archived while it is sent
+    file_stream, size = open_artifact(file_path, buffer_size)
+    progress = UploadProgress(size, label=f"Upload {file_name}")
+
+    with file_stream:
+        response = scanner.scan_file_version(
+            file_stream=upload_stream(
+                file_stream,
+                size,
+                params.upload_engine,
+                buffer_size=buffer_size,
+                limiter=limiter,
+                progress=progress,
+                hashers=hashers,
+            ),
+            file_name=file_name,
+            should_exit=should_exit,
+        )
+
+    reporter.progress(progress.message())
+    return response
+
+
+def upload_file(
+    scanner: PortalAPI,
+    params: Params,
+    file_path: str,
+    file_name: str,
+    digest_algorithms: Optional[List[str]] = None,
+) -> Dict[str, str]:
+    # returns the digests of the uploaded content, computed while reading the file for the upload
+    if not params.resumable_upload:
+        # an upload rejected by the rate limit (429) was not taken, send it again once the scheduler allows
+        for throttled in range(SCHEDULER_RETRIES + 1):
+            hashers = new_hashers(digest_algorithms or [])
+            last_attempt = throttled == SCHEDULER_RETRIES
+            response = _send_file(scanner, params, file_path, file_name, should_exit=last_attempt, hashers=hashers)
+            if response.status_code != 429:
+                break
+        if not response.ok:
+            sys.exit(EXIT_FATAL)  # the error was already reported
+        return hexdigests(hashers)
+
+    # the Portal takes the artifact in one request, so resuming works per upload:
+    # transient failures are retried in process and an acknowledged upload is not sent again by a rerun
+    size, mtime_ns = artifact_stat(file_path)
+    state_path = _upload_state_path(file_path, params.cache_dir)
+    state: Dict[str, Any] = {
+        "purl": scanner.params.purl,
+        "size": size,
+        "mtime_ns": mtime_ns,
+        "acknowledged": False,
+    }
+
+    # --replace asks for the file to be sent again
+    previous = _read_upload_state(state_path)
+    if (
+        not scanner.params.replace
+        and previous
+        and previous.get("acknowledged")
+        and all(previous.get(k) == state[k] for k in ["purl", "size", "mtime_ns"])
+    ):
+        if scanner.version_exists():
+            reporter.info(f"{file_name} was already uploaded as {scanner.params.purl}, skip upload")
+            return file_digests(file_path, digest_algorithms) if digest_algorithms else {}
+
+    digests: Dict[str, str] = {}
+    attempts = 1 + UPLOAD_RETRIES
+    for attempt in range(1, attempts + 1):
+        _write_upload_state(state_path, state | {"attempt": attempt})
+
+        last_attempt = attempt == attempts
+        hashers = new_hashers(digest_algorithms or [])
+        try:
+            response = _send_file(scanner, params, file_path, file_name, should_exit=last_attempt, hashers=hashers)
+            if response.ok:
+                digests = hexdigests(hashers)
+                break
+            if response.status_code < 500 and response.status_code != 429:
+                sys.exit(EXIT_FATAL)  # not transient, the error was already reported
+            # a 429 was not taken, after a 5xx the whole body may have been
+            uncertain = response.status_code >= 500
+        except (ConnectionError, Timeout, ChunkedEncodingError) as e:
+            if last_attempt:
+                raise
+            reporter.error(f"Upload of {file_name} failed: {e}")
+            uncertain = True
+
+        # a version that the Portal created despite the error is not uploaded a second time;
+        # with --replace it existed before, sending it again is what was asked for
+        if uncertain and not scanner.params.replace and scanner.version_exists(fresh=True):
+            reporter.info(f"{file_name} was received as {scanner.params.purl} despite the error, skip retry")
+            digests = file_digests(file_path, digest_algorithms) if digest_algorithms else {}
+            break
+
+        delay = UPLOAD_RETRY_BACKOFF_SEC * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+        reporter.info(f"Retrying upload of {file_name} in {delay:.0f}s (attempt {attempt + 1} of {attempts})")
+        time.sleep(delay)
+
+    _write_upload_state(state_path, state | {"acknowledged": True, "acknowledged_at": time.time()})
+    return digests
@@ -0,0 +1,155 @@
+import hashlib
+import os
+from typing import (
+    Any,
+    Dict,
+    Optional,
+    Tuple,
+)
+
+import requests
+from requests import Response
+
+from cache import JsonCache
+from cimessages import reporter
+from params import Params
+from portal_api import PortalAPI
+
+from constants import (
+    URL_CACHE_FILE,
+    URL_CACHE_TTL_SEC,
+    URL_CACHE_MAX_ENTRIES,
+    URL_FINGERPRINT_TIMEOUT,
+)
+
+# response header -> fingerprint field
+_FINGERPRINT_HEADERS: Dict[str, str] = {
+    "ETag": "etag",
+    "Last-Modified": "last_modified",
+    "Content-Length": "content_length",
+}
+
+
+def _url_cache(
+    cache_dir: str,
+) -> JsonCache:
+    return JsonCache(
+        os.path.join(cache_dir, URL_CACHE_FILE),
+        ttl_sec=URL_CACHE_TTL_SEC,
+        max_entries=URL_CACHE_MAX_ENTRIES,
+    )
+
+
+def _key(
+    import_url: str,
+) -> str:
+    # the url can carry credentials (a presigned link), only its hash is stored
+    return hashlib.sha256(import_url.encode("utf-8")).hexdigest()
+
+
+def _request(
+    scanner: PortalAPI,
+    method: str,
+    params: Params,
+    headers: Dict[str, str],
+) -> Response:
+    # with the credentials the Portal uses to download the url
+    assert params.import_url is not None
+    if params.bearer_token:
+        headers = headers | {"Authorization": f"Bearer {params.bearer_token}"}
+    auth = (params.auth_user, params.auth_pass or "") if params.auth_user else None
+    return scanner.transport.request(
+        method,
+        params.import_url,
+        headers=headers,
+        auth=auth,
+        allow_redirects=True,
+        stream=True,
+        timeout=URL_FINGERPRINT_TIMEOUT,
+    )
+
+
+def url_fingerprint(
+    scanner: PortalAPI,
+    params: Params,
+    previous: Optional[Dict[str, str]] = None,
+) -> Optional[Dict[str, str]]:
+    # ETag, Last-Modified and Content-Length of the url from a HEAD, or from a conditional GET that is
+    # closed after the headers when HEAD is not allowed (e.g. presigned links signed for GET only)
+    try:
+        with _request(scanner, "HEAD", params, {}) as response:
+            if not response.ok:
+                conditional: Dict[str, str] = {}
+                if previous and previous.get("etag"):
+                    conditional["If-None-Match"] = previous["etag"]
+                if previous and previous.get("last_modified"):
+                    conditional["If-Modified-Since"] = previous["last_modified"]
+                with _request(scanner, "GET", params, conditional) as response:
+                    if response.status_code == 304 and previous:
+                        return previous
+                    if not response.ok:
+                        reporter.info(f"No fingerprint of the import url: {response.status_code}")
+                        return None
+                    headers = response.headers
+            else:
+                headers = response.headers
+    except requests.RequestException as e:
+        reporter.info(f"No fingerprint of the import url: {e}")
+        return None
+
+    fingerprint = {field: headers[name] for name, field in _FINGERPRINT_HEADERS.items() if headers.get(name)}
+    # the size alone does not tell a changed file from an unchanged one
+    if "etag" not in fingerprint and "last_modified" not in fingerprint:
+        return None
+    return fingerprint
+
+
+def lookup_url(
+    scanner: PortalAPI,
+    cache_dir: str,
+) -> Tuple[Optional[Dict[str, str]], Optional[Dict[str, Any]]]:
+    # the current fingerprint and, when the url is unchanged since it was scanned as this purl and that
+    # version still exists on the Portal, the cached scan
+    params = scanner.params
+    assert params.import_url is not None
+    cache = _url_cache(cache_dir)
+    entry = cache.get(_key(params.import_url))
+    previous = entry.get("fingerprint") if entry else None
+
+    # the fingerprint is stored after a --replace run too, the url is imported again all the same
+    fingerprint = url_fingerprint(scanner, params, previous)
+    if (
+        params.replace
+        or entry is None
+        or fingerprint is None
+        or entry.get("purl") != params.purl
+        or fingerprint != previous
+    ):
+        return fingerprint, None
+
+    if not scanner.version_exists():
+        cache.delete(_key(params.import_url))
+        return fingerprint, None
+
+    return fingerprint, entry
+
+
+def store_url(
+    cache_dir: str,
+    import_url: str,
+    fingerprint: Dict[str, str],
+    *,
+    purl: str,
+    scan_status: Optional[str] = None,
+    report_url: Optional[str] = None,
+) -> None:
+    # without scan status and report url after --submit-only
+    _url_cache(cache_dir).put(
+        _key(import_url),
+        {
+            "purl": purl,
+            "fingerprint": fingerprint,
+            "scan_status": scan_status,
+            "report_url": report_url,
+        },
+    )
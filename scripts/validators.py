@@ -7,10 +7,16 @@ from urllib.parse import (
     urlsplit,
     parse_qs,
 )
-from helpers import parse_report_formats
+from helpers import (
+    is_download_leftover,
+    parse_report_formats,
+)
 from params import Params
 
-from constants import UPLOAD_FILE_SIZE_LIMIT
+from constants import (
+    UPLOAD_ENGINES,
+    UPLOAD_FILE_SIZE_LIMIT,
+)
 
 
 def _validate_file(
@@ -19,6 +25,13 @@ def _validate_file(
     if not os.path.exists(file_path):
         raise RuntimeError("File does not exist")
 
+    if os.path.isdir(file_path):
+        from archive import DirectoryArchive  # pylint: disable=import-outside-toplevel
+
+        # the layout of the archive is planned up front, it fails as soon as it grows over the limit
+        DirectoryArchive(file_path)
+        return
+
     if os.path.getsize(file_path) > UPLOAD_FILE_SIZE_LIMIT:
         raise RuntimeError("File size is larger than 50GB")
 
@@ -26,6 +39,7 @@ def _validate_file(
 def validate_report_folder(
     report_path: Optional[str],
     report_format: Optional[str],
+    incremental: bool = False,
 ) -> None:
     if not report_path and not report_format:
         return
@@ -35,10 +49,19 @@ def validate_report_folder(
 
     assert report_path is not None
 
+    if incremental:
+        # reports already in the directory are kept or refreshed
+        if not os.path.isdir(report_path):
+            raise RuntimeError("--report-path needs to point to a directory!")
+        return
+
     if (
         not os.path.exists(report_path)
         or os.path.exists(report_path)
-        and not (os.path.isdir(report_path) and not os.listdir(report_path))
+        and not (
+            os.path.isdir(report_path)
+            and not [name for name in os.listdir(report_path) if not is_download_leftover(name)]
+        )
     ):
         raise RuntimeError("--report-path needs to point to an empty directory!")
 
@@ -53,6 +76,14 @@ def validate_report_formats(
     return parse_report_formats(report_format)  # may raise a error
 
 
+def validate_report_summary(
+    report_summary: bool,
+    report_format: Optional[str],
+) -> None:
+    if report_summary and not report_format:
+        raise RuntimeError("--report-summary needs the reports, use it together with --report-path and --report-format")
+
+
 # Public
 
 
@@ -65,8 +96,35 @@ def validate_purl(
         raise RuntimeError("Wrong build type set, has to be either version or repro")
 
 
-def validate_params(params: Params) -> None:
+def _pending_download(
+    report_path: str,
+) -> bool:
+    return os.path.isdir(report_path) and any(is_download_leftover(name) for name in os.listdir(report_path))
+
+
+def resume_report_export(
+    params: Params,
+) -> None:
+    # a rerun after an interrupted rl-safe download: the reports exported before it are kept and the
+    # download continues, instead of rejecting the report path as not empty
+    if params.report_path and params.report_format and _pending_download(params.report_path):
+        params.report_incremental = True
+
+
+def validate_params(
+    params: Params,
+    resumed: bool = False,
+) -> None:
     if params.file_path:
         _validate_file(params.file_path)
-    validate_report_folder(params.report_path, params.report_format)
+    if params.upload_buffer_size is not None and params.upload_buffer_size <= 0:
+        raise RuntimeError("--upload-buffer-size must be a positive number of KiB")
+    if params.upload_bandwidth_limit is not None and params.upload_bandwidth_limit <= 0:
+        raise RuntimeError("--upload-bandwidth-limit must be a positive number of MB/s")
+    if params.upload_engine is not None and params.upload_engine not in UPLOAD_ENGINES:
+        raise RuntimeError(f"--upload-engine must be one of {', '.join(UPLOAD_ENGINES)}")
+    resume_report_export(params)
+    # a resumed job fills the report path again that the interrupted run had started to fill
+    validate_report_folder(params.report_path, params.report_format, params.report_incremental or resumed)
     validate_report_formats(params.report_format)
+    validate_report_summary(params.report_summary, params.report_format)
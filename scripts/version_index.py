@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+from dataclasses import (
+    dataclass,
+    field,
+)
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Optional,
+    Tuple,
+)
+
+from cache import JsonCache
+
+from constants import (
+    VERSION_INDEX_FILE,
+    VERSION_INDEX_TTL_SEC,
+    VERSION_INDEX_MAX_ENTRIES,
+)
+
+
+@dataclass
+class VersionIndex:
+    # all versions of one package keyed by version; found is False when the package does not exist (yet)
+    package: str
+    found: bool = True
+    versions: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+    def add(
+        self,
+        entry: Dict[str, Any],
+    ) -> None:
+        version = entry.get("version")
+        if version is None:
+            return
+        self.versions[str(version)] = {
+            "repro": bool(entry.get("repro") or entry.get("build") == "repro"),
+        }
+
+    def has(
+        self,
+        version: str,
+    ) -> bool:
+        return version in self.versions
+
+    def is_repro(
+        self,
+        version: str,
+    ) -> bool:
+        return bool(self.versions.get(version, {}).get("repro"))
+
+    def to_dict(
+        self,
+    ) -> Dict[str, Any]:
+        return {
+            "package": self.package,
+            "found": self.found,
+            "versions": self.versions,
+        }
+
+    @classmethod
+    def from_dict(
+        cls,
+        data: Dict[str, Any],
+    ) -> "VersionIndex":
+        return cls(
+            package=str(data.get("package")),
+            found=bool(data.get("found")),
+            versions=dict(data.get("versions", {})),
+        )
+
+
+# shared by all scans of this process: key -> (fetched at, index)
+_indexes: Dict[str, Tuple[float, VersionIndex]] = {}
+_fetch_locks: Dict[str, threading.Lock] = {}
+_guard = threading.Lock()
+
+
+def _fetch_lock(
+    key: str,
+) -> threading.Lock:
+    with _guard:
+        return _fetch_locks.setdefault(key, threading.Lock())
+
+
+def _disk_cache(
+    cache_dir: str,
+) -> JsonCache:
+    return JsonCache(
+        os.path.join(cache_dir, VERSION_INDEX_FILE),
+        ttl_sec=VERSION_INDEX_TTL_SEC,
+        max_entries=VERSION_INDEX_MAX_ENTRIES,
+    )
+
+
+def cached_version_index(
+    key: str,
+    fetch: Callable[[], VersionIndex],
+    cache_dir: Optional[str] = None,
+) -> VersionIndex:
+    # one fetch per package and ttl: concurrent scans of the same package wait for the first one
+    with _fetch_lock(key):
+        with _guard:
+            hit = _indexes.get(key)
+        if hit is not None and time.time() - hit[0] < VERSION_INDEX_TTL_SEC:
+            return hit[1]
+
+        entry = _disk_cache(cache_dir).get(key) if cache_dir else None
+        if entry is not None:
+            fetched_at = float(entry.get("fetched_at", 0))
+            index = VersionIndex.from_dict(entry)
+        else:
+            fetched_at = time.time()
+            index = fetch()
+            if cache_dir:
+                _disk_cache(cache_dir).put(key, {"fetched_at": fetched_at} | index.to_dict())
+
+        with _guard:
+            _indexes[key] = (fetched_at, index)
+        return index
+
+
+def invalidate_version_index(
+    key: str,
+    cache_dir: Optional[str] = None,
+) -> None:
+    # after our own scan added (or replaced, or forced out) a version
+    with _guard:
+        _indexes.pop(key, None)
+    if cache_dir:
+        _disk_cache(cache_dir).delete(key)
@@ -0,0 +1,219 @@
+import asyncio
+import heapq
+import json
+import os
+import time
+from dataclasses import replace
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+import aiohttp
+
+from async_portal_api import (
+    AsyncPortalAPI,
+    create_session,
+    export_version,
+)
+from batch import (
+    BatchResult,
+    _safe_dir_name,
+)
+from cimessages import reporter
+from params import Params
+from polling import PollSchedule
+from validators import (
+    validate_purl,
+    validate_report_folder,
+)
+
+from constants import (
+    EXIT_FATAL,
+)
+
+
+def read_purls(
+    purls: List[str],
+    purls_file: Optional[str] = None,
+    batch_results: Optional[str] = None,
+) -> List[Dict[str, str]]:
+    # (purl, file_path) entries in the order they were submitted, each purl once
+    entries: List[Dict[str, str]] = [
+        {"purl": purl.strip(), "file_path": ""} for value in purls for purl in value.split(",") if purl.strip()
+    ]
+
+    if purls_file:
+        if not os.path.isfile(purls_file):
+            raise RuntimeError("Purls file does not exist")
+        with open(purls_file, "r", encoding="utf-8") as f:
+            for line in f:
+                purl = line.split("#", 1)[0].strip()
+                if purl:
+                    entries.append({"purl": purl, "file_path": ""})
+
+    if batch_results:
+        # the --results-file of rl-scan-batch --submit-only; artifacts that failed to upload are left out
+        if not os.path.isfile(batch_results):
+            raise RuntimeError("Batch results file does not exist")
+        with open(batch_results, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        artifacts = data.get("artifacts") if isinstance(data, dict) else None
+        if not isinstance(artifacts, list):
+            raise RuntimeError("Batch results json must have an 'artifacts' list")
+        for artifact in artifacts:
+            if isinstance(artifact, dict) and artifact.get("purl") and not artifact.get("error"):
+                entries.append({"purl": str(artifact["purl"]), "file_path": str(artifact.get("file_path") or "")})
+
+    unique: Dict[str, Dict[str, str]] = {}
+    for entry in entries:
+        unique.setdefault(entry["purl"], entry)
+    if not unique:
+        raise RuntimeError("No purls to wait for")
+    return list(unique.values())
+
+
+def make_wait_params(
+    base: Params,
+    entry: Dict[str, str],
+) -> Params:
+    validate_purl(entry["purl"])
+
+    report_path = base.report_path
+    if base.report_path and base.report_format:
+        # each version gets its own empty sub directory below the report path, as in rl-scan-batch
+        report_path = os.path.join(base.report_path, _safe_dir_name(entry["purl"]))
+        os.makedirs(report_path, exist_ok=True)
+        validate_report_folder(report_path, base.report_format)
+
+    return replace(
+        base,
+        purl=entry["purl"],
+        file_path=entry["file_path"] or None,
+        report_path=report_path,
+    )
+
+
+def make_wait_batch(
+    base: Params,
+    entries: List[Dict[str, str]],
+) -> Tuple[List[Params], List[BatchResult]]:
+    # an invalid version (bad purl, report path not empty) fails on its own, as in rl-scan-batch
+    artifacts: List[Params] = []
+    invalid: List[BatchResult] = []
+    for entry in entries:
+        try:
+            artifacts.append(make_wait_params(base, entry))
+        except (RuntimeError, OSError) as e:
+            result = BatchResult(
+                purl=entry["purl"],
+                file_path=entry["file_path"],
+                exit_code=EXIT_FATAL,
+                error=str(e),
+            )
+            invalid.append(result)
+            reporter.error(f"{result.purl}: {result.error}")
+    return artifacts, invalid
+
+
+async def _collect(
+    portal: AsyncPortalAPI,
+    params: Params,
+    schedule: PollSchedule,
+    status: Dict[str, Any],
+    result: BatchResult,
+) -> None:
+    # verdict, report url and exports of a finished analysis, right when it is seen
+    result.scan_status = await portal.get_scan_status(schedule)
+    result.report_url = await portal.get_report_url(status)
+    await export_version(portal, params)
+
+    if params.report_summary and params.report_path:
+        # pylint: disable=import-outside-toplevel
+        from report_summary import summarize_reports
+
+        await asyncio.to_thread(
+            summarize_reports,
+            params.report_path,
+            purl=result.purl,
+            scan_status=result.scan_status,
+            report_url=result.report_url,
+            label=result.purl,
+        )
+
+    result.exit_code = 0 if result.scan_status == "pass" else 1
+
+
+def _report(
+    result: BatchResult,
+) -> None:
+    if result.error:
+        reporter.error(f"{result.purl}: {result.error}")
+    reporter.info(
+        f"{result.purl}: exit code {result.exit_code}, scan status {result.scan_status or 'NONE'}"
+        + (f", report {result.report_url}" if result.report_url else "")
+    )
+
+
+async def wait_versions(
+    artifacts: List[Params],
+    concurrency: int,
+) -> List[BatchResult]:
+    # one loop polls all versions: a heap of (next poll, submit order) tells which are due, the due ones
+    # are probed oldest first, a finished one is exported at once while the others keep being polled
+    results = [BatchResult(purl=p.purl, file_path=p.file_path or "", exit_code=EXIT_FATAL) for p in artifacts]
+    schedules = [PollSchedule(params.timeout * 60) for params in artifacts]
+    semaphore = asyncio.Semaphore(concurrency)
+    due: List[Tuple[float, int]] = [(time.monotonic(), i) for i in range(len(artifacts))]
+    running: Set["asyncio.Task[None]"] = set()
+
+    async with create_session(limit=concurrency) as session:
+        portals = [AsyncPortalAPI(params, session) for params in artifacts]
+
+        async def poll(i: int) -> None:
+            result, schedule = results[i], schedules[i]
+            try:
+                async with semaphore:
+                    status, retry_after = await portals[i].probe(schedule)
+                    if status is not None:
+                        await _collect(portals[i], artifacts[i], schedule, status, result)
+                if status is None:
+                    if schedule.expired():
+                        result.error = "Preset timeout time expired"
+                    else:
+                        heapq.heappush(due, (time.monotonic() + schedule.next_delay(retry_after), i))
+                        return
+            except (RuntimeError, aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError, KeyError) as e:
+                # this version fails, the others keep being polled and the results file is still written
+                result.error = str(e) or type(e).__name__
+            _report(result)
+
+        while due or running:
+            now = time.monotonic()
+            ready: List[int] = []
+            while due and due[0][0] <= now:
+                ready.append(heapq.heappop(due)[1])
+            # submit order: the version that has waited longest gets the next free slot
+            for i in sorted(ready):
+                running.add(asyncio.create_task(poll(i)))
+
+            timeout = max(due[0][0] - now, 0.0) if due else None
+            if not running:
+                await asyncio.sleep(timeout or 0.0)
+                continue
+            finished, running = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                task.result()
+
+    return results
+
+
+def run_wait(
+    artifacts: List[Params],
+    workers: int,
+) -> List[BatchResult]:
+    return asyncio.run(wait_versions(artifacts, workers))